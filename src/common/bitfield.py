@@ -0,0 +1,166 @@
+import base64
+from typing import Iterable, Iterator
+
+
+class Bitfield:
+    """
+    Conjunto de blocos representado como um mapa de bits sobre um inteiro Python.
+
+    O bit i indica a posse do bloco i. União, interseção, diferença e contagem
+    (popcount) são operações sobre inteiros, feitas em C, o que é bem mais
+    compacto e rápido que um set[int] para arquivos com muitos blocos.
+    Também se comporta como um conjunto (in, len, iteração, -, |, &), então pode
+    ser usado onde o código esperava um set de ids de bloco.
+
+    Formato de fio: base64 dos bytes em little-endian; o bloco i fica no byte
+    i // 8, bit i % 8. O tamanho (número de blocos) é combinado fora do campo.
+    """
+    __slots__ = ("tamanho", "_bits")
+
+    def __init__(self, tamanho: int, blocos: Iterable[int] = ()):
+        self.tamanho = tamanho
+        bits = 0
+        for bloco in blocos:
+            if 0 <= bloco < tamanho:
+                bits |= 1 << bloco
+        self._bits = bits
+
+    @classmethod
+    def _de_inteiro(cls, tamanho: int, bits: int) -> "Bitfield":
+        novo = cls.__new__(cls)
+        novo.tamanho = tamanho
+        novo._bits = bits & ((1 << tamanho) - 1)
+        return novo
+
+    @classmethod
+    def cheio(cls, tamanho: int) -> "Bitfield":
+        """Bitfield com todos os blocos de 0 a tamanho - 1."""
+        return cls._de_inteiro(tamanho, (1 << tamanho) - 1)
+
+    @classmethod
+    def de(cls, blocos, tamanho: int) -> "Bitfield":
+        """Converte um Bitfield, set ou lista de ids para Bitfield (sem copiar se já for um)."""
+        if isinstance(blocos, Bitfield):
+            return blocos
+        return cls(tamanho, blocos)
+
+    # --- serializacao ---
+
+    def to_bytes(self) -> bytes:
+        return self._bits.to_bytes((self.tamanho + 7) // 8, "little")
+
+    @classmethod
+    def from_bytes(cls, dados: bytes, tamanho: int) -> "Bitfield":
+        return cls._de_inteiro(tamanho, int.from_bytes(dados, "little"))
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_base64(cls, texto: str, tamanho: int) -> "Bitfield":
+        """Levanta binascii.Error (um ValueError) se o texto não for base64 válido."""
+        return cls._de_inteiro(tamanho, int.from_bytes(base64.b64decode(texto, validate=True), "little"))
+
+    @classmethod
+    def contar_por_bloco(cls, bitfields: Iterable["Bitfield"], tamanho: int) -> list[int]:
+        """
+        Quantos dos bitfields têm cada bloco, somando todos de uma vez.
+        Usa um contador "vertical": o bit j da contagem do bloco b fica no bit b de
+        planos[j], e cada bitfield entra como uma soma com vai-um sobre inteiros, sem
+        percorrer os blocos de cada um.
+        """
+        planos: list[int] = []
+        for bitfield in bitfields:
+            vai_um = bitfield._bits
+            j = 0
+            while vai_um:
+                if j == len(planos):
+                    planos.append(vai_um)
+                    break
+                planos[j], vai_um = planos[j] ^ vai_um, planos[j] & vai_um
+                j += 1
+        contagem = [0] * tamanho
+        for j, plano in enumerate(planos):
+            peso = 1 << j
+            for bloco in cls._de_inteiro(tamanho, plano):
+                contagem[bloco] += peso
+        return contagem
+
+    # --- operacoes de conjunto ---
+
+    def _outro_bits(self, outro) -> int:
+        if isinstance(outro, Bitfield):
+            return outro._bits
+        return Bitfield(self.tamanho, outro)._bits
+
+    def __contains__(self, bloco) -> bool:
+        return isinstance(bloco, int) and 0 <= bloco < self.tamanho and (self._bits >> bloco) & 1 == 1
+
+    def __len__(self) -> int:
+        return self._bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return self._bits != 0
+
+    def __iter__(self) -> Iterator[int]:
+        # bin() e str.find rodam em C: bem mais rapido que testar bit a bit em Python
+        texto = bin(self._bits)[:1:-1]
+        posicao = texto.find("1")
+        while posicao != -1:
+            yield posicao
+            posicao = texto.find("1", posicao + 1)
+
+    def __or__(self, outro) -> "Bitfield":
+        return Bitfield._de_inteiro(self.tamanho, self._bits | self._outro_bits(outro))
+
+    def __and__(self, outro) -> "Bitfield":
+        return Bitfield._de_inteiro(self.tamanho, self._bits & self._outro_bits(outro))
+
+    def __sub__(self, outro) -> "Bitfield":
+        """Diferença (and-not): blocos deste bitfield que o outro não possui."""
+        return Bitfield._de_inteiro(self.tamanho, self._bits & ~self._outro_bits(outro))
+
+    def __rsub__(self, outro) -> "Bitfield":
+        return Bitfield._de_inteiro(self.tamanho, self._outro_bits(outro) & ~self._bits)
+
+    def __xor__(self, outro) -> "Bitfield":
+        return Bitfield._de_inteiro(self.tamanho, self._bits ^ self._outro_bits(outro))
+
+    def __ior__(self, outro) -> "Bitfield":
+        self._bits = (self._bits | self._outro_bits(outro)) & ((1 << self.tamanho) - 1)
+        return self
+
+    def __eq__(self, outro) -> bool:
+        if isinstance(outro, Bitfield):
+            return self._bits == outro._bits
+        if isinstance(outro, (set, frozenset)):
+            return set(self) == outro
+        return NotImplemented
+
+    def add(self, bloco: int):
+        if 0 <= bloco < self.tamanho:
+            self._bits |= 1 << bloco
+
+    def discard(self, bloco: int):
+        if 0 <= bloco < self.tamanho:
+            self._bits &= ~(1 << bloco)
+
+    def contar_em_comum(self, outro) -> int:
+        """popcount(self & outro), sem criar um Bitfield intermediário."""
+        return (self._bits & self._outro_bits(outro)).bit_count()
+
+    def contar_faltantes_em(self, outro) -> int:
+        """popcount(outro & ~self): quantos blocos do outro este bitfield não tem."""
+        return (self._outro_bits(outro) & ~self._bits).bit_count()
+
+    def issubset(self, outro) -> bool:
+        return self._bits & ~self._outro_bits(outro) == 0
+
+    def completo(self) -> bool:
+        return self._bits == (1 << self.tamanho) - 1
+
+    def copy(self) -> "Bitfield":
+        return Bitfield._de_inteiro(self.tamanho, self._bits)
+
+    def __repr__(self):
+        return f"Bitfield({len(self)}/{self.tamanho})"
@@ -0,0 +1,107 @@
+import hashlib
+import json
+from typing import Callable, Iterable
+
+
+class Manifesto:
+    """
+    Metainformação do arquivo compartilhado: tamanho do arquivo, tamanho do bloco
+    e o SHA-256 de cada bloco.
+
+    É publicado pelo tracker (rota /manifesto) ou distribuído como arquivo JSON,
+    e permite ao peer conferir cada bloco recebido antes de gravá-lo.
+    """
+    ALGORITMO = "sha256"
+
+    def __init__(self, tamanho_arquivo: int, tamanho_bloco: int, hashes: list[bytes]):
+        self.tamanho_arquivo = tamanho_arquivo
+        self.tamanho_bloco = tamanho_bloco
+        self.hashes = hashes
+
+    @property
+    def total_blocos(self) -> int:
+        return len(self.hashes)
+
+    def identificador(self) -> str:
+        """Resumo do manifesto inteiro: identifica o arquivo (ex.: no estado de retomada)."""
+        return hashlib.sha256(b"".join(self.hashes)).hexdigest()
+
+    def tamanho_do_bloco(self, block_id: int) -> int:
+        """Tamanho do bloco em bytes (o último bloco pode ser menor)."""
+        return max(0, min(self.tamanho_bloco, self.tamanho_arquivo - block_id * self.tamanho_bloco))
+
+    def verificar_bloco(self, block_id: int, dados) -> bool:
+        """True se 'dados' (bytes ou memoryview) tem o hash esperado para o bloco."""
+        if not 0 <= block_id < self.total_blocos or len(dados) != self.tamanho_do_bloco(block_id):
+            return False
+        return hashlib.sha256(dados).digest() == self.hashes[block_id]
+
+    # --- construcao ---
+
+    @classmethod
+    def de_blocos(cls, blocos: Iterable[bytes], tamanho_bloco: int) -> "Manifesto":
+        """Calcula o manifesto a partir do conteúdo de cada bloco, em ordem."""
+        hashes = []
+        tamanho_arquivo = 0
+        for dados in blocos:
+            hashes.append(hashlib.sha256(dados).digest())
+            tamanho_arquivo += len(dados)
+        return cls(tamanho_arquivo, tamanho_bloco, hashes)
+
+    @classmethod
+    def do_arquivo(cls, caminho: str, tamanho_bloco: int) -> "Manifesto":
+        """Calcula o manifesto de um arquivo em disco."""
+        def _ler():
+            with open(caminho, "rb") as f:
+                while dados := f.read(tamanho_bloco):
+                    yield dados
+        return cls.de_blocos(_ler(), tamanho_bloco)
+
+    @classmethod
+    def sintetico(cls, total_blocos: int, tamanho_bloco: int, gerador: Callable[[int, int], bytes]) -> "Manifesto":
+        """Manifesto de um arquivo gerado bloco a bloco, ex.: gerar_conteudo_bloco."""
+        return cls.de_blocos((gerador(i, tamanho_bloco) for i in range(total_blocos)), tamanho_bloco)
+
+    # --- serializacao ---
+
+    def to_dict(self) -> dict:
+        return {
+            "algoritmo": self.ALGORITMO,
+            "tamanho_arquivo": self.tamanho_arquivo,
+            "tamanho_bloco": self.tamanho_bloco,
+            "hashes": [h.hex() for h in self.hashes],
+        }
+
+    @classmethod
+    def from_dict(cls, dados: dict) -> "Manifesto":
+        algoritmo = dados.get("algoritmo", cls.ALGORITMO)
+        if algoritmo != cls.ALGORITMO:
+            raise ValueError(f"algoritmo de hash não suportado: {algoritmo}")
+        hashes = [bytes.fromhex(h) for h in dados["hashes"]]
+        return cls(int(dados["tamanho_arquivo"]), int(dados["tamanho_bloco"]), hashes)
+
+    def salvar(self, caminho: str):
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def carregar(cls, caminho: str) -> "Manifesto":
+        with open(caminho, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def __repr__(self):
+        return f"Manifesto({self.total_blocos} blocos de {self.tamanho_bloco} bytes, {self.tamanho_arquivo} bytes)"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gera o manifesto (SHA-256 por bloco) de um arquivo.")
+    parser.add_argument("arquivo", help="Arquivo a ser compartilhado")
+    parser.add_argument("saida", help="Onde gravar o manifesto JSON")
+    parser.add_argument("--tamanho_bloco", type=int, default=16384, help="Tamanho do bloco em bytes (default: 16384)")
+    args = parser.parse_args()
+
+    manifesto = Manifesto.do_arquivo(args.arquivo, args.tamanho_bloco)
+    manifesto.salvar(args.saida)
+    print(f"{manifesto} gravado em {args.saida}")
@@ -0,0 +1,215 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+# Content-Type do formato de texto de exposição do Prometheus
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites padrão (segundos) dos histogramas de latência
+LIMITES_LATENCIA_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Limites para contagens pequenas (ex.: quantos peers têm um bloco)
+LIMITES_CONTAGEM = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _rotulos_texto(nomes: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: dict) -> tuple:
+        return tuple(rotulos[nome] for nome in self.rotulos)
+
+    def _amostras(self) -> list[str]:
+        raise NotImplementedError
+
+    def exportar(self) -> str:
+        cabecalho = f"# HELP {self.nome} {self.ajuda}\n# TYPE {self.nome} {self.tipo}\n"
+        return cabecalho + "".join(linha + "\n" for linha in self._amostras())
+
+
+class Contador(_Metrica):
+    """Valor que só cresce (bytes, requisições, transições...), um por combinação de rótulos."""
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: dict[tuple, float] = {}
+
+    def incrementar(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos) -> float:
+        with self._lock:
+            return self._valores.get(self._chave(rotulos), 0)
+
+    def remover(self, **rotulos):
+        """Descarta as séries cujos rótulos batem com os informados (ex.: as de um peer que saiu)."""
+        posicoes = [(self.rotulos.index(nome), valor) for nome, valor in rotulos.items()]
+        with self._lock:
+            for chave in [chave for chave in self._valores if all(chave[i] == valor for i, valor in posicoes)]:
+                del self._valores[chave]
+
+    def _amostras(self) -> list[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        return [f"{self.nome}{_rotulos_texto(self.rotulos, chave)} {_numero(valor)}" for chave, valor in valores]
+
+
+class Medidor(_Metrica):
+    """
+    Valor instantâneo lido na hora da coleta: 'funcao' retorna um número (sem rótulos)
+    ou um dicionário {valores dos rótulos (tupla): número}.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, funcao: Callable, rotulos: tuple = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self.funcao = funcao
+
+    def _amostras(self) -> list[str]:
+        valores = self.funcao()
+        if not self.rotulos:
+            return [f"{self.nome} {_numero(valores)}"]
+        return [f"{self.nome}{_rotulos_texto(self.rotulos, chave)} {_numero(valor)}" for chave, valor in valores.items()]
+
+
+class ContadorLido(Medidor):
+    """Contador mantido por outro objeto (ex.: um total em um atributo), lido na hora da coleta."""
+    tipo = "counter"
+
+
+class Histograma(_Metrica):
+    """Distribuição de valores (ex.: latências) em faixas cumulativas, com soma e contagem."""
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), limites: tuple = LIMITES_LATENCIA_S):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+        # rótulos -> [contagem por faixa (a última é +Inf), soma]
+        self._series: dict[tuple, list] = {}
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        faixa = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][faixa] += 1
+            serie[1] += valor
+
+    def _amostras(self) -> list[str]:
+        with self._lock:
+            series = [(chave, list(contagens), soma) for chave, (contagens, soma) in self._series.items()]
+        linhas = []
+        for chave, contagens, soma in series:
+            linhas.extend(self._linhas_serie(chave, contagens, soma))
+        return linhas
+
+    def _linhas_serie(self, chave: tuple, contagens: list, soma: float) -> list[str]:
+        linhas = []
+        acumulado = 0
+        for limite, contagem in zip(self.limites + (float("inf"),), contagens):
+            acumulado += contagem
+            rotulos = _rotulos_texto(self.rotulos, chave, f'le="{_numero(limite)}"')
+            linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+        rotulos = _rotulos_texto(self.rotulos, chave)
+        linhas.append(f"{self.nome}_sum{rotulos} {_numero(soma)}")
+        linhas.append(f"{self.nome}_count{rotulos} {acumulado}")
+        return linhas
+
+
+class HistogramaLido(Histograma):
+    """
+    Distribuição calculada na hora da coleta a partir dos valores que 'funcao' retorna
+    (ex.: a disponibilidade de cada bloco): uma série só, qualquer que seja o número de valores.
+    """
+    def __init__(self, nome: str, ajuda: str, funcao: Callable, limites: tuple = LIMITES_CONTAGEM):
+        super().__init__(nome, ajuda, (), limites)
+        self.funcao = funcao
+
+    def observar(self, valor: float, **rotulos):
+        raise TypeError(f"{self.nome} é lido na coleta, não observado")
+
+    def _amostras(self) -> list[str]:
+        contagens = [0] * (len(self.limites) + 1)
+        soma = 0
+        for valor in self.funcao():
+            contagens[bisect.bisect_left(self.limites, valor)] += 1
+            soma += valor
+        return self._linhas_serie((), contagens, soma)
+
+
+class RegistroMetricas:
+    """Conjunto de métricas de um processo (ou de um peer), exportado no formato de texto do Prometheus."""
+    def __init__(self):
+        self._metricas: list[_Metrica] = []
+
+    def _adicionar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: tuple = ()) -> Contador:
+        return self._adicionar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome: str, ajuda: str, funcao: Callable, rotulos: tuple = ()) -> Medidor:
+        return self._adicionar(Medidor(nome, ajuda, funcao, rotulos))
+
+    def contador_lido(self, nome: str, ajuda: str, funcao: Callable, rotulos: tuple = ()) -> ContadorLido:
+        return self._adicionar(ContadorLido(nome, ajuda, funcao, rotulos))
+
+    def histograma(self, nome: str, ajuda: str, rotulos: tuple = (), limites: tuple = LIMITES_LATENCIA_S) -> Histograma:
+        return self._adicionar(Histograma(nome, ajuda, rotulos, limites))
+
+    def histograma_lido(self, nome: str, ajuda: str, funcao: Callable, limites: tuple = LIMITES_CONTAGEM) -> HistogramaLido:
+        return self._adicionar(HistogramaLido(nome, ajuda, funcao, limites))
+
+    def exportar(self) -> str:
+        return "".join(metrica.exportar() for metrica in self._metricas)
+
+
+def servir_metricas(registro: RegistroMetricas, porta: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Sobe numa thread de fundo um servidor HTTP que responde GET /metrics com o registro. Retorna o servidor."""
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = registro.exportar().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", TIPO_CONTEUDO)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass # uma linha por coleta só poluiria o log do peer
+
+    servidor = ThreadingHTTPServer((host, porta), _Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True, name=f"metricas-{porta}").start()
+    return servidor
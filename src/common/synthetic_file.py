@@ -0,0 +1,10 @@
+def gerar_conteudo_bloco(block_id: int, tamanho: int) -> bytes:
+    """
+    Gera o conteúdo fictício do bloco 'block_id' do arquivo compartilhado.
+
+    O conteúdo depende só do id do bloco, então todos os peers (e o tracker) geram
+    exatamente os mesmos bytes para o mesmo bloco, preenchendo o tamanho pedido.
+    """
+    padrao = f"Conteúdo do bloco {block_id}\n".encode('utf-8')
+    repeticoes = tamanho // len(padrao) + 1
+    return (padrao * repeticoes)[:tamanho]
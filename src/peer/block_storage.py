@@ -0,0 +1,79 @@
+import mmap
+import os
+
+from src.peer.peer_log import log_download
+
+
+class ArmazenamentoBlocos:
+    """
+    Guarda os blocos direto no arquivo de destino, através de um mmap.
+
+    O arquivo é pré-alocado com o tamanho final e cada bloco é escrito na sua
+    posição (block_id * tamanho_bloco), então o arquivo montado já é o próprio
+    armazenamento. A leitura devolve uma memoryview sobre o mapeamento: os bytes
+    não são copiados para o heap do Python, e a memória do processo não cresce
+    com o tamanho do arquivo semeado.
+    """
+    def __init__(self, caminho: str, total_blocos: int, tamanho_bloco: int, tamanho_arquivo: int | None = None):
+        self.caminho = caminho
+        self.total_blocos = total_blocos
+        self.tamanho_bloco = tamanho_bloco
+        self.tamanho_arquivo = tamanho_arquivo if tamanho_arquivo is not None else total_blocos * tamanho_bloco
+
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        modo = "r+b" if os.path.exists(caminho) else "w+b"
+        self._arquivo = open(caminho, modo)
+        # Pré-aloca o arquivo inteiro (esparso na maioria dos sistemas de arquivos)
+        if os.fstat(self._arquivo.fileno()).st_size != self.tamanho_arquivo:
+            self._arquivo.truncate(self.tamanho_arquivo)
+        self._mapa = mmap.mmap(self._arquivo.fileno(), self.tamanho_arquivo) if self.tamanho_arquivo else None
+        self._view = memoryview(self._mapa) if self._mapa is not None else memoryview(b'')
+
+    def offset(self, block_id: int) -> int:
+        return block_id * self.tamanho_bloco
+
+    def tamanho_do_bloco(self, block_id: int) -> int:
+        """Tamanho do bloco em bytes (o último bloco pode ser menor)."""
+        return max(0, min(self.tamanho_bloco, self.tamanho_arquivo - self.offset(block_id)))
+
+    def escrever_bloco(self, block_id: int, dados) -> bool:
+        """Escreve o bloco na sua posição do arquivo. Retorna False se o tamanho não bate."""
+        tamanho = self.tamanho_do_bloco(block_id)
+        if len(dados) != tamanho or not 0 <= block_id < self.total_blocos:
+            log_download.warning("Bloco %d com tamanho inválido (%d bytes, esperado %d).", block_id, len(dados), tamanho)
+            return False
+        inicio = self.offset(block_id)
+        self._view[inicio:inicio + tamanho] = dados
+        return True
+
+    def ler_bloco(self, block_id: int) -> memoryview:
+        """Visão (sem cópia) dos bytes do bloco dentro do mapeamento."""
+        return self.ler_regiao(self.offset(block_id), self.tamanho_do_bloco(block_id))
+
+    def ler_regiao(self, offset: int, tamanho: int) -> memoryview:
+        """Visão (sem cópia) de um trecho qualquer do arquivo mapeado."""
+        return self._view[offset:offset + tamanho]
+
+    def regiao_do_bloco(self, block_id: int) -> tuple:
+        """
+        (arquivo, offset, tamanho) do bloco, para envio com sendfile direto do arquivo.
+        O objeto de arquivo é compartilhado: use apenas com offsets explícitos (os.sendfile),
+        nunca com seek/read.
+        """
+        return self._arquivo, self.offset(block_id), self.tamanho_do_bloco(block_id)
+
+    def flush(self):
+        """Garante que o que foi escrito no mapeamento chegue ao disco."""
+        if self._mapa is not None:
+            self._mapa.flush()
+
+    def fechar(self):
+        self.flush()
+        try:
+            self._view.release()
+            if self._mapa is not None:
+                self._mapa.close()
+        except BufferError:
+            # Ainda há visões do bloco em uso (ex.: envio em andamento); o SO libera ao sair
+            log_download.debug("Mapeamento de %s ainda em uso ao fechar.", self.caminho)
+        self._arquivo.close()
@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.common.bitfield import Bitfield
+from src.common.manifest import Manifesto
+from src.peer.peer_log import log_download
+
+
+class VerificadorBlocos:
+    """
+    Confere os blocos contra os hashes do manifesto num pool de workers.
+
+    O hashlib libera o GIL para buffers maiores que alguns KB, então threads
+    bastam para usar todos os núcleos, e os blocos (memoryviews sobre o mmap ou
+    buffers recebidos) não precisam ser copiados para outro processo. A
+    verificação roda fora das threads de rede e do loop do agendador.
+    """
+    def __init__(self, manifesto: Manifesto, max_workers: int | None = None):
+        self.manifesto = manifesto
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="verificador")
+
+    def verificar_async(self, block_id: int, dados) -> Future:
+        """Agenda a verificação de um bloco recebido; o Future resolve com True/False."""
+        return self._pool.submit(self.manifesto.verificar_bloco, block_id, dados)
+
+    def verificar_armazenamento(self, armazenamento) -> Bitfield:
+        """
+        Reverifica todos os blocos já gravados no arquivo, usando todos os workers.
+        Retorna o Bitfield dos blocos íntegros.
+        """
+        total = self.manifesto.total_blocos
+        # Um lote por worker (com folga) para não pagar uma tarefa por bloco
+        tamanho_lote = max(1, total // (self.max_workers * 4))
+        lotes = [range(inicio, min(total, inicio + tamanho_lote)) for inicio in range(0, total, tamanho_lote)]
+
+        def _verificar_lote(blocos: range) -> list[int]:
+            return [b for b in blocos if self.manifesto.verificar_bloco(b, armazenamento.ler_bloco(b))]
+
+        integros = Bitfield(total)
+        for resultado in self._pool.map(_verificar_lote, lotes):
+            integros |= resultado
+        log_download.info("Verificação do arquivo %s: %d/%d blocos íntegros.", armazenamento.caminho, len(integros), total)
+        return integros
+
+    def fechar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,388 @@
+import itertools
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from threading import Condition
+
+from src.peer.peer_log import contadores, log_download
+from src.peer.peer_stats import EstatisticasPeers
+
+# Pedaço padrão: um quarto do bloco de 16 KiB, para que um bloco seja dividido entre vizinhos
+TAMANHO_PEDACO_PADRAO = 4096
+
+
+class _Montagem:
+    """Bloco sendo baixado em pedaços, que podem vir de peers diferentes ao mesmo tempo."""
+    __slots__ = ("faltando", "origens", "_dados")
+
+    def __init__(self, pedacos: list[tuple[int, int]]):
+        # offset -> tamanho dos pedaços ainda não recebidos
+        self.faltando: dict[int, int] = dict(pedacos)
+        # peers que enviaram algum pedaço (responsáveis se o bloco não conferir)
+        self.origens: set[str] = set()
+        # Um bloco de um pedaço só usa os dados recebidos direto, sem buffer intermediário
+        self._dados = bytearray(sum(tamanho for _, tamanho in pedacos)) if len(pedacos) > 1 else None
+
+    def receber(self, offset: int, dados, peer_id: str):
+        """Guarda um pedaço; retorna o conteúdo do bloco quando ele fica completo, senão None."""
+        del self.faltando[offset]
+        self.origens.add(peer_id)
+        if self._dados is None:
+            return dados
+        self._dados[offset:offset + len(dados)] = dados
+        return None if self.faltando else self._dados
+
+
+class AgendadorDownloads:
+    """
+    Mantém várias requisições em andamento ao mesmo tempo.
+
+    Cada bloco é pedido em pedaços de tamanho_pedaco bytes, e pedaços de um mesmo
+    bloco podem ser pedidos a peers diferentes em paralelo e remontados aqui: um
+    peer lento não segura o bloco inteiro, e os últimos blocos terminam com a
+    soma da banda de todos que os têm.
+    Cada peer remoto pode ter até max_pendentes_por_peer requisições abertas e o
+    total fica limitado a max_pendentes_total. Assim que uma resposta chega, o slot
+    é liberado e preenchido primeiro com os pedaços dos blocos já começados e
+    depois com o próximo bloco mais raro (segundo o RarityIndex do peer), sem
+    esperar um timer.
+    Fora da reta final, um pedaço nunca é pedido a dois peers ao mesmo tempo.
+    Quando faltam limiar_endgame blocos ou menos (modo endgame), cada pedaço que
+    falta é pedido a todos os detentores com slot livre: a primeira resposta
+    completa vence e as outras requisições são canceladas, para que um peer lento
+    não atrase o fim do download.
+    Se o peer tiver um verificador (manifesto), cada bloco completo é conferido
+    no pool de verificação antes de ser gravado.
+    O prazo de cada requisição e a escolha entre os detentores de um pedaço vêm
+    das estimativas de tempo de resposta e vazão de cada peer (EstatisticasPeers);
+    peers que falham seguidamente ficam suspensos por um tempo.
+    """
+    def __init__(self, peer_node, max_pendentes_por_peer: int = 4, max_pendentes_total: int = 16,
+                 timeout_requisicao_s: float = 5.0, espera_apos_falha_s: float = 1.0,
+                 tamanho_pedaco: int = TAMANHO_PEDACO_PADRAO, limiar_endgame: int = 4):
+        if tamanho_pedaco <= 0:
+            raise ValueError(f"tamanho_pedaco deve ser positivo (recebido {tamanho_pedaco})")
+        self.peer_node = peer_node
+        self.max_pendentes_por_peer = max_pendentes_por_peer
+        self.max_pendentes_total = max_pendentes_total
+        # Prazo das requisições a peers ainda sem medida; depois o prazo se adapta a cada peer
+        self.timeout_requisicao_s = timeout_requisicao_s
+        self.estatisticas = EstatisticasPeers(timeout_inicial_s=timeout_requisicao_s)
+        self.tamanho_pedaco = tamanho_pedaco
+        # Quantos blocos podem faltar para entrar no modo endgame (0 desliga)
+        self.limiar_endgame = limiar_endgame
+        self._endgame = False
+        # Depois de uma falha (timeout, recusa por choke...) o mesmo peer só é
+        # tentado de novo para aquele bloco após esse intervalo
+        self.espera_apos_falha_s = espera_apos_falha_s
+
+        # Protege todo o estado abaixo e acorda o loop quando algo muda
+        self._cond = Condition()
+        # (bloco, offset do pedaço) -> {peer_id: (futuro, prazo, envio)}; mais de um peer só no endgame
+        self._em_andamento: dict[tuple[int, int], dict[str, tuple]] = {}
+        self._num_pendentes = 0
+        # blocos com algum pedaço já pedido e ainda incompletos
+        self._montagens: dict[int, _Montagem] = {}
+        self._pendentes_por_peer: dict[str, int] = {}
+        # respostas entregues pelas threads de leitura, processadas no loop do agendador
+        self._concluidos: deque = deque()
+        # bloco -> {peer_id: instante em que pode ser tentado de novo}
+        self._falhas_recentes: dict[int, dict[str, float]] = {}
+        # blocos recebidos aguardando a verificação do hash (não são pedidos de novo)
+        self._verificando: set[int] = set()
+        # resultados entregues pelo pool de verificação: (bloco, peers de origem, dados, futuro)
+        self._verificados: deque = deque()
+
+    def acordar(self):
+        """Avisa o agendador que o inventário dos peers mudou."""
+        with self._cond:
+            self._cond.notify()
+
+    def total_em_andamento(self) -> int:
+        with self._cond:
+            return self._num_pendentes
+
+    def executar(self):
+        """Loop principal: processa respostas, expira atrasadas e preenche slots livres."""
+        while self.peer_node.running:
+            self._processar_concluidos()
+
+            if self.peer_node._check_file_complete():
+                if not self.peer_node._completo:
+                    log_download.info("🎉 Arquivo completo! Agora atuando como seeder.")
+                    self.peer_node._completo = True
+                with self._cond:
+                    self._cond.wait(timeout=1.0)
+                continue
+
+            with self._cond:
+                self._expirar_atrasados()
+            if self._preencher_slots():
+                continue # as respostas podem já estar chegando
+            with self._cond:
+                if not self._concluidos and not self._verificados:
+                    self._cond.wait(timeout=self._tempo_ate_proximo_prazo())
+
+    def _tempo_ate_proximo_prazo(self) -> float:
+        """Quanto tempo esperar: até o próximo prazo vencer, no máximo 1s (para reavaliar peers)."""
+        if not self._em_andamento:
+            return 1.0
+        proximo_prazo = min(prazo for pedidos in self._em_andamento.values() for _, prazo, _ in pedidos.values())
+        return max(0.0, min(1.0, proximo_prazo - time.monotonic()))
+
+    def _pedacos(self, block_id: int) -> list[tuple[int, int]]:
+        """(offset, tamanho) de cada pedaço do bloco; o último pode ser menor."""
+        tamanho_bloco = self.peer_node.armazenamento.tamanho_do_bloco(block_id)
+        return [
+            (offset, min(self.tamanho_pedaco, tamanho_bloco - offset))
+            for offset in range(0, tamanho_bloco, self.tamanho_pedaco)
+        ]
+
+    def _em_endgame(self) -> bool:
+        """True na reta final do download (faltam limiar_endgame blocos ou menos)."""
+        faltando = self.peer_node.total_blocks - len(self.peer_node.blocks)
+        endgame = faltando <= self.limiar_endgame
+        if endgame and not self._endgame:
+            log_download.info("Modo endgame: faltam %d blocos, cada pedaço será pedido a todos os detentores.", faltando)
+        self._endgame = endgame
+        return endgame
+
+    def _preencher_slots(self) -> int:
+        """
+        Reserva os slots livres com _cond e só depois, sem ela, conecta e envia as
+        requisições: abrir a conexão com um vizinho fora do ar (ou esperar o socket
+        de um upload) não segura as respostas das outras conexões. Retorna quantas
+        requisições foram enviadas.
+        """
+        with self._cond:
+            reservas = self._reservar_slots()
+        for reserva in reservas:
+            self._enviar_requisicao(*reserva)
+        return len(reservas)
+
+    def _reservar_slots(self) -> list[tuple]:
+        """
+        Distribui pedaços entre os peers com slot livre: primeiro os dos blocos já
+        começados, depois os dos próximos blocos pela ordem de raridade. No endgame
+        o limite total não se aplica (são poucos blocos) e cada pedaço vai para
+        todos os detentores livres que ainda não o receberam pedido.
+        Cada escolha já ocupa o slot com um Future próprio; retorna
+        (bloco, offset, tamanho, peer_id, endereço, prazo em s, Future) para enviar. Chamar com _cond.
+        """
+        reservas = []
+        endgame = self._em_endgame()
+        if not endgame and self._num_pendentes >= self.max_pendentes_total:
+            return reservas
+
+        indice = self.peer_node.indice_raridade
+        agora = time.monotonic()
+        # Peers sem slot livre: quando todos os vizinhos estiverem aqui não adianta continuar
+        saturados = {pid for pid, n in self._pendentes_por_peer.items() if n >= self.max_pendentes_por_peer}
+        with self.peer_node.data_lock:
+            num_vizinhos = len(self.peer_node.peers_info)
+
+        comecados = list(self._montagens)
+        novos = (block_id for block_id in indice.blocos_por_raridade() if block_id not in self._montagens)
+        for block_id in itertools.chain(comecados, novos):
+            if len(saturados) >= num_vizinhos or (not endgame and self._num_pendentes >= self.max_pendentes_total):
+                break
+            if block_id in self._verificando:
+                continue
+
+            falhas = self._falhas_recentes.get(block_id, {})
+            candidatos = [
+                pid for pid in indice.detentores(block_id)
+                if pid not in saturados and falhas.get(pid, 0.0) <= agora and self.estatisticas.disponivel(pid, agora)
+            ]
+            if not candidatos:
+                continue
+
+            montagem = self._montagens.get(block_id)
+            if montagem is None:
+                montagem = self._montagens[block_id] = _Montagem(self._pedacos(block_id))
+            for offset, tamanho in montagem.faltando.items():
+                if not candidatos or (not endgame and self._num_pendentes >= self.max_pendentes_total):
+                    break
+                pedidos = self._em_andamento.get((block_id, offset), {})
+                if endgame:
+                    escolhidos = [pid for pid in candidatos if pid not in pedidos]
+                elif pedidos:
+                    continue
+                else:
+                    escolhidos = [self.estatisticas.escolher(candidatos)]
+                for peer_id in escolhidos:
+                    with self.peer_node.data_lock:
+                        peer_data = self.peer_node.peers_info.get(peer_id)
+                    if peer_data is None:
+                        candidatos.remove(peer_id) # saiu da rede enquanto escolhíamos
+                        continue
+                    reservas.append(self._reservar_requisicao(block_id, offset, tamanho, peer_id, peer_data))
+                    if self._pendentes_por_peer[peer_id] >= self.max_pendentes_por_peer:
+                        saturados.add(peer_id)
+                        candidatos.remove(peer_id)
+        return reservas
+
+    def _reservar_requisicao(self, block_id: int, offset: int, tamanho: int, peer_id: str, peer_data: dict) -> tuple:
+        """Ocupa o slot de uma requisição com um Future que o envio vai resolver. Chamar com _cond."""
+        peer_address = (peer_data['ip'], peer_data['porta'])
+        timeout = self.estatisticas.timeout(peer_id)
+        futuro = Future()
+        chave = (block_id, offset)
+        envio = time.monotonic()
+        self._em_andamento.setdefault(chave, {})[peer_id] = (futuro, envio + timeout, envio)
+        self._num_pendentes += 1
+        self._pendentes_por_peer[peer_id] = self._pendentes_por_peer.get(peer_id, 0) + 1
+        futuro.add_done_callback(lambda f, c=chave, p=peer_id: self._ao_concluir(c, p, f))
+        return block_id, offset, tamanho, peer_id, peer_address, timeout, futuro
+
+    def _enviar_requisicao(self, block_id: int, offset: int, tamanho: int, peer_id: str,
+                           peer_address: tuple, timeout: float, reserva: Future):
+        """Envia uma requisição reservada (sem _cond) e liga a resposta do transporte ao Future da reserva."""
+        if reserva.cancelled():
+            return # expirou ou foi cancelada (endgame) antes de sair
+        contadores.incrementar("requisicoes")
+        log_download.debug("Tentando baixar bloco %d (offset %d) de %s (%s), prazo %.2fs.",
+                           block_id, offset, peer_id, peer_address, timeout)
+        futuro = self.peer_node.p2p.solicitar_bloco_async(
+            peer_address, block_id, self.peer_node.id, timeout, offset=offset, tamanho=tamanho
+        )
+        # Cancelar a reserva (prazo, endgame) cancela a requisição no transporte, e vice-versa
+        reserva.add_done_callback(lambda r: r.cancelled() and futuro.cancel())
+        futuro.add_done_callback(lambda f: _repassar(f, reserva))
+
+    def _ao_concluir(self, chave: tuple[int, int], peer_id: str, futuro):
+        """Callback chamado na thread de leitura da conexão: só enfileira (com o instante da chegada) e acorda o loop."""
+        chegada = time.monotonic()
+        with self._cond:
+            self._concluidos.append((chave, peer_id, futuro, chegada))
+            self._cond.notify()
+
+    def _liberar_slot(self, chave: tuple[int, int], peer_id: str, futuro) -> bool:
+        """Remove a requisição do controle de pendentes. Retorna False se ela já tinha sido liberada."""
+        pedidos = self._em_andamento.get(chave)
+        registro = pedidos.get(peer_id) if pedidos else None
+        if registro is None or registro[0] is not futuro:
+            return False
+        del pedidos[peer_id]
+        if not pedidos:
+            del self._em_andamento[chave]
+        self._num_pendentes -= 1
+        restantes = self._pendentes_por_peer.get(peer_id, 1) - 1
+        if restantes > 0:
+            self._pendentes_por_peer[peer_id] = restantes
+        else:
+            self._pendentes_por_peer.pop(peer_id, None)
+        return True
+
+    def _cancelar_duplicatas(self, chave: tuple[int, int]):
+        """Endgame: o pedaço já chegou, então as requisições dele a outros peers são canceladas."""
+        for peer_id, (futuro, _, _) in list(self._em_andamento.get(chave, {}).items()):
+            futuro.cancel()
+            if self._liberar_slot(chave, peer_id, futuro):
+                contadores.incrementar("duplicatas_canceladas")
+                log_download.debug("Cancelou o pedido do bloco %d (offset %d) a %s: já recebido.", *chave, peer_id)
+
+    def _registrar_falha(self, block_id: int, peer_id: str):
+        self._falhas_recentes.setdefault(block_id, {})[peer_id] = time.monotonic() + self.espera_apos_falha_s
+
+    def _expirar_atrasados(self):
+        """Cancela requisições que passaram do prazo e libera seus slots."""
+        agora = time.monotonic()
+        atrasados = [
+            (chave, peer_id, futuro)
+            for chave, pedidos in self._em_andamento.items()
+            for peer_id, (futuro, prazo, _) in pedidos.items()
+            if prazo <= agora
+        ]
+        for chave, peer_id, futuro in atrasados:
+            futuro.cancel()
+            if self._liberar_slot(chave, peer_id, futuro):
+                contadores.incrementar("timeouts")
+                self.peer_node.metricas.timeouts.incrementar()
+                log_download.debug("Timeout ao requisitar bloco %d (offset %d) de %s.", *chave, peer_id)
+                self._registrar_falha(chave[0], peer_id)
+                self.estatisticas.registrar_falha(peer_id, por_timeout=True)
+
+    def _ao_verificar(self, block_id: int, origens: set[str], dados, futuro):
+        """Callback chamado no pool de verificação: só enfileira e acorda o loop."""
+        with self._cond:
+            self._verificados.append((block_id, origens, dados, futuro))
+            self._cond.notify()
+
+    def _processar_concluidos(self):
+        """Remonta os pedaços recebidos, armazena os blocos completos (e verificados) e libera os slots."""
+        verificador = self.peer_node.verificador
+        with self._cond:
+            concluidos = list(self._concluidos)
+            self._concluidos.clear()
+            recebidos = []
+            for chave, peer_id, futuro, chegada in concluidos:
+                registro = self._em_andamento.get(chave, {}).get(peer_id)
+                if not self._liberar_slot(chave, peer_id, futuro) or futuro.cancelled():
+                    continue
+                block_id, offset = chave
+                dados = futuro.result()
+                tempo_resposta = chegada - registro[2]
+                self.peer_node.metricas.registrar_resposta(peer_id, tempo_resposta, len(dados) if dados else 0)
+                montagem = self._montagens.get(block_id)
+                if montagem is None:
+                    continue
+                if not dados or len(dados) != montagem.faltando.get(offset):
+                    contadores.incrementar("falhas")
+                    log_download.debug("Falha ao baixar bloco %d (offset %d) de %s. Tentando outro peer.", block_id, offset, peer_id)
+                    self._registrar_falha(block_id, peer_id)
+                    self.estatisticas.registrar_falha(peer_id)
+                    continue
+
+                self.estatisticas.registrar_sucesso(peer_id, tempo_resposta, len(dados))
+                self._cancelar_duplicatas(chave)
+                bloco = montagem.receber(offset, dados, peer_id)
+                if bloco is None:
+                    continue # ainda faltam pedaços
+                del self._montagens[block_id]
+                if verificador is None:
+                    self._falhas_recentes.pop(block_id, None)
+                    recebidos.append((block_id, montagem.origens, bloco))
+                else:
+                    self._verificando.add(block_id)
+                    verificacao = verificador.verificar_async(block_id, bloco)
+                    verificacao.add_done_callback(
+                        lambda f, b=block_id, o=montagem.origens, d=bloco: self._ao_verificar(b, o, d, f)
+                    )
+
+            verificados = list(self._verificados)
+            self._verificados.clear()
+            for block_id, origens, dados, verificacao in verificados:
+                self._verificando.discard(block_id)
+                if not verificacao.cancelled() and verificacao.exception() is None and verificacao.result():
+                    self._falhas_recentes.pop(block_id, None)
+                    recebidos.append((block_id, origens, dados))
+                else:
+                    contadores.incrementar("blocos_corrompidos")
+                    log_download.warning("Bloco %d de %s não confere com o manifesto. Descartado.", block_id, ", ".join(sorted(origens)))
+                    # Sem saber qual pedaço veio errado, todos os peers que contribuíram esperam antes de tentar de novo
+                    for peer_id in origens:
+                        self._registrar_falha(block_id, peer_id)
+                        self.estatisticas.registrar_falha(peer_id)
+
+        for block_id, origens, dados in recebidos:
+            self.peer_node._store_blocks([block_id], dados)
+            contadores.incrementar("blocos_recebidos")
+            contadores.incrementar("bytes_recebidos", len(dados))
+            log_download.debug("Baixou bloco %d (%d bytes) de %s.", block_id, len(dados), ", ".join(sorted(origens)))
+
+        if recebidos:
+            self.peer_node._anunciar_blocos_baixados([block_id for block_id, _, _ in recebidos])
+
+
+def _repassar(origem: Future, destino: Future):
+    """Copia o desfecho de 'origem' para 'destino' (que pode já ter sido cancelado)."""
+    try:
+        if origem.cancelled():
+            destino.cancel()
+        elif origem.exception() is not None:
+            destino.set_exception(origem.exception())
+        else:
+            destino.set_result(origem.result())
+    except InvalidStateError:
+        pass
@@ -0,0 +1,357 @@
+import asyncio
+import itertools
+import struct
+from collections import deque
+from threading import Thread, Lock
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, InvalidStateError
+
+from src.peer import wire_protocol as protocolo
+from src.peer.p2p_communication import P2PCommunication
+from src.peer.peer_log import log_p2p
+from src.peer.wire_protocol import ErroProtocolo
+
+
+class AsyncP2PCommunication:
+    """
+    Transporte P2P baseado em asyncio, com a mesma interface de P2PCommunication.
+
+    Um único event loop (rodando numa thread de fundo) atende o servidor e todas as
+    conexões de saída, então milhares de conexões simultâneas não viram milhares de
+    threads. O formato das mensagens é o mesmo do transporte com threads, então
+    peers usando transportes diferentes conversam normalmente.
+    """
+    _loop: asyncio.AbstractEventLoop | None = None
+    _loop_lock = Lock()
+
+    # (meu_peer_id, endereco_remoto) -> _ConexaoAsync; acessado apenas dentro do event loop
+    _conexoes: dict = {}
+    # Conexões de entrada de cada peer local: meu_peer_id -> {writer: asyncio.Lock de envio}; só no event loop
+    _entrantes: dict = {}
+
+    @classmethod
+    def _obter_loop(cls) -> asyncio.AbstractEventLoop:
+        """Retorna o event loop compartilhado, iniciando sua thread na primeira chamada."""
+        with cls._loop_lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                Thread(target=cls._loop.run_forever, name="p2p-asyncio", daemon=True).start()
+            return cls._loop
+
+    @staticmethod
+    def start_server(peer_node, port=5000):
+        """Inicia o servidor asyncio e bloqueia até o peer parar, como P2PCommunication.start_server."""
+        P2PCommunication.registrar_no(peer_node)
+        loop = AsyncP2PCommunication._obter_loop()
+        futuro = asyncio.run_coroutine_threadsafe(AsyncP2PCommunication._servir(peer_node, port), loop)
+        try:
+            futuro.result()
+        except Exception as e:
+            log_p2p.error("Erro no servidor asyncio de %s: %s", peer_node.id, e)
+
+    @staticmethod
+    async def _servir(peer_node, port):
+        servidor = await asyncio.start_server(
+            lambda reader, writer: AsyncP2PCommunication._atender(reader, writer, peer_node),
+            host='0.0.0.0', port=port, reuse_address=True
+        )
+        log_p2p.info("%s ouvindo em porta %d (asyncio)", peer_node.id, port)
+        async with servidor:
+            # Mesmo critério de parada do servidor com threads
+            while peer_node.running:
+                await asyncio.sleep(1.0)
+        log_p2p.info("%s servidor encerrado.", peer_node.id)
+
+    @staticmethod
+    async def _ler_mensagem(reader: asyncio.StreamReader, limite: int) -> tuple[int, int, bytes]:
+        """Lê uma mensagem de até 'limite' bytes e retorna (tipo, id de requisição, dados); levanta IncompleteReadError se a conexão fechar."""
+        header_data = await reader.readexactly(protocolo.CABECALHO.size)
+        msg_length, tipo, request_id = protocolo.CABECALHO.unpack(header_data)
+        P2PCommunication._validar_tamanho_mensagem(msg_length, limite)
+        return tipo, request_id, await reader.readexactly(msg_length - protocolo.TAMANHO_MINIMO)
+
+    @staticmethod
+    async def _atender(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, peer_node):
+        """Processa as mensagens de uma conexão de entrada enquanto ela estiver aberta."""
+        # Os HAVE deste peer também saem por aqui: um não pode cair entre o cabeçalho e o bloco
+        trava_envio = asyncio.Lock()
+        AsyncP2PCommunication._entrantes.setdefault(peer_node.id, {})[writer] = trava_envio
+        peername = writer.get_extra_info("peername")
+        sessao = P2PCommunication._nova_sessao(peername[0] if peername else None)
+        limite = P2PCommunication._limite_mensagem(peer_node)
+        # A leitura corre à frente das respostas, para que um CANCEL alcance a requisição na fila
+        fila: deque = deque()
+        chegou, espaco = asyncio.Event(), asyncio.Event()
+        leitura = asyncio.get_running_loop().create_task(
+            AsyncP2PCommunication._ler_adiante(reader, limite, fila, chegou, espaco)
+        )
+        try:
+            while peer_node.running:
+                while not fila:
+                    if leitura.done():
+                        leitura.result() # a conexão fechou ou deu erro: levanta aqui
+                    chegou.clear()
+                    await chegou.wait()
+                mensagem = fila.popleft()
+                espaco.set()
+                resposta = P2PCommunication._processar_requisicao(peer_node, sessao, *mensagem)
+                if resposta is not None:
+                    cabecalho, regiao = resposta
+                    async with trava_envio:
+                        writer.write(cabecalho)
+                        if regiao is not None:
+                            await AsyncP2PCommunication._enviar_regiao(writer, peer_node, *regiao)
+                    await writer.drain()
+        except asyncio.IncompleteReadError:
+            log_p2p.debug("%s: Conexão fechada pelo remoto.", peer_node.id)
+        except ConnectionResetError:
+            log_p2p.warning("%s: Conexão redefinida pelo peer remoto.", peer_node.id)
+        except struct.error:
+            log_p2p.error("%s: Erro ao desempacotar cabeçalho. Dados corrompidos ou incompletos.", peer_node.id)
+        except ErroProtocolo as e:
+            log_p2p.warning("%s: Conexão encerrada por erro de protocolo: %s", peer_node.id, e)
+        except Exception as e:
+            log_p2p.error("Erro inesperado no atendimento asyncio de %s: %s", peer_node.id, e, exc_info=True)
+        finally:
+            if not leitura.cancel() and not leitura.cancelled():
+                leitura.exception() # já tratada acima (ou irrelevante com o peer parando)
+            AsyncP2PCommunication._entrantes.get(peer_node.id, {}).pop(writer, None)
+            writer.close()
+
+    @staticmethod
+    async def _ler_adiante(reader: asyncio.StreamReader, limite: int, fila: deque,
+                           chegou: asyncio.Event, espaco: asyncio.Event):
+        """Lê as mensagens de uma conexão de entrada para 'fila', até MAX_MENSAGENS_ADIANTADAS não atendidas."""
+        try:
+            while True:
+                while len(fila) >= P2PCommunication.MAX_MENSAGENS_ADIANTADAS:
+                    espaco.clear()
+                    await espaco.wait()
+                mensagem = await AsyncP2PCommunication._ler_mensagem(reader, limite)
+                P2PCommunication._enfileirar_mensagem(fila, mensagem)
+                chegou.set()
+        finally:
+            chegou.set() # acorda o atendimento também quando a leitura termina
+
+    @staticmethod
+    async def _enviar_regiao(writer: asyncio.StreamWriter, peer_node, arquivo, offset: int, count: int):
+        """Envia o bloco direto do arquivo com loop.sendfile (os.sendfile por baixo), sem passar pelo Python."""
+        loop = asyncio.get_running_loop()
+        try:
+            # fallback=False: o fallback do asyncio faz seek/read no arquivo compartilhado
+            await loop.sendfile(writer.transport, arquivo, offset, count, fallback=False)
+        except asyncio.SendfileNotAvailableError:
+            writer.write(peer_node.armazenamento.ler_regiao(offset, count))
+
+    @staticmethod
+    def solicitar_bloco_async(peer_address: tuple[str, int], block_id: int, peer_id: str, timeout_s: float = 5.0,
+                              offset: int = 0, tamanho: int = 0) -> Future:
+        """
+        Envia a requisição de um bloco (ou de um trecho dele) sem esperar a resposta.
+        Pode ser chamado de qualquer thread; o Future resolve com os dados ou None.
+        """
+        futuro = Future()
+        loop = AsyncP2PCommunication._obter_loop()
+        chave = (peer_id, tuple(peer_address))
+        loop.call_soon_threadsafe(
+            lambda: loop.create_task(AsyncP2PCommunication._enviar(chave, (block_id, offset, tamanho), timeout_s, futuro))
+        )
+        return futuro
+
+    @staticmethod
+    async def _enviar(chave, pedido: tuple[int, int, int], timeout_s: float, futuro: Future):
+        if futuro.cancelled():
+            return
+        conexao = AsyncP2PCommunication._conexoes.get(chave)
+        if conexao is None or not conexao.ativa:
+            conexao = _ConexaoAsync(chave[1], chave[0])
+            AsyncP2PCommunication._conexoes[chave] = conexao
+        try:
+            await conexao.solicitar_bloco(pedido, futuro, timeout_s)
+        except (OSError, asyncio.TimeoutError) as e:
+            log_p2p.error("Não foi possível conectar a %s para requisitar bloco %d: %s", chave[1], pedido[0], e)
+            if AsyncP2PCommunication._conexoes.get(chave) is conexao:
+                del AsyncP2PCommunication._conexoes[chave]
+            _resolver(futuro, None)
+
+    @staticmethod
+    def request_block(peer_address: tuple[str, int], block_id: int, peer_id: str, timeout_s: float = 5.0):
+        """Solicita um bloco de outro peer e retorna os dados do bloco."""
+        log_p2p.debug("Solicitando bloco %d de %s", block_id, peer_address)
+        futuro = AsyncP2PCommunication.solicitar_bloco_async(peer_address, block_id, peer_id, timeout_s)
+        try:
+            block_data = futuro.result(timeout=timeout_s)
+        except FutureTimeoutError:
+            futuro.cancel()
+            log_p2p.warning("Timeout ao requisitar bloco %d de %s.", block_id, peer_address)
+            return None
+
+        if block_data is not None:
+            log_p2p.debug("Recebeu %d bytes do bloco %d de %s", len(block_data), block_id, peer_address)
+        return block_data
+
+    @staticmethod
+    def anunciar_blocos(peer_node, block_ids):
+        """Envia HAVE com os blocos novos a todos os peers conectados a este (pode ser chamado de qualquer thread)."""
+        loop = AsyncP2PCommunication._loop
+        if loop is None:
+            return
+        mensagem = protocolo.have(block_ids)
+        loop.call_soon_threadsafe(
+            lambda: loop.create_task(AsyncP2PCommunication._divulgar(peer_node.id, mensagem))
+        )
+
+    @staticmethod
+    async def _divulgar(peer_id: str, mensagem: bytes):
+        """Uma tarefa por conexão: um upload lento ou um peer que não lê não atrasa os outros vizinhos."""
+        loop = asyncio.get_running_loop()
+        for (dono, _), conexao in list(AsyncP2PCommunication._conexoes.items()):
+            if dono == peer_id:
+                loop.create_task(conexao.notificar(mensagem))
+        for writer, trava_envio in list(AsyncP2PCommunication._entrantes.get(peer_id, {}).items()):
+            loop.create_task(AsyncP2PCommunication._notificar_entrante(writer, trava_envio, mensagem))
+
+    @staticmethod
+    async def _notificar_entrante(writer: asyncio.StreamWriter, trava_envio: asyncio.Lock, mensagem: bytes):
+        """
+        Envia um HAVE por uma conexão de entrada, depois do upload em andamento nela (o
+        loop.sendfile não aceita escritas no meio). Se o peer não ler em
+        PRAZO_NOTIFICACAO_S segundos, a conexão é encerrada em vez de o buffer crescer sem limite.
+        """
+        async with trava_envio:
+            if writer.is_closing():
+                return
+            writer.write(mensagem)
+        await _drenar_ou_fechar(writer, writer.get_extra_info("peername"))
+
+    @staticmethod
+    def fechar_conexoes(peer_id: str):
+        """Fecha todas as conexões de saída abertas por peer_id."""
+        P2PCommunication._nos_locais.pop(peer_id, None)
+        loop = AsyncP2PCommunication._loop
+        if loop is None:
+            return
+
+        def _fechar():
+            chaves = [chave for chave in AsyncP2PCommunication._conexoes if chave[0] == peer_id]
+            for chave in chaves:
+                AsyncP2PCommunication._conexoes.pop(chave).fechar()
+
+        loop.call_soon_threadsafe(_fechar)
+
+
+async def _drenar_ou_fechar(writer: asyncio.StreamWriter, remoto) -> bool:
+    """Espera o buffer de envio esvaziar por até PRAZO_NOTIFICACAO_S; senão fecha a conexão. Retorna False se fechou."""
+    try:
+        await asyncio.wait_for(writer.drain(), P2PCommunication.PRAZO_NOTIFICACAO_S)
+        return True
+    except asyncio.TimeoutError:
+        log_p2p.warning("%s não leu o HAVE em %.1f s. Conexão encerrada.", remoto, P2PCommunication.PRAZO_NOTIFICACAO_S)
+    except (ConnectionError, OSError):
+        pass # a leitura da conexão percebe o erro e a encerra
+    # abort, e não close: o close esperaria o buffer que o peer não está lendo
+    writer.transport.abort()
+    return False
+
+
+def _resolver(futuro: Future, resultado):
+    try:
+        futuro.set_result(resultado)
+    except InvalidStateError:
+        pass # já cancelado por quem pediu
+
+
+class _ConexaoAsync:
+    """Conexão de saída persistente no event loop, multiplexando requisições por id."""
+    def __init__(self, endereco: tuple[str, int], peer_id: str):
+        self.endereco = endereco
+        self.peer_id = peer_id
+        self.ativa = True
+        self.peer_id_remoto: str | None = None # chega no HANDSHAKE de resposta
+        # Maior mensagem aceita nesta conexão: o limite do peer local que a abriu
+        self.limite_mensagem = P2PCommunication._limite_mensagem(P2PCommunication._nos_locais.get(peer_id))
+        # request_id -> (Future, (bloco, offset)) para conferir a resposta
+        self._pendentes: dict[int, tuple[Future, tuple[int, int]]] = {}
+        self._ids = itertools.count(1)
+        self._writer: asyncio.StreamWriter | None = None
+        # Várias requisições podem chegar antes da conexão estar pronta: só a primeira conecta
+        self._conectando: asyncio.Task | None = None
+
+    async def _garantir_conexao(self, timeout_s: float):
+        if self._writer is not None:
+            return
+        if self._conectando is None:
+            self._conectando = asyncio.ensure_future(
+                asyncio.wait_for(asyncio.open_connection(*self.endereco), timeout=timeout_s)
+            )
+        try:
+            reader, writer = await asyncio.shield(self._conectando)
+        except BaseException:
+            self.ativa = False
+            raise
+        if self._writer is None:
+            self._writer = writer
+            asyncio.get_running_loop().create_task(self._loop_leitura(reader))
+            # Quem conecta se apresenta e manda o inventário; o outro lado responde com os dele
+            self.enviar_notificacao(P2PCommunication._abertura(self.peer_id))
+
+    def enviar_notificacao(self, mensagem: bytes):
+        """Envia uma mensagem enquadrada sem resposta (HANDSHAKE, BITFIELD, HAVE, CANCEL); um write só, então não se mistura com requisições."""
+        if self.ativa and self._writer is not None and not self._writer.is_closing():
+            self._writer.write(mensagem)
+
+    async def notificar(self, mensagem: bytes):
+        """HAVE com prazo: se o peer não ler em PRAZO_NOTIFICACAO_S segundos, a conexão é fechada."""
+        if not self.ativa or self._writer is None or self._writer.is_closing():
+            return
+        self._writer.write(mensagem)
+        if not await _drenar_ou_fechar(self._writer, self.endereco):
+            self.fechar()
+
+    async def solicitar_bloco(self, pedido: tuple[int, int, int], futuro: Future, timeout_s: float):
+        """Envia REQUEST para 'pedido' = (bloco, offset, tamanho); a resposta resolve 'futuro'."""
+        await self._garantir_conexao(timeout_s)
+        if not self.ativa:
+            _resolver(futuro, None)
+            return
+        block_id, offset, tamanho = pedido
+        request_id = (next(self._ids) - 1) % 0xFFFFFFFF + 1 # o 0 é das notificações
+        self._pendentes[request_id] = (futuro, (block_id, offset))
+        loop = asyncio.get_running_loop()
+        # Se quem pediu desistir (cancel), a entrada pendente é descartada dentro do loop
+        futuro.add_done_callback(
+            lambda f, rid=request_id: f.cancelled() and loop.call_soon_threadsafe(self._cancelar, rid)
+        )
+        self._writer.write(protocolo.requisicao(request_id, block_id, offset, tamanho))
+        await self._writer.drain()
+
+    def _cancelar(self, request_id: int):
+        """Descarta a requisição pendente e avisa o peer remoto (CANCEL) para não gastar banda com a resposta."""
+        if self._pendentes.pop(request_id, None) is not None:
+            self.enviar_notificacao(protocolo.cancelamento(request_id))
+
+    async def _loop_leitura(self, reader: asyncio.StreamReader):
+        try:
+            while self.ativa:
+                tipo, request_id, dados = await AsyncP2PCommunication._ler_mensagem(reader, self.limite_mensagem)
+                if P2PCommunication._processar_mensagem_saida(self, tipo, dados):
+                    continue
+                pendente = self._pendentes.pop(request_id, None)
+                if pendente is None:
+                    continue # requisição cancelada ou que expirou
+                futuro, pedido = pendente
+                _resolver(futuro, P2PCommunication._interpretar_resposta_bloco(tipo, dados, pedido, self.endereco, request_id))
+        except (asyncio.IncompleteReadError, OSError, struct.error, ErroProtocolo) as e:
+            if self.ativa:
+                log_p2p.warning("Conexão com %s perdida: %s", self.endereco, e)
+        finally:
+            self.fechar()
+
+    def fechar(self):
+        """Fecha a conexão e resolve com None todas as requisições pendentes."""
+        self.ativa = False
+        if self._writer is not None:
+            self._writer.close()
+        pendentes = [futuro for futuro, _ in self._pendentes.values()]
+        self._pendentes.clear()
+        for futuro in pendentes:
+            _resolver(futuro, None)
@@ -1,157 +1,638 @@
+import os
+import queue
+import selectors
 import socket
-import logging
-from threading import Thread
+import itertools
+import time
+from collections import deque
+from threading import Thread, Lock
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, InvalidStateError
 import struct # Empacota/desempacota tamanhos de mensagens
 
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from src.peer import wire_protocol as protocolo
+from src.peer.wire_protocol import ErroProtocolo
+from src.peer.peer_log import contadores, log_p2p
 
 class P2PCommunication:
-    # Antes da requisição de bloco enviamos um cabecalho
-    # que é um número fixo de bytes (HEADER_LENGTH) que indica o tamanho da mensagem
-    # que vira a seguir
-    # O struct converte números inteiros em sequências de bytes e vice-versa
-    # garantindo que o tamanho seja empacotado e desempacotado corretamente em ambos os lados paraevitar blocos imcompletos e erro de leitura
+    # Cada mensagem começa com um cabeçalho binário de tamanho fixo: tamanho, tipo
+    # e id de requisição (ver wire_protocol.py). O id permite varias requisicoes em
+    # andamento na mesma conexao, e o tipo e o bloco na resposta permitem conferir
+    # a que requisição ela pertence
+
+    # Maior mensagem aceita por padrão (tipo + id + dados). Um cabeçalho corrompido ou
+    # malicioso não pode fazer o receptor alocar mais que isso; cada peer pode ter o seu
+    # limite (PeerNode.max_mensagem_bytes, configurável com --max_mensagem_bytes)
+    MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+    # Quanto um HAVE pode esperar o peer remoto ler antes de a conexão ser encerrada
+    PRAZO_NOTIFICACAO_S = 5.0
+    # Quantas mensagens já recebidas uma conexão de entrada guarda antes de responder,
+    # para que um CANCEL que chegou logo atrás anule a requisição ainda não atendida
+    MAX_MENSAGENS_ADIANTADAS = 64
+
+    # Pool de conexoes persistentes: (meu_peer_id, endereco_remoto) -> ConexaoPeer
+    _conexoes: dict = {}
+    # Conexões de entrada de cada peer local: meu_peer_id -> {socket: _FilaNotificacoes}
+    _entrantes: dict = {}
+    _conexoes_lock = Lock()
+    # Filas de HAVE com mensagens por enviar, atendidas pela thread "p2p-notificacoes"
+    _a_descarregar: queue.SimpleQueue = queue.SimpleQueue()
+    _escritor: Thread | None = None
+    # Peers deste processo (peer_id -> PeerNode), para as conexões de saída enviarem
+    # o HANDSHAKE e o BITFIELD e aplicarem o que os vizinhos anunciam
+    _nos_locais: dict = {}
 
-    # Comprimento da mensagem
-    HEADER_LENGTH = 4
+    @staticmethod
+    def registrar_no(peer_node):
+        """Torna o peer conhecido pelas conexões de saída abertas em nome dele (chamado pelo start_server)."""
+        P2PCommunication._nos_locais[peer_node.id] = peer_node
 
     @staticmethod
     def start_server(peer_node, port=5000):
         """Inicia o servidor para receber blocos e outras mensagens P2P."""
+        P2PCommunication.registrar_no(peer_node)
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) 
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.bind(('0.0.0.0', port))
             s.listen()
             # Define um timeout para o accept() para que o loop possa checar se o peer está rodando
-            s.settimeout(1.0) 
-            logging.info(f"{peer_node.id} ouvindo em porta {port}")
+            s.settimeout(1.0)
+            log_p2p.info("%s ouvindo em porta %d", peer_node.id, port)
             while peer_node.running:
                 try:
-                    conn, _ = s.accept() 
-                    # Inicia uma nova thread para lidar com a conexão recebida
-                    Thread(target=P2PCommunication.handle_connection, args=(conn, peer_node)).start()
+                    conn, _ = s.accept()
+                    # As conexoes sao persistentes: uma thread atende todas as
+                    # requisicoes de um mesmo peer remoto, e nao uma por bloco
+                    Thread(target=P2PCommunication.handle_connection, args=(conn, peer_node), daemon=True).start()
                 except socket.timeout:
                     # Nenhuma conexão em 1 segundo, verifica novamente se o peer está rodando
                     continue
                 except Exception as e:
-                    logging.error(f"Erro no accept do servidor {peer_node.id}: {e}")
+                    log_p2p.error("Erro no accept do servidor %s: %s", peer_node.id, e)
                     break # Sai do loop em caso de erro inesperado
-            logging.info(f"{peer_node.id} servidor encerrado.")
+            log_p2p.info("%s servidor encerrado.", peer_node.id)
+
+
+    @staticmethod
+    def _receber_exatamente(sock, num_bytes: int) -> bytearray | None:
+        """
+        Recebe exatamente num_bytes do socket. Retorna None se a conexão for fechada no meio.
+        O buffer é alocado uma vez com o tamanho anunciado e preenchido com recv_into,
+        sem concatenar pedaços.
+        """
+        dados = bytearray(num_bytes)
+        visao = memoryview(dados)
+        recebidos = 0
+        while recebidos < num_bytes:
+            n = sock.recv_into(visao[recebidos:])
+            if n == 0:
+                return None
+            recebidos += n
+        return dados
+
+    @staticmethod
+    def _limite_mensagem(peer_node) -> int:
+        """Maior mensagem que peer_node aceita (o padrão da classe se ele não definir outro)."""
+        return getattr(peer_node, "max_mensagem_bytes", P2PCommunication.MAX_MESSAGE_BYTES)
+
+    @staticmethod
+    def _validar_tamanho_mensagem(msg_length: int, limite: int = MAX_MESSAGE_BYTES):
+        """Levanta struct.error se o tamanho anunciado no cabeçalho for inválido."""
+        if msg_length < protocolo.TAMANHO_MINIMO:
+            raise struct.error(f"mensagem curta demais ({msg_length} bytes)")
+        if msg_length > limite:
+            raise struct.error(f"mensagem grande demais ({msg_length} bytes, limite {limite})")
+
+    @staticmethod
+    def _receber_mensagem(sock, limite: int = MAX_MESSAGE_BYTES) -> tuple[int, int, memoryview] | None:
+        """
+        Lê uma mensagem (cabeçalho + dados) e retorna (tipo, id de requisição, dados).
+        Os dados são uma visão do buffer recebido, sem cópia; 'limite' é a maior mensagem aceita.
+        """
+        header_data = P2PCommunication._receber_exatamente(sock, protocolo.CABECALHO.size)
+        if header_data is None:
+            return None
+        msg_length, tipo, request_id = protocolo.CABECALHO.unpack(header_data)
+        P2PCommunication._validar_tamanho_mensagem(msg_length, limite)
+        dados = P2PCommunication._receber_exatamente(sock, msg_length - protocolo.TAMANHO_MINIMO)
+        if dados is None:
+            return None
+        return tipo, request_id, memoryview(dados)
 
 
     @staticmethod
     def handle_connection(conn, peer_node):
-        """Processa mensagens de outros peers."""
+        """Processa mensagens de outros peers enquanto a conexão estiver aberta."""
+        # Os HAVE deste peer também saem por aqui, de outra thread: cada envio segura a trava
+        trava_envio = Lock()
+        notificacoes = _FilaNotificacoes(conn, trava_envio)
+        with P2PCommunication._conexoes_lock:
+            P2PCommunication._entrantes.setdefault(peer_node.id, {})[conn] = notificacoes
         try:
-            # 1. Tenta receber o cabeçalho de 4 bytes que indica o tamanho da mensagem que virá.
-            header_data = conn.recv(P2PCommunication.HEADER_LENGTH)
-            if not header_data:
-                logging.warning(f"{peer_node.id}: Conexão fechada pelo remoto ou dados vazios.")
-                return
+            sessao = P2PCommunication._nova_sessao(conn.getpeername()[0])
+            limite = P2PCommunication._limite_mensagem(peer_node)
+            # Mensagens recebidas e ainda não atendidas, na ordem de chegada
+            fila: deque = deque()
+            while peer_node.running:
+                # Espera uma mensagem se a fila está vazia; depois lê o que já chegou atrás dela
+                while not fila or (len(fila) < P2PCommunication.MAX_MENSAGENS_ADIANTADAS
+                                   and P2PCommunication._ha_dados(conn)):
+                    mensagem = P2PCommunication._receber_mensagem(conn, limite)
+                    if mensagem is None:
+                        log_p2p.debug("%s: Conexão fechada pelo remoto.", peer_node.id)
+                        return
+                    P2PCommunication._enfileirar_mensagem(fila, mensagem)
 
-            # 2. Desempacota o tamanho da mensagem
-            msg_length = struct.unpack('>I', header_data)[0] 
-
-            # 3. Agora recebe a mensagem completa com base no tamanho lido
-            full_data = b''
-            bytes_received = 0
-            while bytes_received < msg_length:
-                # Recebe partes da mensagem até que todos os bytes esperados cheguem
-                packet = conn.recv(msg_length - bytes_received)
-                if not packet:
-                    logging.error(f"{peer_node.id}: Conexão perdida enquanto recebia mensagem.")
-                    return
-                full_data += packet
-                bytes_received += len(packet)
-            
-            data = full_data.decode('utf-8') # Decodifica a mensagem completa
-
-            if data.startswith("REQUEST_BLOCK:"):
-                partes = data.split(":")
-                if len(partes) < 3:
-                    logging.warning(f"{peer_node.id} recebeu requisição malformada: {data}")
-                    return
-
-                block_id = int(partes[1])
-                peer_id_remoto = partes[2]
-                
-                logging.debug(f"{peer_node.id}: Unchoked por mim: {peer_node.choking_manager.get_peers_unchoked_por_mim()}")
-                logging.debug(f"{peer_node.id}: Peer {peer_id_remoto} solicitou bloco {block_id}")
-                
-                if peer_id_remoto not in peer_node.choking_manager.get_peers_unchoked_por_mim():
-                    logging.info(f"{peer_node.id}: Recusou envio para {peer_id_remoto}, pois não está unchoked.")
-                    return 
-
-                logging.info(f"{peer_node.id} recebeu requisição por bloco: {block_id}")
-                
-                logging.debug(f"{peer_node.id} tem blocos: {list(peer_node.blocks.keys())}")
-
-                if block_id in peer_node.blocks:
-                    bloco_data = peer_node.blocks[block_id]
-                    if bloco_data is not None:
-                        response_header = struct.pack('>I', len(bloco_data))
-                        conn.sendall(response_header + bloco_data)
-                        logging.info(f"{peer_node.id} enviou bloco {block_id} ({len(bloco_data)} bytes)")
-                    else:
-                        logging.warning(f"{peer_node.id} tem o bloco {block_id}, mas está vazio (None). Não enviou.")
-                else:
-                    logging.warning(f"{peer_node.id} não possui o bloco {block_id}. Não enviou.")
-            else:
-                logging.warning(f"{peer_node.id} recebeu mensagem desconhecida: {data}")
+                resposta = P2PCommunication._processar_requisicao(peer_node, sessao, *fila.popleft())
+                if resposta is not None:
+                    cabecalho, regiao = resposta
+                    with trava_envio:
+                        if regiao is None:
+                            conn.sendall(cabecalho)
+                        else:
+                            # MSG_MORE segura o cabeçalho para sair no mesmo segmento do bloco
+                            conn.sendall(cabecalho, getattr(socket, "MSG_MORE", 0))
+                            P2PCommunication._enviar_regiao(conn, peer_node, *regiao)
+                    # HAVE enfileirados durante o envio saem agora, por esta mesma thread
+                    notificacoes.tentar_descarregar()
 
         except ConnectionResetError:
-            logging.warning(f"{peer_node.id}: Conexão redefinida pelo peer remoto.")
+            log_p2p.warning("%s: Conexão redefinida pelo peer remoto.", peer_node.id)
         except struct.error:
-            logging.error(f"{peer_node.id}: Erro ao desempacotar cabeçalho. Dados corrompidos ou incompletos.")
+            log_p2p.error("%s: Erro ao desempacotar cabeçalho. Dados corrompidos ou incompletos.", peer_node.id)
+        except ErroProtocolo as e:
+            log_p2p.warning("%s: Conexão encerrada por erro de protocolo: %s", peer_node.id, e)
         except Exception as e:
-            logging.error(f"Erro inesperado no handle_connection de {peer_node.id}: {e}", exc_info=True)
+            log_p2p.error("Erro inesperado no handle_connection de %s: %s", peer_node.id, e, exc_info=True)
         finally:
+            with P2PCommunication._conexoes_lock:
+                P2PCommunication._entrantes.get(peer_node.id, {}).pop(conn, None)
             conn.close()
 
+    @staticmethod
+    def _ha_dados(conn) -> bool:
+        """True se já há bytes (ou o fechamento) para ler no socket, sem bloquear."""
+        if not _SEM_ESPERA:
+            return False # sem como espiar sem bloquear: atende na ordem, sem ler adiante
+        try:
+            conn.recv(1, socket.MSG_PEEK | _SEM_ESPERA)
+            return True
+        except BlockingIOError:
+            return False
+
+    @staticmethod
+    def _enfileirar_mensagem(fila: deque, mensagem: tuple):
+        """
+        Põe uma mensagem recebida na fila de atendimento de uma conexão de entrada. Um
+        CANCEL tira da fila a requisição que ele cancela, e a resposta nunca é enviada;
+        se ela já foi atendida, o CANCEL chegou tarde e é ignorado.
+        Compartilhado entre o servidor com threads e o servidor asyncio.
+        """
+        tipo, request_id, _ = mensagem
+        if tipo != protocolo.CANCEL:
+            fila.append(mensagem)
+            return
+        for pendente in fila:
+            if pendente[0] == protocolo.REQUEST and pendente[1] == request_id:
+                fila.remove(pendente)
+                contadores.incrementar("cancelamentos_recebidos")
+                return
+
+    @staticmethod
+    def _enviar_regiao(conn, peer_node, arquivo, offset: int, count: int):
+        """
+        Envia 'count' bytes do arquivo a partir de 'offset' com os.sendfile: o kernel copia
+        direto do page cache para o socket e os bytes do bloco não passam pelo Python.
+        """
+        if hasattr(os, "sendfile"):
+            enviados = 0
+            while enviados < count:
+                n = os.sendfile(conn.fileno(), arquivo.fileno(), offset + enviados, count - enviados)
+                if n == 0:
+                    raise ConnectionResetError("socket fechado durante o sendfile")
+                enviados += n
+        else:
+            # Sem sendfile (ex.: Windows): envia a visão do mmap, ainda sem copiar para um bytes
+            conn.sendall(peer_node.armazenamento.ler_regiao(offset, count))
+
+    @staticmethod
+    def _nova_sessao(ip_remoto: str | None) -> dict:
+        """Estado de uma conexão de entrada: quem é o peer remoto (preenchido pelo HANDSHAKE)."""
+        return {"ip": ip_remoto, "peer_id": None, "endereco": None}
+
+    @staticmethod
+    def _processar_requisicao(peer_node, sessao: dict, tipo: int, request_id: int,
+                              dados) -> tuple[bytes, tuple | None] | None:
+        """
+        Interpreta uma mensagem recebida e retorna a resposta (ou None se não há resposta).
+        A resposta é (cabecalho, regiao): 'cabecalho' são os bytes enquadrados a enviar
+        e 'regiao', quando não é None, é (arquivo, offset, tamanho) com o conteúdo do
+        bloco, que o transporte envia direto do arquivo logo depois do cabeçalho.
+        Um HANDSHAKE é respondido com o nosso e com o nosso BITFIELD.
+        Levanta ErroProtocolo para mensagens que não seguem o protocolo.
+        Compartilhado entre o servidor com threads e o servidor asyncio.
+        """
+        if tipo == protocolo.REQUEST:
+            if sessao["peer_id"] is None:
+                raise ErroProtocolo("REQUEST antes do HANDSHAKE")
+            block_id, offset, tamanho = protocolo.ler_requisicao(dados)
+            status, regiao = P2PCommunication._obter_bloco_para_envio(
+                peer_node, block_id, offset, tamanho, sessao["peer_id"]
+            )
+            if regiao is None:
+                return protocolo.resposta_sem_conteudo(status, request_id, block_id), None
+            tamanho_envio = regiao[2]
+            # O cabeçalho já anuncia o tamanho total; o conteúdo segue direto do arquivo
+            cabecalho = protocolo.cabecalho_peca(request_id, block_id, offset, tamanho_envio)
+            contadores.incrementar("blocos_enviados")
+            contadores.incrementar("bytes_enviados", tamanho_envio)
+            peer_node.metricas.registrar_envio(sessao["peer_id"], tamanho_envio)
+            log_p2p.debug("%s enviou bloco %d (%d bytes a partir de %d)", peer_node.id, block_id, tamanho_envio, offset)
+            return cabecalho, regiao
+
+        if tipo == protocolo.HANDSHAKE:
+            peer_id_remoto, porta = protocolo.ler_handshake(dados)
+            sessao["peer_id"] = peer_id_remoto
+            if porta and sessao["ip"]:
+                sessao["endereco"] = (sessao["ip"], porta)
+            resposta = protocolo.handshake(peer_node.id, peer_node.my_port) + protocolo.bitfield(peer_node.blocks)
+            return resposta, None
+
+        if tipo == protocolo.CANCEL:
+            return None # a resposta já tinha saído: nada a desfazer
+
+        if tipo in (protocolo.BITFIELD, protocolo.HAVE):
+            if sessao["peer_id"] is None:
+                raise ErroProtocolo("inventário antes do HANDSHAKE")
+            P2PCommunication._aplicar_inventario(peer_node, tipo, dados, sessao["peer_id"], sessao["endereco"])
+            return None
+
+        raise ErroProtocolo(f"tipo de mensagem desconhecido: {tipo}")
+
+    # --- inventário entre vizinhos (BITFIELD / HAVE) ---
+
+    @staticmethod
+    def _abertura(peer_id: str) -> bytes:
+        """HANDSHAKE (e BITFIELD, se o peer é deste processo) que abre uma conexão de saída."""
+        peer_node = P2PCommunication._nos_locais.get(peer_id)
+        if peer_node is None:
+            return protocolo.handshake(peer_id, 0)
+        return protocolo.handshake(peer_id, peer_node.my_port) + protocolo.bitfield(peer_node.blocks)
+
+    @staticmethod
+    def _aplicar_inventario(peer_node, tipo: int, dados, peer_id_remoto: str, endereco: tuple | None):
+        """Aplica um BITFIELD ou HAVE recebido de um vizinho."""
+        if tipo == protocolo.HAVE:
+            peer_node.vizinho_obteve_blocos(peer_id_remoto, protocolo.ler_have(dados))
+        else:
+            peer_node.atualizar_inventario_vizinho(
+                peer_id_remoto, protocolo.ler_bitfield(dados, peer_node.total_blocks), endereco
+            )
+
+    @staticmethod
+    def _processar_mensagem_saida(conexao, tipo: int, dados) -> bool:
+        """
+        Trata HANDSHAKE, BITFIELD e HAVE recebidos numa conexão de saída ('conexao' é uma
+        ConexaoPeer ou _ConexaoAsync). Retorna False se a mensagem é resposta a uma requisição.
+        """
+        if tipo == protocolo.HANDSHAKE:
+            conexao.peer_id_remoto, _ = protocolo.ler_handshake(dados)
+            return True
+        if tipo not in (protocolo.BITFIELD, protocolo.HAVE):
+            return False
+        if conexao.peer_id_remoto is None:
+            raise ErroProtocolo("inventário antes do HANDSHAKE")
+        peer_node = P2PCommunication._nos_locais.get(conexao.peer_id)
+        if peer_node is not None:
+            P2PCommunication._aplicar_inventario(peer_node, tipo, dados, conexao.peer_id_remoto, conexao.endereco)
+        return True
+
+    @staticmethod
+    def anunciar_blocos(peer_node, block_ids):
+        """
+        Enfileira HAVE com os blocos novos para todos os peers conectados a este, pelas
+        conexões de saída e de entrada. Não espera o envio: quem chama (o agendador)
+        não fica preso atrás de um upload em andamento nem de um peer que não lê.
+        """
+        mensagem = protocolo.have(block_ids)
+        with P2PCommunication._conexoes_lock:
+            filas = [conexao.notificacoes for (dono, _), conexao in P2PCommunication._conexoes.items() if dono == peer_node.id]
+            filas.extend(P2PCommunication._entrantes.get(peer_node.id, {}).values())
+        for fila in filas:
+            fila.enfileirar(mensagem)
+            P2PCommunication._agendar_descarga(fila)
+
+    @staticmethod
+    def _agendar_descarga(fila: "_FilaNotificacoes"):
+        """Pede à thread de notificações (iniciada na primeira chamada) que envie o que está na fila."""
+        with P2PCommunication._conexoes_lock:
+            if P2PCommunication._escritor is None:
+                P2PCommunication._escritor = Thread(target=P2PCommunication._loop_notificacoes,
+                                                    name="p2p-notificacoes", daemon=True)
+                P2PCommunication._escritor.start()
+        P2PCommunication._a_descarregar.put(fila)
+
+    @staticmethod
+    def _loop_notificacoes():
+        while True:
+            P2PCommunication._a_descarregar.get().tentar_descarregar()
+
+    @staticmethod
+    def _interpretar_resposta_bloco(tipo: int, dados, pedido: tuple[int, int], endereco, request_id: int):
+        """
+        Extrai o conteúdo de uma resposta; None se o peer recusou, não tem o bloco ou
+        respondeu com um bloco/offset diferente do pedido ('pedido' é (bloco, offset)).
+        """
+        if tipo == protocolo.PIECE:
+            block_id, offset, conteudo = protocolo.ler_peca(dados)
+        elif tipo in (protocolo.RECUSADO, protocolo.INDISPONIVEL):
+            block_id, offset, conteudo = protocolo.ler_bloco(dados), pedido[1], None
+        else:
+            raise ErroProtocolo(f"tipo de resposta desconhecido: {tipo}")
+
+        if (block_id, offset) != pedido:
+            log_p2p.warning("%s respondeu a requisição %d com o bloco %d (offset %d), esperado %d (offset %d).",
+                            endereco, request_id, block_id, offset, *pedido)
+            return None
+        if tipo == protocolo.RECUSADO:
+            contadores.incrementar("recusas_recebidas")
+            log_p2p.debug("%s recusou a requisição %d (choked).", endereco, request_id)
+        return conteudo
+
+    @staticmethod
+    def _obter_bloco_para_envio(peer_node, block_id: int, offset: int, tamanho: int,
+                                peer_id_remoto: str) -> tuple[int, tuple | None]:
+        """
+        Decide se o trecho do bloco pode ser enviado ao peer remoto e retorna
+        (tipo da resposta, (arquivo, offset, tamanho)); 'tamanho' 0 pede até o fim do bloco.
+        """
+        if peer_id_remoto not in peer_node.choking_manager.get_peers_unchoked_por_mim():
+            contadores.incrementar("recusas_enviadas")
+            log_p2p.debug("%s: Recusou o bloco %d para %s, pois não está unchoked.", peer_node.id, block_id, peer_id_remoto)
+            return protocolo.RECUSADO, None
+
+        log_p2p.debug("%s: Peer %s solicitou bloco %d", peer_node.id, peer_id_remoto, block_id)
+
+        regiao = peer_node.obter_regiao_bloco(block_id)
+        if regiao is None or offset >= regiao[2]:
+            contadores.incrementar("blocos_indisponiveis")
+            log_p2p.debug("%s não possui o bloco %d. Não enviou.", peer_node.id, block_id)
+            return protocolo.INDISPONIVEL, None
+        arquivo, inicio, tamanho_bloco = regiao
+        restante = tamanho_bloco - offset
+        return protocolo.PIECE, (arquivo, inicio + offset, min(tamanho, restante) if tamanho else restante)
+
+
+    @staticmethod
+    def obter_conexao(peer_address: tuple[str, int], peer_id: str, timeout_s: float = 5.0) -> "ConexaoPeer":
+        """Retorna a conexão persistente com peer_address, abrindo uma nova se necessário."""
+        chave = (peer_id, tuple(peer_address))
+        with P2PCommunication._conexoes_lock:
+            conexao = P2PCommunication._conexoes.get(chave)
+            if conexao is not None and conexao.ativa:
+                return conexao
+        # A conexão é aberta fora do lock para não travar requisições a outros peers
+        nova = ConexaoPeer(tuple(peer_address), peer_id, timeout_s)
+        with P2PCommunication._conexoes_lock:
+            existente = P2PCommunication._conexoes.get(chave)
+            if existente is not None and existente.ativa:
+                nova.fechar()
+                return existente
+            P2PCommunication._conexoes[chave] = nova
+        return nova
+
+    @staticmethod
+    def fechar_conexoes(peer_id: str):
+        """Fecha todas as conexões persistentes abertas por peer_id."""
+        P2PCommunication._nos_locais.pop(peer_id, None)
+        with P2PCommunication._conexoes_lock:
+            chaves = [chave for chave in P2PCommunication._conexoes if chave[0] == peer_id]
+            conexoes = [P2PCommunication._conexoes.pop(chave) for chave in chaves]
+        for conexao in conexoes:
+            conexao.fechar()
+
+    @staticmethod
+    def solicitar_bloco_async(peer_address: tuple[str, int], block_id: int, peer_id: str, timeout_s: float = 5.0,
+                              offset: int = 0, tamanho: int = 0) -> Future:
+        """
+        Envia a requisição de um bloco pela conexão persistente sem esperar a resposta.
+        O Future retornado resolve com os dados do bloco, ou None se o peer recusar/não tiver o bloco.
+        'offset' e 'tamanho' pedem só um trecho do bloco (tamanho 0: até o fim).
+        """
+        try:
+            conexao = P2PCommunication.obter_conexao(peer_address, peer_id, timeout_s)
+            return conexao.solicitar_bloco(block_id, offset, tamanho)
+        except OSError as e:
+            log_p2p.error("Não foi possível conectar a %s para requisitar bloco %d: %s", peer_address, block_id, e)
+            falha = Future()
+            falha.set_result(None)
+            return falha
 
     @staticmethod
     def request_block(peer_address: tuple[str, int], block_id: int, peer_id: str, timeout_s: float = 5.0):
         """Solicita um bloco de outro peer e retorna os dados do bloco."""
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(timeout_s) # Define um timeout para a conexão e operações de socket.
+        log_p2p.debug("Solicitando bloco %d de %s", block_id, peer_address)
+        futuro = P2PCommunication.solicitar_bloco_async(peer_address, block_id, peer_id, timeout_s)
+        try:
+            block_data = futuro.result(timeout=timeout_s)
+        except FutureTimeoutError:
+            futuro.cancel()
+            log_p2p.warning("Timeout ao requisitar bloco %d de %s.", block_id, peer_address)
+            return None
+
+        if block_data is not None:
+            log_p2p.debug("Recebeu %d bytes do bloco %d de %s", len(block_data), block_id, peer_address)
+        return block_data
+
+
+class ConexaoPeer:
+    """
+    Conexão TCP persistente com um peer remoto.
+    Várias requisições podem estar em andamento ao mesmo tempo: cada uma recebe
+    um id e a thread de leitura entrega a resposta ao Future correspondente.
+    """
+    def __init__(self, endereco: tuple[str, int], peer_id: str, timeout_conexao: float = 5.0):
+        self.endereco = endereco
+        self.peer_id = peer_id
+        self.sock = socket.create_connection(endereco, timeout=timeout_conexao)
+        self.sock.settimeout(None) # os timeouts passam a ser por requisição, no Future
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.ativa = True
+        self.peer_id_remoto: str | None = None # chega no HANDSHAKE de resposta
+        # Maior mensagem aceita nesta conexão: o limite do peer local que a abriu
+        self.limite_mensagem = P2PCommunication._limite_mensagem(P2PCommunication._nos_locais.get(peer_id))
+
+        # request_id -> (Future, (bloco, offset)) para conferir a resposta
+        self._pendentes: dict[int, tuple[Future, tuple[int, int]]] = {}
+        self._lock = Lock() # protege _pendentes
+        self._trava_envio = Lock() # uma mensagem inteira por vez no socket
+        self._ids = itertools.count(1)
+        # HAVE a enviar, sem que quem anuncia espere pelo socket
+        self.notificacoes = _FilaNotificacoes(self.sock, self._trava_envio)
+
+        Thread(target=self._loop_leitura, daemon=True).start()
+
+        # Quem conecta se apresenta e manda o inventário; o outro lado responde com os dele
+        with self._trava_envio:
             try:
-                s.connect(peer_address)
-                
-                # Prepara a mensagem de requisição: primeiro o cabeçalho de tamanho, depois os dados.
-                request_message = f"REQUEST_BLOCK:{block_id}:{peer_id}".encode('utf-8')
-                request_header = struct.pack('>I', len(request_message)) # Empacota o tamanho da mensagem.
-                s.sendall(request_header + request_message) # Envia o cabeçalho e a mensagem.
-                logging.info(f"Solicitando bloco {block_id} de {peer_address}")
-
-                # Recebe a resposta do bloco 
-                response_header = s.recv(P2PCommunication.HEADER_LENGTH)
-                if not response_header:
-                    logging.warning(f"Não recebeu cabeçalho de resposta para bloco {block_id} de {peer_address}. Peer pode ter fechado a conexão.")
-                    return None
-
-                # Desempacota o tamanho do bloco
-                response_length = struct.unpack('>I', response_header)[0]
-
-                # Recebe os dados do bloco em partes até completar o tamanho total
-                block_data = b''
-                bytes_received = 0
-                while bytes_received < response_length:
-                    packet = s.recv(response_length - bytes_received) # Recebe o restante dos bytes
-                    if not packet:
-                        logging.error(f"Conexão perdida enquanto recebia bloco {block_id} de {peer_address}.")
-                        return None
-                    block_data += packet
-                    bytes_received += len(packet)
-
-                logging.info(f"Recebeu {len(block_data)} bytes do bloco {block_id} de {peer_address}")
-                return block_data
-
-            except socket.timeout:
-                logging.error(f"Timeout ao requisitar bloco {block_id} de {peer_address}.")
-                return None
-            except ConnectionRefusedError:
-                logging.error(f"Conexão recusada por {peer_address} ao requisitar bloco {block_id}. Peer pode não estar ativo.")
-                return None
-            except Exception as e:
-                logging.error(f"Erro inesperado no request_block de {peer_id}: {e}", exc_info=True)
+                self.sock.sendall(P2PCommunication._abertura(peer_id))
+            except OSError as e:
+                log_p2p.warning("Falha ao se apresentar a %s: %s", self.endereco, e)
+                self._marcar_inativa()
+
+    def _proximo_id(self) -> int:
+        """Id da próxima requisição, de 1 a 2**32 - 1 (o 0 é das notificações)."""
+        return (next(self._ids) - 1) % 0xFFFFFFFF + 1
+
+    def enviar_notificacao(self, mensagem: bytes):
+        """Enfileira uma mensagem já enquadrada que não espera resposta (HAVE, CANCEL); sai pela thread de notificações."""
+        if self.ativa:
+            self.notificacoes.enfileirar(mensagem)
+            P2PCommunication._agendar_descarga(self.notificacoes)
+
+    def solicitar_bloco(self, block_id: int, offset: int = 0, tamanho: int = 0) -> Future:
+        """Envia REQUEST e retorna um Future com a resposta."""
+        futuro = Future()
+        with self._lock:
+            if not self.ativa:
+                futuro.set_result(None)
+                return futuro
+            request_id = self._proximo_id()
+            self._pendentes[request_id] = (futuro, (block_id, offset))
+        try:
+            with self._trava_envio:
+                self.sock.sendall(protocolo.requisicao(request_id, block_id, offset, tamanho))
+        except OSError as e:
+            with self._lock:
+                self._pendentes.pop(request_id, None)
+            log_p2p.error("Falha ao enviar requisição do bloco %d para %s: %s", block_id, self.endereco, e)
+            futuro.set_result(None)
+            self._marcar_inativa()
+            return futuro
+        # HAVE enfileirados enquanto a requisição saía vão logo em seguida
+        self.notificacoes.tentar_descarregar()
+        # Se quem pediu desistir (cancel), a entrada pendente é descartada
+        futuro.add_done_callback(lambda f, rid=request_id: self._descartar_se_cancelado(rid, f))
+        return futuro
+
+    def _descartar_se_cancelado(self, request_id: int, futuro: Future):
+        """Quem pediu desistiu: descarta a entrada pendente e avisa o peer remoto (CANCEL) para não gastar banda."""
+        if futuro.cancelled():
+            with self._lock:
+                pendente = self._pendentes.pop(request_id, None)
+            if pendente is not None:
+                self.enviar_notificacao(protocolo.cancelamento(request_id))
+
+    def _loop_leitura(self):
+        """Lê respostas da conexão e resolve os Futures pendentes."""
+        try:
+            while self.ativa:
+                mensagem = P2PCommunication._receber_mensagem(self.sock, self.limite_mensagem)
+                if mensagem is None:
+                    break
+                tipo, request_id, dados = mensagem
+                if P2PCommunication._processar_mensagem_saida(self, tipo, dados):
+                    continue
+                with self._lock:
+                    pendente = self._pendentes.pop(request_id, None)
+                if pendente is None:
+                    continue # requisição cancelada ou que expirou
+
+                futuro, pedido = pendente
+                resultado = P2PCommunication._interpretar_resposta_bloco(tipo, dados, pedido, self.endereco, request_id)
+                try:
+                    futuro.set_result(resultado)
+                except InvalidStateError:
+                    pass # cancelado enquanto a resposta chegava
+        except (OSError, struct.error, ErroProtocolo) as e:
+            if self.ativa:
+                log_p2p.warning("Conexão com %s perdida: %s", self.endereco, e)
+        finally:
+            self.fechar()
+
+    def _marcar_inativa(self):
+        self.ativa = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def fechar(self):
+        """Fecha a conexão e resolve com None todas as requisições ainda pendentes."""
+        with self._lock:
+            self._marcar_inativa()
+            pendentes = [futuro for futuro, _ in self._pendentes.values()]
+            self._pendentes.clear()
+        for futuro in pendentes:
+            try:
+                futuro.set_result(None)
+            except InvalidStateError:
+                pass
+
+
+class _FilaNotificacoes:
+    """
+    HAVE por enviar numa conexão do transporte com threads. Quem anuncia só enfileira;
+    o envio é feito pela thread de notificações ou pela própria thread da conexão logo
+    depois de um envio dela, e só se ninguém estiver usando o socket (nunca espera um
+    upload em andamento). As mensagens pendentes saem juntas, com prazo: um peer que
+    não lê nada por prazo_s segundos tem a conexão encerrada, porque uma mensagem
+    enviada pela metade estragaria o enquadramento.
+    """
+    def __init__(self, sock, trava_envio: Lock, prazo_s: float = P2PCommunication.PRAZO_NOTIFICACAO_S):
+        self.sock = sock
+        self.trava_envio = trava_envio
+        self.prazo_s = prazo_s
+        self._mensagens: deque[bytes] = deque()
+
+    def enfileirar(self, mensagem: bytes):
+        self._mensagens.append(mensagem)
+
+    def tentar_descarregar(self):
+        """
+        Envia as mensagens pendentes se o socket estiver livre; senão, quem o está usando
+        chama de novo ao terminar. Pode ser chamado de qualquer thread.
+        """
+        # Repete depois de soltar a trava: quem enfileirou enquanto ela estava presa desistiu
+        while self._mensagens and self.trava_envio.acquire(blocking=False):
+            try:
+                partes = []
+                while self._mensagens:
+                    partes.append(self._mensagens.popleft())
+                self._enviar_com_prazo(b"".join(partes))
+            except OSError as e:
+                log_p2p.warning("Falha ao enviar HAVE para %s: %s. Conexão encerrada.", _remoto(self.sock), e)
+                self._mensagens.clear()
+                try:
+                    # A thread de leitura da conexão percebe o fechamento e a encerra
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            finally:
+                self.trava_envio.release()
+
+    def _enviar_com_prazo(self, dados: bytes):
+        """sendall sem bloquear além de prazo_s (o socket continua bloqueante para a thread de leitura)."""
+        visao = memoryview(dados)
+        limite = time.monotonic() + self.prazo_s
+        while visao:
+            try:
+                visao = visao[self.sock.send(visao, _SEM_ESPERA):]
+                continue
+            except BlockingIOError:
+                pass
+            restante = limite - time.monotonic()
+            with selectors.DefaultSelector() as seletor:
+                seletor.register(self.sock, selectors.EVENT_WRITE)
+                if restante <= 0 or not seletor.select(restante):
+                    raise TimeoutError(f"peer não leu nada em {self.prazo_s} s")
+
+
+# Envio que retorna em vez de esperar espaço no buffer do socket (onde o sistema permite)
+_SEM_ESPERA = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+def _remoto(sock) -> str:
+    try:
+        return str(sock.getpeername())
+    except OSError:
+        return "peer desconectado"
@@ -0,0 +1,78 @@
+import logging
+import time
+from threading import Lock
+
+# Um logger por subsistema do peer, com nível próprio (ex.: --log p2p=DEBUG).
+# As mensagens usam argumentos no estilo '%s': com o nível desligado, nada é formatado
+log_p2p = logging.getLogger("minibit.peer.p2p")
+log_download = logging.getLogger("minibit.peer.download")
+log_tracker = logging.getLogger("minibit.peer.tracker")
+log_contadores = logging.getLogger("minibit.peer.contadores")
+
+SUBSISTEMAS = {
+    "p2p": log_p2p,
+    "download": log_download,
+    "tracker": log_tracker,
+    "contadores": log_contadores,
+}
+
+
+class ContadoresAmostrados:
+    """
+    Contadores dos eventos por bloco (requisições, blocos enviados/recebidos, recusas...),
+    no lugar de uma linha de log por evento. No máximo a cada 'intervalo_s' segundos,
+    quem incrementa registra em INFO um resumo com o que aconteceu desde o anterior.
+    """
+    def __init__(self, intervalo_s: float = 10.0, logger: logging.Logger = log_contadores):
+        self.intervalo_s = intervalo_s
+        self._logger = logger
+        self._valores: dict[str, int] = {}
+        self._no_ultimo_resumo: dict[str, int] = {}
+        self._ultimo_resumo = time.monotonic()
+        self._lock = Lock()
+
+    def incrementar(self, nome: str, quantidade: int = 1):
+        with self._lock:
+            self._valores[nome] = self._valores.get(nome, 0) + quantidade
+            agora = time.monotonic()
+            decorrido = agora - self._ultimo_resumo
+            if decorrido < self.intervalo_s:
+                return
+            self._ultimo_resumo = agora
+            if not self._logger.isEnabledFor(logging.INFO):
+                return
+            diferencas = {
+                chave: valor - self._no_ultimo_resumo.get(chave, 0)
+                for chave, valor in self._valores.items()
+                if valor != self._no_ultimo_resumo.get(chave, 0)
+            }
+            self._no_ultimo_resumo = dict(self._valores)
+        self._logger.info(
+            "Últimos %.0fs: %s", decorrido, " ".join(f"{chave}={valor}" for chave, valor in sorted(diferencas.items()))
+        )
+
+    def valores(self) -> dict[str, int]:
+        """Totais acumulados desde o início."""
+        with self._lock:
+            return dict(self._valores)
+
+
+# Contadores do processo (um peer por processo)
+contadores = ContadoresAmostrados()
+
+
+def configurar_log_peer(nivel: str = "INFO", niveis_subsistemas: str = "", formato: str | None = None):
+    """
+    Configura o log do peer: 'nivel' vale para tudo e 'niveis_subsistemas'
+    ("p2p=DEBUG,download=WARNING") ajusta subsistemas de SUBSISTEMAS.
+    """
+    logging.basicConfig(
+        level=nivel.upper(),
+        format=formato or "%(asctime)s - %(levelname)s - %(message)s",
+        force=True
+    )
+    for item in filter(None, (parte.strip() for parte in niveis_subsistemas.split(","))):
+        nome, _, nivel_subsistema = item.partition("=")
+        if nome not in SUBSISTEMAS or not nivel_subsistema:
+            raise ValueError(f"Nível de log inválido '{item}'. Use <subsistema>=<nível>, subsistemas: {', '.join(SUBSISTEMAS)}")
+        SUBSISTEMAS[nome].setLevel(nivel_subsistema.upper())
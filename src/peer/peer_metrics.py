@@ -0,0 +1,78 @@
+from src.common.metrics import RegistroMetricas, servir_metricas
+
+
+class MetricasPeer:
+    """
+    Métricas de um PeerNode no formato do Prometheus: bytes trocados com cada peer
+    remoto, latência das requisições de bloco, requisições em andamento, transições
+    de choke, as estimativas de tempo de resposta e vazão de cada peer remoto e o
+    progresso do download. Os valores que já existem em outros objetos
+    (agendador, choking manager, inventário) são lidos só na hora da coleta.
+    """
+    def __init__(self, peer_node):
+        self.peer_node = peer_node
+        self.registro = RegistroMetricas()
+        self._servidor = None
+
+        self.bytes = self.registro.contador(
+            "minibit_peer_bytes_total", "Bytes de blocos trocados com cada peer remoto.", ("remoto", "direcao")
+        )
+        self.latencia = self.registro.histograma(
+            "minibit_peer_latencia_requisicao_segundos",
+            "Tempo entre pedir um bloco e a resposta chegar (ok: bloco recebido; falha: recusa ou bloco indisponível).",
+            ("resultado",)
+        )
+        self.timeouts = self.registro.contador(
+            "minibit_peer_timeouts_total", "Requisições de bloco canceladas por passar do prazo."
+        )
+        self.registro.medidor(
+            "minibit_peer_requisicoes_em_andamento", "Requisições de bloco aguardando resposta.",
+            lambda: self.peer_node.agendador.total_em_andamento()
+        )
+        self.registro.contador_lido(
+            "minibit_peer_choke_transicoes_total", "Peers que passaram a ser atendidos (unchoke) ou deixaram de ser (choke).",
+            lambda: {(tipo,): total for tipo, total in self.peer_node.choking_manager.transicoes.items()},
+            ("tipo",)
+        )
+        self.registro.medidor(
+            "minibit_peer_tempo_resposta_estimado_segundos", "Tempo de resposta suavizado (EWMA) de cada peer remoto.",
+            lambda: {(peer_id,): srtt for peer_id, (srtt, _) in self.peer_node.agendador.estatisticas.resumo().items()},
+            ("remoto",)
+        )
+        self.registro.medidor(
+            "minibit_peer_vazao_estimada_bytes_por_segundo", "Vazão suavizada (EWMA) de cada peer remoto.",
+            lambda: {(peer_id,): vazao for peer_id, (_, vazao) in self.peer_node.agendador.estatisticas.resumo().items()},
+            ("remoto",)
+        )
+        self.registro.medidor(
+            "minibit_peer_blocos", "Blocos que este peer possui.", lambda: len(self.peer_node.blocks)
+        )
+        self.registro.medidor(
+            "minibit_peer_blocos_total", "Blocos do arquivo.", lambda: self.peer_node.total_blocks
+        )
+        self.registro.medidor(
+            "minibit_peer_vizinhos", "Peers vizinhos conhecidos.", lambda: len(self.peer_node.peers_info)
+        )
+
+    def registrar_envio(self, peer_id_remoto: str, num_bytes: int):
+        self.bytes.incrementar(num_bytes, remoto=peer_id_remoto, direcao="enviados")
+
+    def esquecer_remoto(self, peer_id_remoto: str):
+        """Descarta as séries de um peer que deixou de ser vizinho (as estimativas saem com ele do agendador)."""
+        self.bytes.remover(remoto=peer_id_remoto)
+
+    def registrar_resposta(self, peer_id_remoto: str, latencia_s: float, num_bytes: int):
+        """Uma resposta a uma requisição de bloco: num_bytes == 0 se o peer recusou ou não tinha o bloco."""
+        self.latencia.observar(latencia_s, resultado="ok" if num_bytes else "falha")
+        if num_bytes:
+            self.bytes.incrementar(num_bytes, remoto=peer_id_remoto, direcao="recebidos")
+
+    def servir(self, porta: int, host: str = "127.0.0.1"):
+        """Expõe GET /metrics numa porta HTTP própria (thread de fundo)."""
+        self._servidor = servir_metricas(self.registro, porta, host)
+
+    def fechar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
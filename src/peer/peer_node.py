@@ -1,31 +1,92 @@
 import logging
+import os
 import time
 from threading import Thread, Lock
 import requests
-import random
 
+from src.common.bitfield import Bitfield
+from src.common.manifest import Manifesto
 from src.peer.p2p_communication import P2PCommunication
-from src.peer.file_manager import FileManager
+from src.peer.p2p_async import AsyncP2PCommunication
+from src.peer.block_storage import ArmazenamentoBlocos
+from src.peer.block_verifier import VerificadorBlocos
+from src.peer.resume_state import EstadoRetomada
+from src.common.synthetic_file import gerar_conteudo_bloco
 from src.peer.strategies.choking_manager import ChokingManager
-from src.peer.strategies.rarest_first import escolher_bloco_mais_raro
-from src.peer.strategies.tit_for_tat_strategy import _calcular_pontuacao_de_raridade_do_peer 
+from src.peer.strategies.rarity_index import RarityIndex
+from src.peer.download_scheduler import AgendadorDownloads, TAMANHO_PEDACO_PADRAO
+from src.peer.tracker_announcer import AnunciadorTracker
+from src.peer.peer_log import configurar_log_peer, log_download, log_tracker
+from src.peer.peer_metrics import MetricasPeer
 
 class PeerNode:
     BLOCK_SIZE_BYTES = 16384
-
-    def __init__(self, peer_id, tracker_url, port, total_blocks=20, download_dir="downloads"):
+    # Intervalo da consulta de peers ao tracker: dobra a cada consulta sem mudança na
+    # vizinhança (o inventário dos vizinhos já chega por BITFIELD/HAVE) e volta ao mínimo
+    # quando alguém entra ou sai, ou se o peer fica sem vizinhos. A consulta é o que mantém
+    # o peer vivo no tracker, então o máximo fica na metade do timeout de inatividade dele (60 s)
+    INTERVALO_TRACKER_MIN_S = 15
+    INTERVALO_TRACKER_MAX_S = 30
+
+    def __init__(self, peer_id, tracker_url, port, total_blocks=20, download_dir="downloads",
+                 max_pendentes_por_peer=4, max_pendentes_total=16, usar_asyncio=False,
+                 max_mensagem_bytes=None, manifesto_path=None, verificar_arquivo=False, max_peers=50,
+                 porta_metricas=None, tamanho_pedaco=TAMANHO_PEDACO_PADRAO, limiar_endgame=4):
         self.id = peer_id
         self.tracker_url = tracker_url
-        self.blocks: dict[int, bytes] = {}
-        self.peers_info: dict[str, dict] = {} # Dicionário: peer_id -> {'ip': ..., 'porta': ..., 'blocks': set[int]}
+        # Blocos que este peer possui, como Bitfield (o conteúdo fica no armazenamento em disco)
+        self.blocks = Bitfield(total_blocks)
+        self.peers_info: dict[str, dict] = {} # Dicionário: peer_id -> {'ip': ..., 'porta': ..., 'blocks': Bitfield}
+        # Versão do enxame no tracker refletida em peers_info (None = pedir a lista completa)
+        self._versao_tracker: int | None = None
+        # Máximo de vizinhos conhecidos; é o 'numwant' pedido ao tracker
+        self.max_peers = max_peers
         self.running = True
         self.my_port = port
         self.my_ip = "127.0.0.1"
-        self.file_manager = FileManager()
-        self.todos_os_blocos = set(range(total_blocks))
+        caminho_dados = os.path.join(download_dir, self.id, "arquivo.bin")
+        # Um arquivo de uma execução anterior pode ser retomado no start()
+        self._arquivo_existia = os.path.exists(caminho_dados)
+        # O arquivo de destino é pré-alocado e os blocos são escritos/lidos nele via mmap
+        self.armazenamento = ArmazenamentoBlocos(
+            caminho_dados,
+            total_blocos=total_blocks,
+            tamanho_bloco=self.BLOCK_SIZE_BYTES
+        )
+        self.todos_os_blocos = Bitfield.cheio(total_blocks)
         self.total_blocks = total_blocks # Armazena o total de blocos para referência
+        # Manifesto com o hash de cada bloco: lido de arquivo ou obtido do tracker no start()
+        self.manifesto_path = manifesto_path
+        self.manifesto: Manifesto | None = None
+        # Confere os blocos recebidos contra o manifesto (None = sem verificação)
+        self.verificador: VerificadorBlocos | None = None
+        # Reverifica o arquivo já existente em disco ao iniciar, ignorando o estado salvo
+        self.verificar_arquivo = verificar_arquivo
+        # Checkpoint + diário dos blocos gravados, para retomar após reiniciar (criado no start())
+        self.estado: EstadoRetomada | None = None
 
         self.choking_manager = ChokingManager(self.id)
+        # Disponibilidade dos blocos entre os vizinhos, mantida de forma incremental
+        # e compartilhada pelo rarest first e pelo choking
+        self.indice_raridade = RarityIndex(self.todos_os_blocos)
+        # Transporte P2P: threads (padrão) ou um único event loop asyncio
+        self.p2p = AsyncP2PCommunication if usar_asyncio else P2PCommunication
+        # Maior mensagem P2P aceita por este peer, nas conexões de entrada e de saída
+        # dos dois transportes (o asyncio usa o mesmo enquadramento)
+        self.max_mensagem_bytes = P2PCommunication.MAX_MESSAGE_BYTES if max_mensagem_bytes is None else max_mensagem_bytes
+        # Mantém várias requisições de bloco em andamento (pipeline)
+        self.agendador = AgendadorDownloads(
+            self,
+            max_pendentes_por_peer=max_pendentes_por_peer,
+            max_pendentes_total=max_pendentes_total,
+            tamanho_pedaco=tamanho_pedaco,
+            limiar_endgame=limiar_endgame
+        )
+        # Anuncia ao tracker só os blocos novos, agrupados numa janela curta
+        self.anunciador = AnunciadorTracker(self)
+        # Métricas no formato do Prometheus, em GET /metrics na porta_metricas (None = não expõe)
+        self.metricas = MetricasPeer(self)
+        self.porta_metricas = porta_metricas
 
         # Lock para proteger self.blocks e self.peers_info de acessos concorrentes por threads
         self.data_lock = Lock()
@@ -42,25 +103,106 @@ class PeerNode:
 
     def start(self):
         # Inicia o servidor P2P em uma thread separada
-        Thread(target=P2PCommunication.start_server, args=(self, self.my_port), daemon=True).start()
+        Thread(target=self.p2p.start_server, args=(self, self.my_port), daemon=True).start()
         logging.info(f"Servidor P2P do Peer {self.id} iniciado.")
+        if self.porta_metricas is not None:
+            self.metricas.servir(self.porta_metricas)
+            logging.info(f"Métricas em http://127.0.0.1:{self.porta_metricas}/metrics")
 
+        self._carregar_manifesto()
+        self._retomar_download()
         self._register_with_tracker()
 
         # Inicia loops de background em threads separadas
         # e incorpora a lógica de raridade
         Thread(target=self._download_loop, daemon=True).start()
         Thread(target=self._update_peers_from_tracker_loop, daemon=True).start()
+        Thread(target=self.anunciador.executar, daemon=True).start()
         # O loop de choking/unchoking para olho por olho
         Thread(target=self._choking_unchoking_loop, daemon=True).start()
 
         logging.info(f"Peer {self.id} operacional.")
 
+    def _carregar_manifesto(self):
+        """Lê o manifesto do arquivo indicado ou do tracker e cria o verificador de blocos."""
+        try:
+            if self.manifesto_path:
+                manifesto = Manifesto.carregar(self.manifesto_path)
+            else:
+                response = requests.get(f"{self.tracker_url}/manifesto")
+                response.raise_for_status()
+                manifesto = Manifesto.from_dict(response.json())
+        except (requests.exceptions.RequestException, OSError, ValueError, KeyError) as e:
+            logging.warning(f"Manifesto indisponível, blocos não serão verificados: {e}")
+            return
+
+        if manifesto.total_blocos != self.total_blocks or manifesto.tamanho_bloco != self.BLOCK_SIZE_BYTES:
+            logging.error(
+                f"Manifesto incompatível ({manifesto}) com {self.total_blocks} blocos de "
+                f"{self.BLOCK_SIZE_BYTES} bytes. Blocos não serão verificados."
+            )
+            return
+        self.manifesto = manifesto
+        self.verificador = VerificadorBlocos(manifesto)
+        logging.info(f"{manifesto} carregado; blocos recebidos serão verificados.")
+
+    def _retomar_download(self):
+        """
+        Reconstrói o inventário a partir do que já está em disco.
+        Com checkpoint salvo, só os blocos anotados no diário depois dele são
+        conferidos de novo; sem checkpoint (ou com --verificar_arquivo), o arquivo
+        existente inteiro é reverificado em paralelo.
+        """
+        self.estado = EstadoRetomada(
+            self.armazenamento.caminho, self.total_blocks, self.BLOCK_SIZE_BYTES,
+            identificador_manifesto=self.manifesto.identificador() if self.manifesto else None
+        )
+        carregado = None if self.verificar_arquivo else self.estado.carregar()
+
+        if carregado is not None:
+            confirmados, incertos = carregado
+            integros = confirmados.copy()
+            incertos = sorted(set(incertos) - set(confirmados))
+            if incertos and self.verificador is not None:
+                verificacoes = [
+                    (b, self.verificador.verificar_async(b, self.armazenamento.ler_bloco(b)))
+                    for b in incertos if b < self.total_blocks
+                ]
+                for block_id, verificacao in verificacoes:
+                    if verificacao.result():
+                        integros.add(block_id)
+            elif incertos:
+                logging.warning(f"Sem manifesto: {len(incertos)} blocos gravados após o último checkpoint serão baixados de novo.")
+            logging.info(f"Retomando download: {len(integros)} blocos em disco ({len(incertos)} conferidos pelo diário).")
+        elif self._arquivo_existia and self.verificador is not None:
+            integros = self.verificador.verificar_armazenamento(self.armazenamento)
+        else:
+            if self._arquivo_existia:
+                logging.warning("Sem manifesto: o arquivo existente não pode ser verificado e será baixado de novo.")
+            return
+
+        with self.data_lock:
+            self.blocks |= integros
+            for block_id in integros:
+                self.indice_raridade.marcar_meu_bloco(block_id)
+        self._salvar_estado()
+
+    def _salvar_estado(self):
+        """Grava um checkpoint do inventário (depois de garantir os dados no disco)."""
+        if self.estado is None:
+            return
+        with self.data_lock:
+            blocos = self.blocks.copy()
+            self.armazenamento.flush()
+            self.estado.checkpoint(blocos)
+
     def _register_with_tracker(self):
-        """Registra-se no tracker e obtém blocos iniciais e peers."""
+        """Registra-se no tracker com o inventário completo e obtém blocos iniciais e peers."""
         try:
             with self.data_lock:
-                my_blocks_list = list(self.blocks.keys())
+                # O registro leva todos os blocos: os anúncios pendentes ficam cobertos por ele
+                self.anunciador.reiniciar()
+                meu_bitfield = self.blocks.to_base64()
 
             response = requests.post(
                 f"{self.tracker_url}/registrar_peer",
@@ -68,7 +210,8 @@ class PeerNode:
                     "peer_id": self.id,
                     "ip": self.my_ip,
                     "porta": self.my_port,
-                    "blocks": my_blocks_list
+                    "bitfield": meu_bitfield,
+                    "numwant": self.max_peers
                 }
             )
             response.raise_for_status()
@@ -76,12 +219,14 @@ class PeerNode:
 
             new_peers_data = data.get("peers", [])
             with self.data_lock:
-                self.peers_info.clear()
+                for peer_id in list(self.peers_info.keys()):
+                    self._remover_info_peer(peer_id)
                 for p_data in new_peers_data:
-                    self.peers_info[p_data['peer_id']] = p_data
-                    self.choking_manager.peer_entrou_na_rede(p_data['peer_id'])
+                    if p_data['peer_id'] != self.id:
+                        self._atualizar_info_peer(p_data)
+                self._versao_tracker = data.get("versao")
 
-            blocos_iniciais = data.get("blocos_iniciais", [])
+            blocos_iniciais = Bitfield.from_base64(data.get("bitfield_inicial", ""), self.total_blocks)
             self._store_blocks(blocos_iniciais)
 
             logging.info(f"Registrado no tracker. Peers conhecidos ({len(self.peers_info)}): {list(self.peers_info.keys())}")
@@ -91,7 +236,7 @@ class PeerNode:
                 peers_list_for_log = []
                 for peer_id, info in self.peers_info.items():
                     peers_list_for_log.append(
-                        f"{peer_id} ({info.get('ip', 'N/A')}:{info.get('porta', 'N/A')}) - Blocos: {sorted(list(info.get('blocks', set())))}"
+                        f"{peer_id} ({info.get('ip', 'N/A')}:{info.get('porta', 'N/A')}) - Blocos: {list(info.get('blocks', ()))}"
                     )
                 logging.info(f"Detalhes dos peers conhecidos após registro: {'; '.join(peers_list_for_log)}")
             else:
@@ -103,150 +248,170 @@ class PeerNode:
             logging.error(f"Erro inesperado ao registrar no tracker: {e}", exc_info=True)
 
 
+    def _atualizar_info_peer(self, p_data: dict):
+        """Registra/atualiza um peer vizinho em peers_info, no choking manager e no índice de raridade. Chamar com data_lock."""
+        peer_id = p_data['peer_id']
+        if 'bitfield' in p_data:
+            p_data['blocks'] = Bitfield.from_base64(p_data.pop('bitfield'), self.total_blocks)
+        else:
+            p_data['blocks'] = Bitfield.de(p_data.get('blocks', ()), self.total_blocks)
+        conhecido = self.peers_info.get(peer_id)
+        if conhecido is not None:
+            # O tracker pode estar atrás do que o próprio vizinho já anunciou (HAVE)
+            p_data['blocks'] = p_data['blocks'] | conhecido['blocks']
+        self.peers_info[peer_id] = p_data
+        self.choking_manager.peer_entrou_na_rede(peer_id)
+        self.indice_raridade.atualizar_peer(peer_id, p_data['blocks'])
+
+    def _remover_info_peer(self, peer_id: str):
+        """
+        Remove um peer vizinho de peers_info, do choking manager, do índice de raridade,
+        das estimativas do agendador e das métricas por peer. Chamar com data_lock.
+        """
+        self.peers_info.pop(peer_id, None)
+        self.choking_manager.peer_saiu_da_rede(peer_id)
+        self.indice_raridade.remover_peer(peer_id)
+        self.agendador.estatisticas.esquecer(peer_id)
+        self.metricas.esquecer_remoto(peer_id)
+
+    def atualizar_inventario_vizinho(self, peer_id: str, blocos: Bitfield, endereco: tuple | None = None):
+        """
+        BITFIELD recebido direto de um vizinho: substitui o inventário que conhecemos dele.
+        Um peer ainda desconhecido (conectou antes de aparecer na lista do tracker) é
+        adicionado, se 'endereco' (ip, porta de escuta) for conhecido e houver vaga.
+        """
+        if peer_id == self.id:
+            return
+        with self.data_lock:
+            p_data = self.peers_info.get(peer_id)
+            if p_data is not None:
+                self.peers_info[peer_id] = {**p_data, 'blocks': blocos}
+                self.indice_raridade.atualizar_peer(peer_id, blocos)
+            elif endereco is not None and len(self.peers_info) < self.max_peers:
+                self._atualizar_info_peer({'peer_id': peer_id, 'ip': endereco[0], 'porta': endereco[1], 'blocks': blocos})
+            else:
+                return
+        self.agendador.acordar()
+
+    def vizinho_obteve_blocos(self, peer_id: str, block_ids: list[int]):
+        """HAVE recebido de um vizinho: soma os blocos ao inventário que conhecemos dele."""
+        with self.data_lock:
+            p_data = self.peers_info.get(peer_id)
+            if p_data is None:
+                return
+            # O Bitfield é trocado, não alterado: o ciclo de choking pode estar com o antigo
+            self.peers_info[peer_id] = {**p_data, 'blocks': p_data['blocks'] | block_ids}
+            for block_id in block_ids:
+                self.indice_raridade.adicionar_bloco_peer(peer_id, block_id)
+        self.agendador.acordar()
+
     def _listen_for_peers(self):
-        P2PCommunication.start_server(self, self.my_port)
+        self.p2p.start_server(self, self.my_port)
 
     def _store_blocks(self, block_ids: list[int], data: bytes = None):
         """
-        Armazena blocos no PeerNode.
+        Armazena blocos no PeerNode, escrevendo-os na sua posição do arquivo em disco.
         Se 'data' for fornecido, é o conteúdo do bloco. Caso contrário, gera conteúdo fictício.
         """
+        checkpoint_pendente = False
         with self.data_lock: # Protege o acesso a self.blocks
             for block_id in block_ids:
                 if block_id not in self.blocks:
-                    if data:
-                        self.blocks[block_id] = data
-                    else: # Se não tem dados, é um bloco inicial gerado pelo tracker
-                        self.blocks[block_id] = f"[{self.id}] Conteúdo do bloco {block_id}".encode('utf-8')
-                    logging.debug(f"Bloco {block_id} adicionado ao meu inventário.")
-
+                    if not data: # Se não tem dados, é um bloco inicial gerado pelo tracker
+                        data_bloco = gerar_conteudo_bloco(block_id, self.armazenamento.tamanho_do_bloco(block_id))
+                    else:
+                        data_bloco = data
+                    if not self.armazenamento.escrever_bloco(block_id, data_bloco):
+                        continue
+                    self.blocks.add(block_id)
+                    self.indice_raridade.marcar_meu_bloco(block_id)
+                    if self.estado is not None:
+                        checkpoint_pendente |= self.estado.registrar_bloco(block_id)
+                    log_download.debug("Bloco %d adicionado ao meu inventário.", block_id)
+        if checkpoint_pendente:
+            self._salvar_estado()
+
+
+    def obter_dados_bloco(self, block_id: int) -> memoryview | None:
+        """Conteúdo de um bloco que este peer possui (visão sobre o arquivo mapeado, sem cópia), ou None."""
+        if block_id not in self.blocks:
+            return None
+        return self.armazenamento.ler_bloco(block_id)
+
+    def obter_regiao_bloco(self, block_id: int) -> tuple | None:
+        """(arquivo, offset, tamanho) de um bloco que este peer possui, para envio com sendfile; ou None."""
+        if block_id not in self.blocks:
+            return None
+        return self.armazenamento.regiao_do_bloco(block_id)
 
     def _download_loop(self):
-        """Loop principal para solicitar e baixar blocos."""
-        while self.running:
-            time.sleep(1)
-
-            if self._check_file_complete():
-                if not self._completo:
-                    logging.info("🎉 Arquivo completo! Agora atuando como seeder.")
-                    self._completo = True
-                continue 
-
-            with self.data_lock:
-                my_current_blocks = set(self.blocks.keys())
-
-                blocos_faltantes = self.todos_os_blocos - my_current_blocks
-                if blocos_faltantes: # Só loga se houver blocos faltando
-                    logging.info(f"Estado dos blocos: Possui {len(my_current_blocks)} de {self.total_blocks}. Faltam: {sorted(list(blocos_faltantes))}")
+        """Loop principal para solicitar e baixar blocos, delegado ao agendador de downloads."""
+        self.agendador.executar()
 
-                peers_map_for_rarity = {
-                    pid: p_data['blocks']
-                    for pid, p_data in self.peers_info.items()
-                    if pid != self.id
-                }
-
-                # Rarest First
-                block_to_request = escolher_bloco_mais_raro(
-                    meus_blocos=my_current_blocks,
-                    todos_os_blocos_do_arquivo=self.todos_os_blocos,
-                    mapa_de_blocos_dos_peers=peers_map_for_rarity
-                )
-
-                logging.info(f"{self.id}: RarestFirst escolheu bloco {block_to_request}")
-
-            if block_to_request is None:
-                continue
-
-            peers_with_block = []
-            with self.data_lock:
-                for peer_id, peer_data in self.peers_info.items():
-                    if peer_id == self.id: # Não tentar baixar de si mesmo
-                        continue
-                    if block_to_request in peer_data.get('blocks', set()):
-                        peers_with_block.append(peer_data)
-
-            if not peers_with_block:
-                logging.warning(f"Bloco {block_to_request} identificado como raro, mas nenhum peer conhecido o possui.")
-                continue
-
-            # Embaralha para distribuir as requisições, mesmo que o primeiro da lista sempre tenha o bloco
-            random.shuffle(peers_with_block)
-
-            downloaded = False
-            for peer_data in peers_with_block:
-                peer_address = (peer_data['ip'], peer_data['porta'])
-                logging.info(f"Tentando baixar bloco {block_to_request} de {peer_data['peer_id']} ({peer_address}).")
-
-                downloaded_data = P2PCommunication.request_block(peer_address, block_to_request, self.id)
-
-                if downloaded_data:
-                    self._store_blocks([block_to_request], downloaded_data)
-                    logging.info(f"✅ Baixou bloco {block_to_request} ({len(downloaded_data)} bytes) de {peer_data['peer_id']}.")
-                    downloaded = True
-                    # Atualiza o tracker com os blocos atuais após download
-                    try:
-                        with self.data_lock:
-                            my_blocks_list = list(self.blocks.keys())
-                        requests.post(
-                            f"{self.tracker_url}/registrar_peer",
-                            json={
-                                "peer_id": self.id,
-                                "ip": self.my_ip,
-                                "porta": self.my_port,
-                                "blocks": my_blocks_list
-                            }
-                        )
-                        logging.info(f"Atualizou o tracker com {len(my_blocks_list)} blocos após download.")
-                    except Exception as e:
-                        logging.warning(f"Falha ao atualizar tracker após download de bloco {block_to_request}: {e}")
-
-                    break # Passa para o próximo ciclo de download
-                else:
-                    logging.warning(f"Falha ao baixar bloco {block_to_request} de {peer_data['peer_id']}. Tentando próximo peer.")
-
-            if not downloaded:
-                logging.warning(f"Não foi possível baixar o bloco {block_to_request} de nenhum peer conhecido nesta rodada.")
+    def _anunciar_blocos_baixados(self, block_ids):
+        """Envia HAVE aos vizinhos conectados e agenda o anúncio ao tracker (só o delta, em lote)."""
+        self.p2p.anunciar_blocos(self, block_ids)
+        self.anunciador.anunciar(block_ids)
 
 
     def _update_peers_from_tracker_loop(self):
-        """Loop para periodicamente atualizar a lista de peers do tracker."""
+        """Loop para periodicamente atualizar a lista de peers do tracker, com intervalo adaptativo."""
+        intervalo = self.INTERVALO_TRACKER_MIN_S
         while self.running:
-            time.sleep(15)
+            time.sleep(intervalo)
+            # Sem resposta do tracker, também espaça as tentativas
+            intervalo = min(intervalo * 2, self.INTERVALO_TRACKER_MAX_S)
             try:
-                with self.data_lock:
-                    my_blocks_list = list(self.blocks.keys())
-
-                resp = requests.get(
-                    f"{self.tracker_url}/listar_peers?peer_id={self.id}",
-                    json={"blocks": my_blocks_list} # Envia blocos junto com a requisição de peers
-                )
+                # Os próprios blocos já chegam ao tracker pelos anúncios.
+                # Com a versão conhecida, o tracker responde só com o que mudou desde ela;
+                # num enxame maior que max_peers, completado com uma nova amostra de peers
+                params = {"peer_id": self.id, "numwant": self.max_peers}
+                if self._versao_tracker is not None:
+                    params["desde"] = self._versao_tracker
+                resp = requests.get(f"{self.tracker_url}/listar_peers", params=params)
+                if resp.status_code == 404:
+                    # O tracker nos esqueceu (inatividade ou reinício): volta com o inventário completo
+                    log_tracker.warning("Tracker não conhece este peer. Registrando de novo.")
+                    self._register_with_tracker()
+                    intervalo = self.INTERVALO_TRACKER_MIN_S
+                    continue
                 resp.raise_for_status()
                 data = resp.json()
 
                 new_peers_data = data.get("peers", [])
 
                 with self.data_lock:
-                    # Identifica peers que saíram para informar ao choking manager
-                    current_peer_ids = set(self.peers_info.keys())
-                    updated_peer_ids = {p_data['peer_id'] for p_data in new_peers_data}
-
-                    peers_removed = current_peer_ids - updated_peer_ids
+                    vizinhos_antes = set(self.peers_info)
+                    # Identifica peers que saíram para informar ao choking manager.
+                    # Uma amostra (enxame maior que numwant) não diz nada sobre quem ficou de fora
+                    if data.get("completo", True) and not data.get("amostra", False):
+                        updated_peer_ids = {p_data['peer_id'] for p_data in new_peers_data}
+                        peers_removed = set(self.peers_info.keys()) - updated_peer_ids
+                    else:
+                        peers_removed = set(data.get("removidos", [])) & set(self.peers_info.keys())
                     for removed_peer_id in peers_removed:
                         logging.info(f"Peer {removed_peer_id} saiu da rede.")
-                        self.choking_manager.peer_saiu_da_rede(removed_peer_id)
-                        self.peers_info.pop(removed_peer_id, None)
+                        self._remover_info_peer(removed_peer_id)
 
-                    # Atualiza/adiciona peers e informa ao choking manager sobre novos peers
+                    # Atualiza/adiciona peers e informa ao choking manager sobre novos peers,
+                    # sem passar de max_peers vizinhos conhecidos
                     for p_data in new_peers_data:
-                        if p_data['peer_id'] != self.id: # Não adiciona a si mesmo como peer
-                            self.peers_info[p_data['peer_id']] = p_data
-                            self.choking_manager.peer_entrou_na_rede(p_data['peer_id'])
+                        if p_data['peer_id'] == self.id: # Não adiciona a si mesmo como peer
+                            continue
+                        if p_data['peer_id'] in self.peers_info or len(self.peers_info) < self.max_peers:
+                            self._atualizar_info_peer(p_data)
+                    self._versao_tracker = data.get("versao")
+                    if not self.peers_info or set(self.peers_info) != vizinhos_antes:
+                        intervalo = self.INTERVALO_TRACKER_MIN_S
+
+                # Novos inventários podem liberar blocos para download
+                self.agendador.acordar()
 
 
             except requests.exceptions.RequestException as e:
-                logging.warning(f"Falha ao atualizar peers do tracker (conexão/HTTP): {e}")
+                log_tracker.warning("Falha ao atualizar peers do tracker (conexão/HTTP): %s", e)
             except Exception as e:
-                logging.error(f"Erro inesperado no loop de atualização de peers: {e}", exc_info=True)
+                log_tracker.error("Erro inesperado no loop de atualização de peers: %s", e, exc_info=True)
 
 
     def _choking_unchoking_loop(self):
@@ -267,15 +432,16 @@ class PeerNode:
                 self.choking_manager.executar_ciclo_unchoking(
                     timestamp_atual=current_timestamp,
                     mapa_de_blocos_global=mapa_de_blocos_para_choking,
-                    meus_blocos=set(self.blocks.keys()),
-                    todos_os_blocos_do_arquivo=self.todos_os_blocos
+                    meus_blocos=self.blocks,
+                    todos_os_blocos_do_arquivo=self.todos_os_blocos,
+                    indice_raridade=self.indice_raridade
                 )
 
 
     def _check_file_complete(self) -> bool:
         """Verifica se o peer possui todos os blocos do arquivo."""
         with self.data_lock:
-            return self.todos_os_blocos.issubset(self.blocks.keys())
+            return self.blocks.completo()
 
 
     def shutdown(self):
@@ -284,7 +450,16 @@ class PeerNode:
 
         # O sistema deve permitir que um peer se desligue somente após reconstruir o arquivo completo
         self.running = False # Sinaliza para todas as threads de loop pararem
+        self.p2p.fechar_conexoes(self.id) # Fecha as conexões persistentes com outros peers
+        self.anunciador.parar()
+        self.metricas.fechar()
         time.sleep(2) # da tempo pras threads se desligarem 
+        if self.verificador is not None:
+            self.verificador.fechar()
+        self._salvar_estado()
+        if self.estado is not None:
+            self.estado.fechar()
+        self.armazenamento.fechar()
 
         logging.info(f"Peer {self.id} finalizado com sucesso.")
 
@@ -293,21 +468,51 @@ if __name__ == "__main__":
     import sys
     import argparse
 
+    def inteiro_positivo(texto):
+        valor = int(texto)
+        if valor <= 0:
+            raise argparse.ArgumentTypeError(f"deve ser um inteiro positivo (recebido {texto})")
+        return valor
+
     parser = argparse.ArgumentParser(description="Peer para o sistema BitTorrent simplificado.")
     parser.add_argument("--id", type=str, required=True, help="ID único do peer (e.g., 'peer1')")
     parser.add_argument("--port", type=int, default=5001, help="Porta para o peer escutar conexões P2P (default: 5001)")
     parser.add_argument("--tracker_url", type=str, default="http://127.0.0.1:5000", help="URL base do tracker (default: http://127.0.0.1:5000)")
     parser.add_argument("--total_blocks", type=int, default=20, help="Número total de blocos do arquivo (default: 20)")
+    parser.add_argument("--download_dir", type=str, default="downloads", help="Diretório onde o arquivo é montado (default: downloads)")
+    parser.add_argument("--max_pendentes_por_peer", type=int, default=4, help="Requisições de bloco simultâneas por peer remoto (default: 4)")
+    parser.add_argument("--max_pendentes_total", type=int, default=16, help="Requisições de bloco simultâneas no total (default: 16)")
+    parser.add_argument("--tamanho_pedaco", type=inteiro_positivo, default=TAMANHO_PEDACO_PADRAO, help="Tamanho dos pedaços em que cada bloco é pedido; pedaços do mesmo bloco podem vir de peers diferentes (default: 4 KiB)")
+    parser.add_argument("--limiar_endgame", type=int, default=4, help="Com quantos blocos faltando o peer entra no modo endgame, pedindo cada pedaço a todos os detentores (0 desliga; default: 4)")
+    parser.add_argument("--asyncio", action="store_true", help="Usa o transporte P2P asyncio (um event loop) em vez de uma thread por conexão")
+    parser.add_argument("--manifesto", type=str, default=None, help="Arquivo JSON do manifesto (default: obtido do tracker em /manifesto)")
+    parser.add_argument("--verificar_arquivo", action="store_true", help="Reverifica todo o arquivo já existente em disco ao iniciar (ignora o estado de retomada), usando todos os núcleos")
+    parser.add_argument("--max_peers", type=int, default=50, help="Máximo de vizinhos pedidos ao tracker (numwant) e mantidos (default: 50)")
+    parser.add_argument("--max_mensagem_bytes", type=int, default=P2PCommunication.MAX_MESSAGE_BYTES, help="Maior mensagem P2P aceita, em bytes (default: 16 MiB)")
+    parser.add_argument("--metricas_porta", type=int, default=None, help="Porta HTTP local com as métricas do peer em /metrics (default: desligado)")
+    parser.add_argument("--log_nivel", type=str, default="INFO", help="Nível de log geral (default: INFO)")
+    parser.add_argument("--log", type=str, default="", help="Níveis por subsistema, ex.: p2p=DEBUG,download=WARNING (subsistemas: p2p, download, tracker, contadores)")
 
     args = parser.parse_args()
 
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    configurar_log_peer(args.log_nivel, args.log, formato=f"[{args.id}] %(asctime)s - %(levelname)s - %(message)s")
 
     peer = PeerNode(
         peer_id=args.id,
         tracker_url=args.tracker_url,
         port=args.port,
-        total_blocks=args.total_blocks
+        total_blocks=args.total_blocks,
+        download_dir=args.download_dir,
+        max_pendentes_por_peer=args.max_pendentes_por_peer,
+        max_pendentes_total=args.max_pendentes_total,
+        usar_asyncio=args.asyncio,
+        max_mensagem_bytes=args.max_mensagem_bytes,
+        manifesto_path=args.manifesto,
+        verificar_arquivo=args.verificar_arquivo,
+        max_peers=args.max_peers,
+        porta_metricas=args.metricas_porta,
+        tamanho_pedaco=args.tamanho_pedaco,
+        limiar_endgame=args.limiar_endgame
     )
     peer.start()
 
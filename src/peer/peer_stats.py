@@ -0,0 +1,118 @@
+import random
+import time
+from threading import Lock
+
+
+class _Estimativa:
+    __slots__ = ("srtt", "rttvar", "vazao", "falhas_seguidas", "timeouts_seguidos", "suspenso_ate")
+
+    def __init__(self):
+        self.srtt: float | None = None # tempo de resposta suavizado (s)
+        self.rttvar = 0.0 # variação do tempo de resposta (s)
+        self.vazao: float | None = None # bytes/s suavizado
+        self.falhas_seguidas = 0
+        self.timeouts_seguidos = 0
+        self.suspenso_ate = 0.0
+
+
+class EstatisticasPeers:
+    """
+    Estimativas de desempenho de cada peer remoto, atualizadas a cada resposta.
+
+    O tempo de resposta segue o estimador do TCP (RFC 6298): média móvel
+    exponencial (EWMA) do tempo e da sua variação, e timeout = srtt + 4 * rttvar,
+    dobrado a cada timeout seguido e limitado a [timeout_min_s, timeout_max_s].
+    A vazão (bytes/s) também é uma EWMA e serve de peso para escolher entre os
+    detentores de um bloco: peers rápidos são preferidos, e peers ainda sem
+    medida recebem o peso do melhor conhecido, para serem experimentados.
+    Depois de limite_falhas falhas seguidas o peer fica suspenso por um tempo que
+    dobra a cada nova falha (até espera_max_s); uma resposta boa zera a contagem.
+    'aleatorio' é o gerador usado nos sorteios (um random.Random com semente nos testes).
+    """
+    def __init__(self, timeout_inicial_s: float = 5.0, timeout_min_s: float = 0.5, timeout_max_s: float = 10.0,
+                 alfa: float = 0.125, beta: float = 0.25, peso_vazao: float = 0.3,
+                 limite_falhas: int = 3, espera_base_s: float = 1.0, espera_max_s: float = 16.0,
+                 aleatorio: random.Random | None = None):
+        self.timeout_inicial_s = timeout_inicial_s
+        self.timeout_min_s = timeout_min_s
+        self.timeout_max_s = timeout_max_s
+        self.alfa = alfa
+        self.beta = beta
+        self.peso_vazao = peso_vazao
+        self.limite_falhas = limite_falhas
+        self.espera_base_s = espera_base_s
+        self.espera_max_s = espera_max_s
+        self._aleatorio = aleatorio if aleatorio is not None else random.Random()
+        self._peers: dict[str, _Estimativa] = {}
+        self._lock = Lock()
+
+    def registrar_sucesso(self, peer_id: str, tempo_s: float, num_bytes: int):
+        """Uma resposta completa com num_bytes chegou tempo_s segundos depois do pedido."""
+        with self._lock:
+            estimativa = self._peers.setdefault(peer_id, _Estimativa())
+            if estimativa.srtt is None:
+                estimativa.srtt, estimativa.rttvar = tempo_s, tempo_s / 2
+            else:
+                estimativa.rttvar += self.beta * (abs(estimativa.srtt - tempo_s) - estimativa.rttvar)
+                estimativa.srtt += self.alfa * (tempo_s - estimativa.srtt)
+            vazao = num_bytes / max(tempo_s, 1e-6)
+            if estimativa.vazao is None:
+                estimativa.vazao = vazao
+            else:
+                estimativa.vazao += self.peso_vazao * (vazao - estimativa.vazao)
+            estimativa.falhas_seguidas = 0
+            estimativa.timeouts_seguidos = 0
+            estimativa.suspenso_ate = 0.0
+
+    def registrar_falha(self, peer_id: str, por_timeout: bool = False):
+        """Timeout, recusa, bloco indisponível ou dados que não conferem; só o timeout aumenta o prazo."""
+        with self._lock:
+            estimativa = self._peers.setdefault(peer_id, _Estimativa())
+            estimativa.falhas_seguidas += 1
+            if por_timeout:
+                estimativa.timeouts_seguidos += 1
+            excesso = estimativa.falhas_seguidas - self.limite_falhas
+            if excesso >= 0:
+                espera = min(self.espera_max_s, self.espera_base_s * 2 ** excesso)
+                estimativa.suspenso_ate = time.monotonic() + espera
+
+    def timeout(self, peer_id: str) -> float:
+        """Prazo para a próxima requisição a peer_id."""
+        with self._lock:
+            estimativa = self._peers.get(peer_id)
+            if estimativa is None or estimativa.srtt is None:
+                base = self.timeout_inicial_s
+            else:
+                base = max(self.timeout_min_s, estimativa.srtt + 4 * estimativa.rttvar)
+            timeouts = estimativa.timeouts_seguidos if estimativa is not None else 0
+            return min(self.timeout_max_s, base * 2 ** min(timeouts, 4))
+
+    def disponivel(self, peer_id: str, agora: float) -> bool:
+        """False enquanto o peer estiver suspenso por falhas seguidas ('agora' em time.monotonic())."""
+        estimativa = self._peers.get(peer_id)
+        return estimativa is None or estimativa.suspenso_ate <= agora
+
+    def escolher(self, candidatos: list[str]) -> str:
+        """Sorteia um dos candidatos com peso proporcional à vazão estimada."""
+        if len(candidatos) == 1:
+            return candidatos[0]
+        with self._lock:
+            vazoes = [self._peers[pid].vazao if pid in self._peers else None for pid in candidatos]
+        conhecidas = [vazao for vazao in vazoes if vazao]
+        otimista = max(conhecidas) if conhecidas else 1.0
+        pesos = [vazao if vazao else otimista for vazao in vazoes]
+        return self._aleatorio.choices(candidatos, weights=pesos)[0]
+
+    def esquecer(self, peer_id: str):
+        """Descarta as estimativas de um peer que saiu da vizinhança."""
+        with self._lock:
+            self._peers.pop(peer_id, None)
+
+    def resumo(self) -> dict[str, tuple[float, float]]:
+        """peer_id -> (srtt em s, vazão em bytes/s) dos peers já medidos, para as métricas."""
+        with self._lock:
+            return {
+                peer_id: (estimativa.srtt, estimativa.vazao)
+                for peer_id, estimativa in self._peers.items()
+                if estimativa.srtt is not None
+            }
@@ -0,0 +1,107 @@
+import json
+import os
+import struct
+
+from src.common.bitfield import Bitfield
+from src.peer.peer_log import log_download
+
+
+class EstadoRetomada:
+    """
+    Estado de retomada gravado ao lado do arquivo de dados.
+
+    - '<arquivo>.estado': checkpoint em JSON com o Bitfield dos blocos já
+      gravados e conferidos, substituído de forma atômica (arquivo temporário
+      + os.replace) depois de um flush do mapeamento.
+    - '<arquivo>.diario': os ids ('>I') dos blocos gravados desde o último
+      checkpoint. Esses blocos podem não ter chegado ao disco se o processo
+      caiu, então só eles precisam ser conferidos de novo ao retomar.
+    """
+    FORMATO_ID = struct.Struct('>I')
+
+    def __init__(self, caminho_dados: str, total_blocos: int, tamanho_bloco: int,
+                 identificador_manifesto: str | None = None, blocos_por_checkpoint: int = 64):
+        self.caminho_estado = caminho_dados + ".estado"
+        self.caminho_diario = caminho_dados + ".diario"
+        self.total_blocos = total_blocos
+        self.tamanho_bloco = tamanho_bloco
+        self.identificador_manifesto = identificador_manifesto
+        self.blocos_por_checkpoint = blocos_por_checkpoint
+        self._diario = None
+        self._entradas_no_diario = 0
+
+    def carregar(self) -> tuple[Bitfield, list[int]] | None:
+        """
+        Lê o checkpoint e o diário. Retorna (blocos_confirmados, blocos_incertos),
+        ou None se não há estado utilizável (ausente, corrompido ou de outro arquivo).
+        """
+        try:
+            with open(self.caminho_estado, encoding="utf-8") as f:
+                estado = json.load(f)
+            if estado.get("total_blocos") != self.total_blocos or estado.get("tamanho_bloco") != self.tamanho_bloco:
+                log_download.warning("Estado de retomada %s é de outro arquivo. Ignorado.", self.caminho_estado)
+                return None
+            manifesto_salvo = estado.get("manifesto")
+            if manifesto_salvo and self.identificador_manifesto and manifesto_salvo != self.identificador_manifesto:
+                log_download.warning("Estado de retomada %s não corresponde ao manifesto. Ignorado.", self.caminho_estado)
+                return None
+            confirmados = Bitfield.from_base64(estado["bitfield"], self.total_blocos)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            log_download.warning("Estado de retomada %s ilegível (%s). Ignorado.", self.caminho_estado, e)
+            return None
+        return confirmados, self._ler_diario()
+
+    def _ler_diario(self) -> list[int]:
+        try:
+            with open(self.caminho_diario, "rb") as f:
+                dados = f.read()
+        except FileNotFoundError:
+            return []
+        # Um registro incompleto no fim (queda no meio da escrita) é descartado
+        tamanho = self.FORMATO_ID.size
+        return [
+            self.FORMATO_ID.unpack_from(dados, i)[0]
+            for i in range(0, len(dados) - len(dados) % tamanho, tamanho)
+        ]
+
+    def registrar_bloco(self, block_id: int) -> bool:
+        """
+        Anota no diário um bloco recém-gravado.
+        Retorna True quando já é hora de um checkpoint.
+        """
+        if self._diario is None:
+            self._diario = open(self.caminho_diario, "ab")
+        self._diario.write(self.FORMATO_ID.pack(block_id))
+        self._diario.flush()
+        self._entradas_no_diario += 1
+        return self._entradas_no_diario >= self.blocos_por_checkpoint
+
+    def checkpoint(self, blocos: Bitfield):
+        """
+        Grava o Bitfield como novo checkpoint e zera o diário. Chame depois do flush
+        dos dados: tudo que está em 'blocos' precisa já estar no disco.
+        """
+        estado = {
+            "total_blocos": self.total_blocos,
+            "tamanho_bloco": self.tamanho_bloco,
+            "manifesto": self.identificador_manifesto,
+            "bitfield": blocos.to_base64(),
+        }
+        temporario = self.caminho_estado + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(estado, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.caminho_estado)
+
+        if self._diario is not None:
+            self._diario.close()
+        self._diario = open(self.caminho_diario, "wb")
+        self._entradas_no_diario = 0
+
+    def fechar(self):
+        if self._diario is not None:
+            self._diario.close()
+            self._diario = None
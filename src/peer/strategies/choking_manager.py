@@ -4,7 +4,6 @@ import time
 import logging 
 from typing import Optional, Set, List, Dict
 from . import tit_for_tat_strategy
-from . import rarest_first 
 
 class ChokingManager:
     """
@@ -27,6 +26,9 @@ class ChokingManager:
         
         self.ultimo_timestamp_optimistic: float = 0.0 # para o primeiro ciclo rodar logo
 
+        # quantos peers ja passaram a ser atendidos (unchoke) ou deixaram de ser (choke), para as metricas
+        self.transicoes: dict[str, int] = {"unchoke": 0, "choke": 0}
+
         # print(f"info: ChokingManager para {meu_peer_id} iniciado.")
 
     def peer_entrou_na_rede(self, peer_id: str):
@@ -58,7 +60,8 @@ class ChokingManager:
     def executar_ciclo_unchoking(self, timestamp_atual: float, 
                                  mapa_de_blocos_global: Dict[str, Set[int]], 
                                  meus_blocos: Set[int], 
-                                 todos_os_blocos_do_arquivo: Set[int]):
+                                 todos_os_blocos_do_arquivo: Set[int],
+                                 indice_raridade=None):
         
         
 
@@ -92,11 +95,16 @@ class ChokingManager:
             mapa_de_blocos_global=mapa_de_blocos_global,
             meus_blocos=meus_blocos,
             todos_os_blocos_do_arquivo=todos_os_blocos_do_arquivo,
-            meu_peer_id=self.meu_peer_id
+            meu_peer_id=self.meu_peer_id,
+            indice_raridade=indice_raridade # mesmo indice usado pelo rarest first, sem recontar
         )
 
+        unchoked_antes = self.get_peers_unchoked_por_mim()
         self.peers_fixos_unchoked = novos_fixos
         self.peer_optimistic_unchoked = novo_optimistic_final
+        unchoked_depois = self.get_peers_unchoked_por_mim()
+        self.transicoes["unchoke"] += len(unchoked_depois - unchoked_antes)
+        self.transicoes["choke"] += len(unchoked_antes - unchoked_depois)
         
         logging.info(f"{self.meu_peer_id}: Unchoked fixos: {self.peers_fixos_unchoked}, Optimista: {self.peer_optimistic_unchoked}")
 
@@ -0,0 +1,189 @@
+import bisect
+import random
+from threading import RLock
+from typing import Iterable, Iterator, Optional, Set, Dict, List
+
+from src.common.bitfield import Bitfield
+
+
+class RarityIndex:
+    """
+    indice incremental de disponibilidade dos blocos entre os peers vizinhos.
+
+    em vez de recontar bloco x peer a cada decisao, o indice eh atualizado quando
+    o inventario de um peer muda (entrou, saiu, anunciou bloco). os blocos que
+    ainda nos faltam ficam agrupados em 'baldes' pela quantidade de peers que os
+    possuem. cada balde eh uma lista com remocao por troca com o ultimo (a posicao
+    de cada bloco fica em _posicao), entao sortear o mais raro eh O(1) e percorrer
+    em ordem de raridade so custa o que for consumido: os empates sao sorteados
+    sob demanda (fisher-yates preguicoso), sem copiar nem embaralhar o balde todo.
+
+    eh compartilhado pelo rarest first (download) e pelo tit-for-tat (choking).
+    o inventario de cada peer eh guardado como Bitfield, entao a diferenca entre
+    o inventario antigo e o novo sai de operacoes de bits.
+    """
+    def __init__(self, todos_os_blocos_do_arquivo: Iterable[int], meus_blocos: Iterable[int] = ()):
+        self._lock = RLock()
+        todos = list(todos_os_blocos_do_arquivo)
+        self._tamanho = max(todos) + 1 if todos else 0
+        self._blocos_por_peer: Dict[str, Bitfield] = {}
+        self._num_peers_com_blocos = 0
+        # bloco -> peers vizinhos que possuem o bloco
+        self._detentores: Dict[int, Set[str]] = {bloco: set() for bloco in todos}
+        self._meus_blocos: Set[int] = set(meus_blocos)
+        # contagem -> blocos que nos faltam com essa disponibilidade (so contagem > 0)
+        self._baldes: Dict[int, List[int]] = {}
+        # bloco -> indice dele na lista do seu balde
+        self._posicao: Dict[int, int] = {}
+        # contagens com balde nao vazio, sempre ordenadas (a primeira eh a mais rara)
+        self._contagens_ativas: List[int] = []
+
+    # --- manutencao dos baldes ---
+
+    def _tirar_do_balde(self, bloco: int, contagem: int):
+        balde = self._baldes.get(contagem)
+        posicao = self._posicao.get(bloco)
+        if balde is None or posicao is None or posicao >= len(balde) or balde[posicao] != bloco:
+            return
+        del self._posicao[bloco]
+        # o ultimo do balde ocupa o lugar do removido: O(1), sem deslocar a lista
+        ultimo = balde.pop()
+        if ultimo != bloco:
+            balde[posicao] = ultimo
+            self._posicao[ultimo] = posicao
+        if not balde:
+            del self._baldes[contagem]
+            indice = bisect.bisect_left(self._contagens_ativas, contagem)
+            del self._contagens_ativas[indice]
+
+    def _por_no_balde(self, bloco: int, contagem: int):
+        if contagem <= 0 or bloco in self._meus_blocos:
+            return
+        balde = self._baldes.get(contagem)
+        if balde is None:
+            balde = self._baldes[contagem] = []
+            bisect.insort(self._contagens_ativas, contagem)
+        self._posicao[bloco] = len(balde)
+        balde.append(bloco)
+
+    def _sortear_do_balde(self, contagem: int) -> Iterator[int]:
+        """
+        percorre o balde em ordem aleatoria sem copia-lo: fisher-yates preguicoso,
+        com as trocas guardadas num dicionario, entao cada bloco sorteado custa O(1).
+        o lock so eh segurado a cada sorteio; se o balde mudar no meio, um bloco
+        pode ser pulado (volta na proxima consulta), mas nunca eh repetido.
+        """
+        trocas: Dict[int, int] = {}
+        sorteados: Set[int] = set()
+        i = 0
+        while True:
+            with self._lock:
+                balde = self._baldes.get(contagem, ())
+                if i >= len(balde):
+                    return
+                j = random.randrange(i, len(balde))
+                escolhido = trocas.get(j, j)
+                trocas[j] = trocas.get(i, i)
+                bloco = balde[escolhido] if escolhido < len(balde) else None
+            i += 1
+            if bloco is not None and bloco not in sorteados:
+                sorteados.add(bloco)
+                yield bloco
+
+    def _mudar_detentor(self, bloco: int, peer_id: str, possui: bool):
+        detentores = self._detentores.get(bloco)
+        if detentores is None:
+            return # bloco fora do arquivo
+        contagem_antiga = len(detentores)
+        if possui:
+            detentores.add(peer_id)
+        else:
+            detentores.discard(peer_id)
+        contagem_nova = len(detentores)
+        if contagem_nova != contagem_antiga:
+            self._tirar_do_balde(bloco, contagem_antiga)
+            self._por_no_balde(bloco, contagem_nova)
+
+    # --- atualizacoes vindas do PeerNode ---
+
+    def atualizar_peer(self, peer_id: str, blocos: Iterable[int]):
+        """substitui o inventario conhecido de um peer, aplicando so a diferenca"""
+        with self._lock:
+            antigos = self._blocos_por_peer.get(peer_id) or Bitfield(self._tamanho)
+            novos = Bitfield.de(blocos, self._tamanho).copy()
+            for bloco in antigos - novos:
+                self._mudar_detentor(bloco, peer_id, False)
+            for bloco in novos - antigos:
+                self._mudar_detentor(bloco, peer_id, True)
+            self._num_peers_com_blocos += bool(novos) - bool(antigos)
+            self._blocos_por_peer[peer_id] = novos
+
+    def adicionar_bloco_peer(self, peer_id: str, bloco: int):
+        """um peer anunciou que agora possui 'bloco'"""
+        with self._lock:
+            blocos = self._blocos_por_peer.setdefault(peer_id, Bitfield(self._tamanho))
+            if bloco not in blocos:
+                if not blocos:
+                    self._num_peers_com_blocos += 1
+                blocos.add(bloco)
+                self._mudar_detentor(bloco, peer_id, True)
+
+    def remover_peer(self, peer_id: str):
+        """o peer saiu da rede: seus blocos deixam de contar"""
+        with self._lock:
+            blocos = self._blocos_por_peer.pop(peer_id, None) or Bitfield(self._tamanho)
+            if blocos:
+                self._num_peers_com_blocos -= 1
+            for bloco in blocos:
+                self._mudar_detentor(bloco, peer_id, False)
+
+    def marcar_meu_bloco(self, bloco: int):
+        """o nosso peer obteve 'bloco': ele sai dos candidatos a download"""
+        with self._lock:
+            if bloco in self._meus_blocos:
+                return
+            self._meus_blocos.add(bloco)
+            detentores = self._detentores.get(bloco)
+            if detentores:
+                self._tirar_do_balde(bloco, len(detentores))
+
+    # --- consultas ---
+
+    def disponibilidade(self, bloco: int) -> int:
+        """quantos peers vizinhos possuem o bloco"""
+        with self._lock:
+            return len(self._detentores.get(bloco, ()))
+
+    def detentores(self, bloco: int) -> Set[str]:
+        """copia do conjunto de peers vizinhos que possuem o bloco"""
+        with self._lock:
+            return set(self._detentores.get(bloco, ()))
+
+    def num_peers_com_blocos(self) -> int:
+        """quantos peers vizinhos tem pelo menos um bloco"""
+        return self._num_peers_com_blocos
+
+    def escolher_mais_raro(self, excluir: Set[int] = frozenset()) -> Optional[int]:
+        """
+        escolhe aleatoriamente um dos blocos que nos faltam com menor disponibilidade (> 0),
+        ignorando os blocos em 'excluir'. retorna None se nao houver nenhum.
+        """
+        with self._lock:
+            for contagem in self._contagens_ativas:
+                if not excluir:
+                    return random.choice(self._baldes[contagem])
+                for bloco in self._sortear_do_balde(contagem):
+                    if bloco not in excluir:
+                        return bloco
+            return None
+
+    def blocos_por_raridade(self) -> Iterator[int]:
+        """
+        percorre os blocos que nos faltam e que algum vizinho possui, do mais raro
+        para o mais comum (empates em ordem aleatoria). o custo eh proporcional ao
+        que for consumido do iterador.
+        """
+        with self._lock:
+            contagens = list(self._contagens_ativas)
+        for contagem in contagens:
+            yield from self._sortear_do_balde(contagem)
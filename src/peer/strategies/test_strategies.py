@@ -2,7 +2,7 @@ import time
 import random
 
 # Imports dos nossos modulos de estrategia usando import relativo
-from .rarest_first import escolher_bloco_mais_raro
+from .rarity_index import RarityIndex
 from .tit_for_tat_strategy import (_calcular_pontuacao_de_raridade_do_peer,
                                    selecionar_candidato_optimistic_aleatorio,
                                    avaliar_e_atualizar_listas_unchoked)
@@ -58,42 +58,83 @@ def run_test(test_function):
         print("")
 
 
-# --- Testes para rarest_first.py ---
+# --- Testes do rarest first (RarityIndex.escolher_mais_raro) ---
+def _indice_rf(meus_blocos, todos_blocos, mapa_peers):
+    indice = RarityIndex(todos_blocos, meus_blocos=meus_blocos)
+    for pid, blocos in mapa_peers.items():
+        indice.atualizar_peer(pid, blocos)
+    return indice
+
 def teste_rf_ja_tem_tudo():
-    meus_blocos = {0, 1, 2}
-    todos_blocos = {0, 1, 2}
-    mapa_peers = {'peerA': {0,1}}
-    resultado = escolher_bloco_mais_raro(meus_blocos, todos_blocos, mapa_peers)
+    indice = _indice_rf({0, 1, 2}, {0, 1, 2}, {'peerA': {0,1}})
+    resultado = indice.escolher_mais_raro()
     assert resultado is None, "Deveria ser None, ja que tenho todos os blocos"
 
 def teste_rf_nenhum_bloco_necessario_disponivel():
-    meus_blocos = {0}
-    todos_blocos = {0, 1, 2}
-    mapa_peers = {'peerA': {0}}
-    resultado = escolher_bloco_mais_raro(meus_blocos, todos_blocos, mapa_peers)
+    indice = _indice_rf({0}, {0, 1, 2}, {'peerA': {0}})
+    resultado = indice.escolher_mais_raro()
     assert resultado is None, "Deveria ser None, nenhum bloco necessario esta disponivel"
 
 def teste_rf_um_bloco_claramente_raro():
-    meus_blocos = set()
-    todos_blocos = {0, 1, 2}
-    mapa_peers = {'peerA': {0, 1}, 'peerB': {0, 1}, 'peerC': {0, 2}}
-    resultado = escolher_bloco_mais_raro(meus_blocos, todos_blocos, mapa_peers)
+    indice = _indice_rf(set(), {0, 1, 2}, {'peerA': {0, 1}, 'peerB': {0, 1}, 'peerC': {0, 2}})
+    resultado = indice.escolher_mais_raro()
     assert resultado == 2, f"Deveria escolher o bloco 2 (mais raro), mas escolheu {resultado}"
 
 def teste_rf_empate_na_raridade():
-    meus_blocos = set()
-    todos_blocos = {0, 1, 2, 3}
-    mapa_peers = {'peerA': {0, 3}, 'peerB': {1, 3}}
-    resultado = escolher_bloco_mais_raro(meus_blocos, todos_blocos, mapa_peers)
+    indice = _indice_rf(set(), {0, 1, 2, 3}, {'peerA': {0, 3}, 'peerB': {1, 3}})
+    resultado = indice.escolher_mais_raro()
     assert resultado in [0, 1], f"Deveria escolher 0 ou 1 (empate de raridade), mas escolheu {resultado}"
 
 def teste_rf_sem_peers_conhecidos():
-    meus_blocos = {0}
-    todos_blocos = {0, 1, 2}
-    mapa_peers = {}
-    resultado = escolher_bloco_mais_raro(meus_blocos, todos_blocos, mapa_peers)
+    indice = _indice_rf({0}, {0, 1, 2}, {})
+    resultado = indice.escolher_mais_raro()
     assert resultado is None, "Deveria ser None, nao ha peers conhecidos"
 
+# --- Testes para rarity_index.py ---
+def teste_ri_mais_raro_e_ordem_de_raridade():
+    indice = RarityIndex({0, 1, 2, 3, 4}, meus_blocos={3})
+    indice.atualizar_peer('peerA', {0, 1, 3})
+    indice.atualizar_peer('peerB', {0, 1})
+    indice.atualizar_peer('peerC', {0, 2})
+    # bloco 2 (1 peer), bloco 1 (2 peers), bloco 0 (3 peers); 3 eu ja tenho e 4 ninguem tem
+    assert indice.escolher_mais_raro() == 2, "Bloco 2 deveria ser o mais raro"
+    ordem = list(indice.blocos_por_raridade())
+    assert ordem == [2, 1, 0], f"Esperado [2, 1, 0], obteve {ordem}"
+
+def teste_ri_atualizacoes_incrementais():
+    indice = RarityIndex({0, 1, 2})
+    indice.atualizar_peer('peerA', {0, 1})
+    indice.adicionar_bloco_peer('peerB', 0)
+    assert indice.disponibilidade(0) == 2 and indice.disponibilidade(1) == 1
+    assert indice.num_peers_com_blocos() == 2
+    indice.remover_peer('peerA')
+    assert indice.disponibilidade(0) == 1 and indice.disponibilidade(1) == 0
+    assert indice.detentores(0) == {'peerB'}
+    indice.marcar_meu_bloco(0)
+    assert indice.escolher_mais_raro() is None, "Nao falta mais nenhum bloco disponivel"
+    assert indice.escolher_mais_raro(excluir={0}) is None
+
+def teste_ri_baldes_apos_remocoes():
+    indice = RarityIndex(range(6))
+    indice.atualizar_peer('peerA', range(6))
+    indice.marcar_meu_bloco(0)
+    indice.marcar_meu_bloco(3)
+    indice.adicionar_bloco_peer('peerB', 5)
+    # remocoes por troca com o ultimo nao podem perder nem repetir blocos
+    ordem = list(indice.blocos_por_raridade())
+    assert ordem[-1] == 5 and sorted(ordem) == [1, 2, 4, 5], f"Ordem inesperada: {ordem}"
+    assert indice.escolher_mais_raro(excluir={1, 2}) == 4
+
+def teste_ri_mesma_pontuacao_t4t_com_e_sem_indice():
+    mapa = {"peerA": {0, 2}, "peerB": {1, 2}}
+    todos_b = {0, 1, 2, 3}
+    indice = RarityIndex(todos_b)
+    for pid, blocos in mapa.items():
+        indice.atualizar_peer(pid, blocos)
+    sem_indice = _calcular_pontuacao_de_raridade_do_peer("peerA", mapa, todos_b, MEU_PEER_ID_TESTE)
+    com_indice = _calcular_pontuacao_de_raridade_do_peer("peerA", mapa, todos_b, MEU_PEER_ID_TESTE, indice_raridade=indice)
+    assert sem_indice == com_indice == 1, f"Esperado 1 nos dois casos, obteve {sem_indice} e {com_indice}"
+
 # --- Testes para tit_for_tat_strategy.py ---
 MEU_PEER_ID_TESTE = "test_peer_me"
 
@@ -234,6 +275,10 @@ todos_os_testes_definidos = [
     teste_rf_um_bloco_claramente_raro,
     teste_rf_empate_na_raridade,
     teste_rf_sem_peers_conhecidos,
+    teste_ri_mais_raro_e_ordem_de_raridade,
+    teste_ri_atualizacoes_incrementais,
+    teste_ri_baldes_apos_remocoes,
+    teste_ri_mesma_pontuacao_t4t_com_e_sem_indice,
     teste_t4t_pontuacao_peer_com_blocos_raros,
     teste_t4t_pontuacao_peer_com_blocos_comuns,
     teste_t4t_seleciona_optimistic_com_candidatos,
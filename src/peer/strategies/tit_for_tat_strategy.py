@@ -4,12 +4,15 @@ def _calcular_pontuacao_de_raridade_do_peer(
         peer_id_avaliado: str,
         mapa_de_blocos_global: dict[str, set[int]],
         todos_os_blocos_do_arquivo: set[int],
-        meu_peer_id: str) -> int:
+        meu_peer_id: str,
+        indice_raridade=None) -> int:
     """
     calcula uma pontuacao para um peer com base em quantos blocos 'raros' ele possui.
     um bloco eh considerado raro se estiver presente em poucos peers na rede.
 
     a pontuacao eh simplesmente a contagem de blocos raros que o peer possui.
+    se 'indice_raridade' (RarityIndex) for passado, a frequencia dos blocos vem
+    dele em vez de ser recalculada a partir do mapa global.
     """
     if peer_id_avaliado not in mapa_de_blocos_global:
         return 0 # peer desconhecido ou sem blocos informados
@@ -18,6 +21,17 @@ def _calcular_pontuacao_de_raridade_do_peer(
     if not blocos_do_peer_avaliado:
         return 0 # peer nao tem nenhum bloco
 
+    if indice_raridade is not None:
+        num_total_peers_com_info = indice_raridade.num_peers_com_blocos()
+        if num_total_peers_com_info == 0:
+            return 0
+        limiar_contagem_raro = max(1, int(num_total_peers_com_info * 0.3))
+        # blocos fora do arquivo tem disponibilidade 0 no indice e nao contam como raros
+        return sum(
+            1 for bloco_id in blocos_do_peer_avaliado
+            if 0 < indice_raridade.disponibilidade(bloco_id) <= limiar_contagem_raro
+        )
+
     # passo 1: calcular a frequencia de cada bloco na rede (quantos peers tem cada bloco)
     frequencia_blocos: dict[int, int] = {bloco_id: 0 for bloco_id in todos_os_blocos_do_arquivo}
     num_total_peers_com_info = 0
@@ -87,7 +101,8 @@ def avaliar_e_atualizar_listas_unchoked(
         mapa_de_blocos_global: dict[str, set[int]], # info de blocos de todos os peers
         meus_blocos: set[int], # meus blocos (nao usado diretamente aqui, mas em _calcular_pontuacao)
         todos_os_blocos_do_arquivo: set[int], # todos os blocos possiveis do arquivo
-        meu_peer_id: str
+        meu_peer_id: str,
+        indice_raridade=None # RarityIndex compartilhado com o rarest first (opcional)
     ) -> tuple[list[str], str | None]:
     """
     avalia o 'peer_candidato_para_avaliacao' (normalmente o optimistic unchoke)
@@ -110,7 +125,8 @@ def avaliar_e_atualizar_listas_unchoked(
             peer_id_avaliado=peer_id,
             mapa_de_blocos_global=mapa_de_blocos_global,
             todos_os_blocos_do_arquivo=todos_os_blocos_do_arquivo, # Argumento correto
-            meu_peer_id=meu_peer_id
+            meu_peer_id=meu_peer_id,
+            indice_raridade=indice_raridade
         )
     
     # passo 2: ordenar os peers pela pontuacao (maior primeiro)
@@ -0,0 +1,112 @@
+from threading import Condition, Lock
+
+import requests
+
+from src.common.bitfield import Bitfield
+from src.peer.peer_log import contadores, log_tracker
+
+
+class AnunciadorTracker:
+    """
+    Anuncia ao tracker só os blocos novos, em lotes, via POST /anunciar.
+
+    Os blocos baixados se acumulam num Bitfield por uma janela curta e seguem
+    juntos num único anúncio numerado (seq). O tracker aplica cada anúncio
+    sobre o que já sabe do peer; se perceber um buraco na sequência (ou não
+    conhecer o peer), responde 409/404 e o peer se registra de novo com o
+    Bitfield completo. Um anúncio que falhou é reenviado exatamente igual, com o
+    mesmo seq, então uma repetição de algo que o tracker já aplicou (resposta
+    perdida) é inofensiva; os blocos que chegaram depois vão no seq seguinte.
+    """
+    def __init__(self, peer_node, janela_s: float = 0.5, timeout_s: float = 5.0):
+        self.peer_node = peer_node
+        self.janela_s = janela_s
+        self.timeout_s = timeout_s
+
+        # Protege o estado abaixo e acorda o loop quando há blocos a anunciar
+        self._cond = Condition()
+        self._pendentes = Bitfield(peer_node.total_blocks)
+        # Lote enviado com seq = self._seq + 1 e ainda sem confirmação (o envio falhou)
+        self._nao_confirmado: Bitfield | None = None
+        # Último seq aceito pelo tracker (0 = logo após o registro)
+        self._seq = 0
+        self._rodando = True
+        # Um anúncio por vez, para o seq não ser usado por dois envios
+        self._envio = Lock()
+
+    def anunciar(self, block_ids):
+        """Enfileira blocos recém-baixados para o próximo anúncio."""
+        with self._cond:
+            for block_id in block_ids:
+                self._pendentes.add(block_id)
+            self._cond.notify()
+
+    def reiniciar(self):
+        """Chamado após um registro completo: o tracker zera a sequência e já conhece todos os blocos."""
+        with self._cond:
+            self._seq = 0
+            self._pendentes = Bitfield(self.peer_node.total_blocks)
+            self._nao_confirmado = None
+
+    def executar(self):
+        """Loop: espera blocos, deixa a janela acumular outros e envia um anúncio só."""
+        while self._rodando:
+            with self._cond:
+                while self._rodando and not self._pendentes and self._nao_confirmado is None:
+                    self._cond.wait()
+                if not self._rodando:
+                    break
+                self._cond.wait(timeout=self.janela_s)
+            self.enviar_pendentes()
+
+    def parar(self):
+        """Encerra o loop, tentando enviar o que ainda estiver pendente."""
+        with self._cond:
+            self._rodando = False
+            self._cond.notify()
+        self.enviar_pendentes()
+
+    def enviar_pendentes(self) -> bool:
+        """Envia um anúncio com os blocos pendentes. Retorna True se não sobrou nada a anunciar."""
+        with self._envio:
+            # Depois de reenviar um lote que tinha falhado, os blocos novos seguem no seq seguinte
+            while self._enviar_pendentes():
+                with self._cond:
+                    if not self._pendentes:
+                        return True
+            return False
+
+    def _enviar_pendentes(self) -> bool:
+        with self._cond:
+            if self._nao_confirmado is not None:
+                # Talvez o tracker já o tenha aplicado: vai de novo igual, com o mesmo seq
+                lote = self._nao_confirmado
+            elif not self._pendentes:
+                return True
+            else:
+                lote, self._pendentes = self._pendentes, Bitfield(self.peer_node.total_blocks)
+                self._nao_confirmado = lote
+            seq = self._seq + 1
+
+        try:
+            response = requests.post(
+                f"{self.peer_node.tracker_url}/anunciar",
+                json={"peer_id": self.peer_node.id, "seq": seq, "blocks": list(lote)},
+                timeout=self.timeout_s
+            )
+            if response.status_code in (404, 409):
+                # O tracker perdeu o fio (reinício, remoção por inatividade, anúncio perdido)
+                log_tracker.warning("Tracker pediu o inventário completo (HTTP %d). Registrando de novo.", response.status_code)
+                self.peer_node._register_with_tracker()
+                return True
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            log_tracker.warning("Falha ao anunciar %d blocos ao tracker: %s", len(lote), e)
+            return False
+
+        with self._cond:
+            self._seq = seq
+            self._nao_confirmado = None
+        contadores.incrementar("anuncios")
+        log_tracker.debug("Anunciou %d blocos novos ao tracker (seq %d).", len(lote), seq)
+        return True
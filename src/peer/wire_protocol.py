@@ -0,0 +1,136 @@
+"""
+Formato binário das mensagens P2P.
+
+Toda mensagem começa com o mesmo cabeçalho de 9 bytes:
+
+    [tamanho '>I'][tipo 'B'][id de requisição '>I'][dados]
+
+'tamanho' conta tudo depois dele (tipo + id + dados). As requisições numeradas
+começam em 1; notificações (HANDSHAKE, BITFIELD, HAVE) usam o id 0 e não têm resposta.
+CANCEL também não tem resposta e leva no cabeçalho o id da requisição que cancela.
+Os dados de cada tipo são campos de tamanho fixo em big-endian:
+
+    HANDSHAKE     versão 'B', porta de escuta '>H', peer_id em UTF-8 (resto)
+    BITFIELD      bytes do Bitfield (bloco i no byte i // 8, bit i % 8)
+    HAVE          ids dos blocos, '>I' cada
+    REQUEST       bloco '>I', offset '>I', tamanho '>I' (0 = até o fim do bloco)
+    PIECE         bloco '>I', offset '>I', conteúdo (resto)
+    RECUSADO      bloco '>I' (quem pediu está choked)
+    INDISPONIVEL  bloco '>I' (o peer não tem o bloco)
+    CANCEL        sem dados (quem pediu não quer mais a resposta; ex.: endgame, prazo vencido)
+
+Quem abre a conexão manda o HANDSHAKE primeiro; o outro lado responde com o dele
+e com o seu BITFIELD. Depois disso o peer remoto é identificado pela conexão, e
+nenhuma mensagem precisa repetir o peer_id.
+"""
+
+import struct
+
+from src.common.bitfield import Bitfield
+
+VERSAO = 2
+
+HANDSHAKE = 0
+BITFIELD = 1
+HAVE = 2
+REQUEST = 3
+PIECE = 4
+RECUSADO = 5
+INDISPONIVEL = 6
+CANCEL = 7
+
+ID_NOTIFICACAO = 0
+
+# Tamanho da mensagem, tipo e id de requisição
+CABECALHO = struct.Struct('>IBI')
+# Parte do cabeçalho contada no campo 'tamanho' (tipo + id): o menor tamanho válido
+TAMANHO_MINIMO = CABECALHO.size - 4
+
+_HANDSHAKE = struct.Struct('>BH')
+_REQUEST = struct.Struct('>III')
+_PECA = struct.Struct('>II')
+_BLOCO = struct.Struct('>I')
+
+
+class ErroProtocolo(ValueError):
+    """Mensagem fora do protocolo (versão diferente, tipo desconhecido, campos truncados); a conexão é encerrada."""
+
+
+def empacotar(tipo: int, request_id: int, dados: bytes = b"") -> bytes:
+    return CABECALHO.pack(TAMANHO_MINIMO + len(dados), tipo, request_id) + dados
+
+
+def handshake(peer_id: str, porta: int) -> bytes:
+    return empacotar(HANDSHAKE, ID_NOTIFICACAO, _HANDSHAKE.pack(VERSAO, porta) + peer_id.encode('utf-8'))
+
+
+def ler_handshake(dados) -> tuple[str, int]:
+    """Retorna (peer_id, porta de escuta); porta 0 se o peer remoto não aceita conexões."""
+    if len(dados) <= _HANDSHAKE.size:
+        raise ErroProtocolo("handshake truncado")
+    versao, porta = _HANDSHAKE.unpack_from(dados)
+    if versao != VERSAO:
+        raise ErroProtocolo(f"versão de protocolo {versao} não suportada (esperada {VERSAO})")
+    return bytes(dados[_HANDSHAKE.size:]).decode('utf-8', errors='replace'), porta
+
+
+def bitfield(blocos: Bitfield) -> bytes:
+    return empacotar(BITFIELD, ID_NOTIFICACAO, blocos.to_bytes())
+
+
+def ler_bitfield(dados, total_blocos: int) -> Bitfield:
+    if len(dados) != (total_blocos + 7) // 8:
+        raise ErroProtocolo(f"bitfield com {len(dados)} bytes para {total_blocos} blocos")
+    return Bitfield.from_bytes(dados, total_blocos)
+
+
+def have(block_ids) -> bytes:
+    block_ids = list(block_ids)
+    return empacotar(HAVE, ID_NOTIFICACAO, struct.pack(f'>{len(block_ids)}I', *block_ids))
+
+
+def ler_have(dados) -> tuple[int, ...]:
+    if len(dados) % _BLOCO.size:
+        raise ErroProtocolo("HAVE truncado")
+    return struct.unpack(f'>{len(dados) // _BLOCO.size}I', dados)
+
+
+def cancelamento(request_id: int) -> bytes:
+    """CANCEL da requisição 'request_id'; quem atende descarta a resposta se ainda não a enviou."""
+    return empacotar(CANCEL, request_id)
+
+
+def requisicao(request_id: int, block_id: int, offset: int = 0, tamanho: int = 0) -> bytes:
+    return CABECALHO.pack(TAMANHO_MINIMO + _REQUEST.size, REQUEST, request_id) + _REQUEST.pack(block_id, offset, tamanho)
+
+
+def ler_requisicao(dados) -> tuple[int, int, int]:
+    """Retorna (bloco, offset, tamanho)."""
+    if len(dados) != _REQUEST.size:
+        raise ErroProtocolo("REQUEST com tamanho inválido")
+    return _REQUEST.unpack(dados)
+
+
+def cabecalho_peca(request_id: int, block_id: int, offset: int, tamanho_conteudo: int) -> bytes:
+    """Cabeçalho de um PIECE; o conteúdo é enviado logo depois, direto do arquivo."""
+    return (CABECALHO.pack(TAMANHO_MINIMO + _PECA.size + tamanho_conteudo, PIECE, request_id)
+            + _PECA.pack(block_id, offset))
+
+
+def ler_peca(dados) -> tuple[int, int, memoryview]:
+    """Retorna (bloco, offset, conteúdo); o conteúdo é uma visão de 'dados', sem cópia."""
+    if len(dados) < _PECA.size:
+        raise ErroProtocolo("PIECE truncado")
+    block_id, offset = _PECA.unpack_from(dados)
+    return block_id, offset, memoryview(dados)[_PECA.size:]
+
+
+def resposta_sem_conteudo(tipo: int, request_id: int, block_id: int) -> bytes:
+    """RECUSADO ou INDISPONIVEL para a requisição 'request_id'."""
+    return CABECALHO.pack(TAMANHO_MINIMO + _BLOCO.size, tipo, request_id) + _BLOCO.pack(block_id)
+
+
+def ler_bloco(dados) -> int:
+    if len(dados) != _BLOCO.size:
+        raise ErroProtocolo("resposta com tamanho inválido")
+    return _BLOCO.unpack(dados)[0]
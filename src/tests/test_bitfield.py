@@ -0,0 +1,48 @@
+import unittest
+
+from src.common.bitfield import Bitfield
+
+
+class TestBitfield(unittest.TestCase):
+    def test_comporta_se_como_conjunto(self):
+        bf = Bitfield(10, [0, 3, 9, 12])  # 12 fica fora do tamanho e é ignorado
+        self.assertEqual(list(bf), [0, 3, 9])
+        self.assertEqual(len(bf), 3)
+        self.assertIn(3, bf)
+        self.assertNotIn(4, bf)
+        self.assertNotIn(12, bf)
+        bf.add(4)
+        bf.discard(0)
+        bf.discard(-1)  # fora do tamanho: sem efeito, como o add
+        self.assertEqual(bf, {3, 4, 9})
+        # Mutável: não pode ser chave de dict nem item de set
+        with self.assertRaises(TypeError):
+            hash(bf)
+
+    def test_operacoes(self):
+        a = Bitfield(8, {0, 1, 2})
+        b = Bitfield(8, {2, 3})
+        self.assertEqual(a | b, {0, 1, 2, 3})
+        self.assertEqual(a & b, {2})
+        self.assertEqual(a - b, {0, 1})
+        self.assertEqual(Bitfield.cheio(8) - a, {3, 4, 5, 6, 7})
+        self.assertEqual({0, 5} - a, {5})
+        self.assertEqual(a.contar_faltantes_em(b), 1)
+        self.assertTrue(Bitfield(8, {1}).issubset(a))
+        self.assertTrue(Bitfield.cheio(8).completo())
+
+    def test_base64_ida_e_volta(self):
+        bf = Bitfield(100001, range(0, 100001, 7))
+        copia = Bitfield.from_base64(bf.to_base64(), 100001)
+        self.assertEqual(copia, bf)
+        self.assertEqual(len(bf.to_bytes()), 12501)
+
+    def test_contar_por_bloco(self):
+        bitfields = [Bitfield(70, range(0, 70, k)) for k in range(1, 12)]
+        esperado = [sum(bloco in bf for bf in bitfields) for bloco in range(70)]
+        self.assertEqual(Bitfield.contar_por_bloco(bitfields, 70), esperado)
+        self.assertEqual(Bitfield.contar_por_bloco([], 5), [0] * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+
+from src.peer.block_storage import ArmazenamentoBlocos
+
+
+class TestArmazenamentoBlocos(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.dir.name, "peer", "arquivo.bin")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_prealoca_e_escreve_na_posicao_do_bloco(self):
+        armazenamento = ArmazenamentoBlocos(self.caminho, total_blocos=4, tamanho_bloco=8, tamanho_arquivo=30)
+        self.assertEqual(os.path.getsize(self.caminho), 30)
+        self.assertEqual(armazenamento.tamanho_do_bloco(3), 6)
+
+        self.assertTrue(armazenamento.escrever_bloco(1, b"B" * 8))
+        self.assertTrue(armazenamento.escrever_bloco(3, b"D" * 6))
+        self.assertFalse(armazenamento.escrever_bloco(0, b"curto"))
+        self.assertEqual(bytes(armazenamento.ler_bloco(1)), b"B" * 8)
+        armazenamento.fechar()
+
+        with open(self.caminho, "rb") as f:
+            conteudo = f.read()
+        self.assertEqual(conteudo[8:16], b"B" * 8)
+        self.assertEqual(conteudo[24:], b"D" * 6)
+
+    def test_reabre_arquivo_existente_sem_perder_dados(self):
+        armazenamento = ArmazenamentoBlocos(self.caminho, total_blocos=2, tamanho_bloco=4)
+        armazenamento.escrever_bloco(0, b"abcd")
+        armazenamento.fechar()
+        reaberto = ArmazenamentoBlocos(self.caminho, total_blocos=2, tamanho_bloco=4)
+        self.assertEqual(bytes(reaberto.ler_bloco(0)), b"abcd")
+        reaberto.fechar()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from src.tracker.change_log import RegistroMudancas
+
+
+class TestRegistroMudancas(unittest.TestCase):
+    def test_mudancas_desde_uma_versao(self):
+        registro = RegistroMudancas()
+        registro.marcar_alterado("a")
+        versao = registro.marcar_alterado("b")
+        registro.marcar_alterado("c")
+        registro.marcar_alterado("a")
+        registro.marcar_removido("b")
+
+        alterados, removidos = registro.mudancas_desde(versao)
+        self.assertEqual(sorted(alterados), ["a", "c"])
+        self.assertEqual(removidos, ["b"])
+        self.assertEqual(registro.mudancas_desde(registro.versao), ([], []))
+
+    def test_versao_desconhecida_pede_lista_completa(self):
+        registro = RegistroMudancas()
+        registro.marcar_alterado("a")
+        self.assertIsNone(registro.mudancas_desde(registro.versao + 1))
+
+    def test_lapide_descartada_pede_lista_completa(self):
+        registro = RegistroMudancas(max_lapides=1)
+        registro.marcar_alterado("a")
+        registro.marcar_alterado("b")
+        registro.marcar_removido("a")
+        depois_da_primeira = registro.versao
+        registro.marcar_removido("b")
+
+        self.assertIsNone(registro.mudancas_desde(0))
+        self.assertEqual(registro.mudancas_desde(depois_da_primeira), ([], ["b"]))
+
+    def test_peer_que_volta_nao_conta_como_lapide(self):
+        registro = RegistroMudancas(max_lapides=2)
+        for _ in range(10):
+            registro.marcar_removido("volta")
+            registro.marcar_alterado("volta")
+        registro.marcar_removido("a")
+        antes_de_b = registro.versao
+        registro.marcar_removido("b")
+        registro.marcar_removido("c")
+        # Só a lápide de 'a' (a mais antiga vigente) foi descartada
+        self.assertIsNone(registro.mudancas_desde(antes_de_b - 1))
+        self.assertEqual(registro.mudancas_desde(antes_de_b), ([], ["c", "b"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
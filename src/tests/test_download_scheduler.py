@@ -0,0 +1,193 @@
+import unittest
+from concurrent.futures import Future
+from threading import Lock, Thread
+
+from src.common.bitfield import Bitfield
+from src.peer.download_scheduler import AgendadorDownloads
+from src.peer.peer_node import PeerNode
+from src.peer.peer_metrics import MetricasPeer
+from src.peer.strategies.rarity_index import RarityIndex
+
+TAMANHO_BLOCO = 4096
+
+
+def _conteudo(block_id, tamanho=TAMANHO_BLOCO):
+    return bytes((block_id * 7 + i) % 256 for i in range(tamanho))
+
+
+class _ArmazenamentoFalso:
+    tamanho = TAMANHO_BLOCO
+
+    def tamanho_do_bloco(self, block_id):
+        return self.tamanho
+
+
+class _P2PFalso:
+    """
+    Responde na hora com o trecho pedido (ou deixa o Future em 'abertos', se responder
+    for False); guarda (peer, bloco, offset, tamanho) de cada requisição.
+    """
+    def __init__(self, peer_node):
+        self.peer_node = peer_node
+        self.requisicoes = []
+        self.responder = True
+        self.abertos = {}
+
+    def solicitar_bloco_async(self, peer_address, block_id, peer_id, timeout_s, offset=0, tamanho=0):
+        remoto = self.peer_node.por_porta[peer_address[1]]
+        self.requisicoes.append((remoto, block_id, offset, tamanho))
+        dados = _conteudo(block_id, self.peer_node.armazenamento.tamanho)[offset:offset + tamanho]
+        futuro = Future()
+        if self.responder:
+            futuro.set_result(dados)
+        else:
+            self.abertos[remoto] = (futuro, dados)
+        return futuro
+
+
+class _PeerFalso:
+    id = "eu"
+    verificador = None
+
+    def __init__(self, vizinhos, total_blocos=2):
+        self.running = True
+        self.data_lock = Lock()
+        self.total_blocks = total_blocos
+        self.blocks = Bitfield(total_blocos)
+        self.armazenamento = _ArmazenamentoFalso()
+        self.indice_raridade = RarityIndex(range(total_blocos))
+        self.peers_info = {}
+        self.por_porta = {}
+        for porta, peer_id in enumerate(vizinhos, start=7000):
+            self.peers_info[peer_id] = {"ip": "127.0.0.1", "porta": porta}
+            self.por_porta[porta] = peer_id
+            self.indice_raridade.atualizar_peer(peer_id, range(total_blocos))
+        self.p2p = _P2PFalso(self)
+        self.metricas = MetricasPeer(self)
+        self.armazenados = {}
+
+    def _store_blocks(self, block_ids, dados):
+        self.armazenados[block_ids[0]] = bytes(dados)
+
+    def _anunciar_blocos_baixados(self, block_ids):
+        pass
+
+
+class TestPedacos(unittest.TestCase):
+    def test_bloco_remontado_com_pedacos_de_varios_peers(self):
+        peer = _PeerFalso(["a", "b"], total_blocos=1)
+        agendador = AgendadorDownloads(peer, max_pendentes_por_peer=2, tamanho_pedaco=1024, limiar_endgame=0)
+        agendador._preencher_slots()
+        agendador._processar_concluidos()
+
+        # 4 pedaços, no máximo 2 por peer: o bloco vem metade de cada um
+        self.assertEqual(sorted((b, o, t) for _, b, o, t in peer.p2p.requisicoes), [(0, o, 1024) for o in range(0, 4096, 1024)])
+        self.assertEqual(sorted(r for r, *_ in peer.p2p.requisicoes), ["a", "a", "b", "b"])
+        self.assertEqual(peer.armazenados, {0: _conteudo(0)})
+        self.assertEqual(agendador._montagens, {})
+
+    def test_configuracao_padrao_divide_o_bloco_entre_vizinhos(self):
+        peer = _PeerFalso(["a", "b"], total_blocos=1)
+        peer.armazenamento.tamanho = PeerNode.BLOCK_SIZE_BYTES
+        agendador = AgendadorDownloads(peer, limiar_endgame=0)
+        agendador._preencher_slots()
+        agendador._processar_concluidos()
+
+        # Vários pedaços, que podem ser pedidos a vizinhos diferentes ao mesmo tempo
+        self.assertGreater(len({o for _, _, o, _ in peer.p2p.requisicoes}), 1)
+        self.assertEqual(peer.armazenados, {0: _conteudo(0, PeerNode.BLOCK_SIZE_BYTES)})
+
+    def test_bloco_comecado_tem_prioridade(self):
+        peer = _PeerFalso(["a"], total_blocos=2)
+        agendador = AgendadorDownloads(peer, max_pendentes_por_peer=3, tamanho_pedaco=1024, limiar_endgame=0)
+        agendador._preencher_slots() # 3 dos 4 pedaços do bloco mais raro (empate: qualquer um)
+        primeiro = peer.p2p.requisicoes[0][1]
+        agendador._processar_concluidos()
+        agendador._preencher_slots()
+        self.assertEqual(peer.p2p.requisicoes[3][1], primeiro)
+        agendador._processar_concluidos()
+        self.assertIn(primeiro, peer.armazenados)
+
+    def test_pedaco_com_tamanho_errado_conta_como_falha(self):
+        peer = _PeerFalso(["a"], total_blocos=1)
+        agendador = AgendadorDownloads(peer, tamanho_pedaco=1024, limiar_endgame=0)
+        peer.p2p.solicitar_bloco_async = lambda *args, **kwargs: _resolvido(b"curto")
+        agendador._preencher_slots()
+        agendador._processar_concluidos()
+        self.assertEqual(peer.armazenados, {})
+        self.assertIn("a", agendador._falhas_recentes[0])
+
+    def test_peer_suspenso_nao_e_escolhido(self):
+        peer = _PeerFalso(["a", "b"], total_blocos=1)
+        agendador = AgendadorDownloads(peer, tamanho_pedaco=1024, limiar_endgame=0)
+        for _ in range(agendador.estatisticas.limite_falhas):
+            agendador.estatisticas.registrar_falha("a")
+        agendador._preencher_slots()
+        self.assertEqual({r for r, *_ in peer.p2p.requisicoes}, {"b"})
+
+    def test_envio_acontece_sem_segurar_o_agendador(self):
+        peer = _PeerFalso(["a"], total_blocos=1)
+        agendador = AgendadorDownloads(peer, tamanho_pedaco=4096, limiar_endgame=0)
+        livre = []
+        enviar = peer.p2p.solicitar_bloco_async
+
+        def entregar_resposta():
+            if agendador._cond.acquire(timeout=1):
+                livre.append(True)
+                agendador._cond.release()
+
+        def solicitar_lento(*args, **kwargs):
+            # Enquanto conecta/envia, a thread de leitura de outra conexão consegue entregar respostas
+            outra = Thread(target=entregar_resposta)
+            outra.start()
+            outra.join()
+            return enviar(*args, **kwargs)
+
+        peer.p2p.solicitar_bloco_async = solicitar_lento
+        self.assertEqual(agendador._preencher_slots(), 1)
+        self.assertEqual(len(livre), 1)
+        agendador._processar_concluidos()
+        self.assertEqual(peer.armazenados, {0: _conteudo(0)})
+
+    def test_tamanho_pedaco_nao_positivo_e_rejeitado(self):
+        peer = _PeerFalso(["a"], total_blocos=1)
+        for tamanho in (0, -1024):
+            with self.assertRaises(ValueError):
+                AgendadorDownloads(peer, tamanho_pedaco=tamanho)
+
+
+class TestEndgame(unittest.TestCase):
+    def test_pedaco_pedido_a_todos_e_o_primeiro_vence(self):
+        peer = _PeerFalso(["a", "b", "c"], total_blocos=1)
+        peer.p2p.responder = False
+        agendador = AgendadorDownloads(peer, tamanho_pedaco=4096, limiar_endgame=1)
+        agendador._preencher_slots()
+        self.assertEqual(sorted(peer.p2p.abertos), ["a", "b", "c"])
+        self.assertEqual(agendador.total_em_andamento(), 3)
+
+        futuro, dados = peer.p2p.abertos["b"]
+        futuro.set_result(dados)
+        agendador._processar_concluidos()
+        self.assertEqual(peer.armazenados, {0: _conteudo(0)})
+        self.assertTrue(peer.p2p.abertos["a"][0].cancelled())
+        self.assertTrue(peer.p2p.abertos["c"][0].cancelled())
+        self.assertEqual(agendador.total_em_andamento(), 0)
+        self.assertEqual(agendador._pendentes_por_peer, {})
+
+    def test_fora_do_endgame_um_peer_por_pedaco(self):
+        peer = _PeerFalso(["a", "b", "c"], total_blocos=6)
+        peer.p2p.responder = False
+        agendador = AgendadorDownloads(peer, tamanho_pedaco=4096, limiar_endgame=5)
+        agendador._preencher_slots()
+        pedidos = [(b, o) for _, b, o, _ in peer.p2p.requisicoes]
+        self.assertEqual(len(pedidos), len(set(pedidos)))
+
+
+def _resolvido(valor):
+    futuro = Future()
+    futuro.set_result(valor)
+    return futuro
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from src.common.manifest import Manifesto
+from src.common.synthetic_file import gerar_conteudo_bloco
+from src.peer.block_storage import ArmazenamentoBlocos
+from src.peer.block_verifier import VerificadorBlocos
+
+
+class TestManifesto(unittest.TestCase):
+    def test_verifica_blocos_e_ultimo_bloco_menor(self):
+        blocos = [b"a" * 8, b"b" * 8, b"c" * 3]
+        manifesto = Manifesto.de_blocos(blocos, tamanho_bloco=8)
+        self.assertEqual(manifesto.total_blocos, 3)
+        self.assertEqual(manifesto.tamanho_arquivo, 19)
+        self.assertTrue(manifesto.verificar_bloco(2, memoryview(b"c" * 3)))
+        self.assertFalse(manifesto.verificar_bloco(1, b"a" * 8))
+        self.assertFalse(manifesto.verificar_bloco(3, b"c" * 3))
+
+    def test_serializacao_e_arquivo(self):
+        manifesto = Manifesto.sintetico(5, 64, gerar_conteudo_bloco)
+        copia = Manifesto.from_dict(manifesto.to_dict())
+        self.assertEqual(copia.hashes, manifesto.hashes)
+        with tempfile.TemporaryDirectory() as d:
+            caminho = os.path.join(d, "manifesto.json")
+            manifesto.salvar(caminho)
+            self.assertEqual(Manifesto.carregar(caminho).hashes, manifesto.hashes)
+        with self.assertRaises(ValueError):
+            Manifesto.from_dict({**manifesto.to_dict(), "algoritmo": "md5"})
+
+
+class TestVerificadorBlocos(unittest.TestCase):
+    def test_reverifica_arquivo_existente(self):
+        manifesto = Manifesto.sintetico(10, 1024, gerar_conteudo_bloco)
+        verificador = VerificadorBlocos(manifesto, max_workers=3)
+        with tempfile.TemporaryDirectory() as d:
+            armazenamento = ArmazenamentoBlocos(os.path.join(d, "arquivo.bin"), 10, 1024)
+            for i in (0, 3, 4, 9):
+                armazenamento.escrever_bloco(i, gerar_conteudo_bloco(i, 1024))
+            armazenamento.escrever_bloco(5, b"x" * 1024) # bloco corrompido
+            integros = verificador.verificar_armazenamento(armazenamento)
+            armazenamento.fechar()
+        self.assertEqual(integros, {0, 3, 4, 9})
+        self.assertTrue(verificador.verificar_async(1, gerar_conteudo_bloco(1, 1024)).result(timeout=2))
+        self.assertFalse(verificador.verificar_async(1, b"x" * 1024).result(timeout=2))
+        verificador.fechar()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+import urllib.request
+
+from src.common.bitfield import Bitfield
+from src.common.metrics import RegistroMetricas, servir_metricas
+from src.peer.peer_metrics import MetricasPeer
+from src.peer.peer_stats import EstatisticasPeers
+from src.peer.strategies.choking_manager import ChokingManager
+
+
+class TestRegistroMetricas(unittest.TestCase):
+    def test_formato_de_texto(self):
+        registro = RegistroMetricas()
+        bytes_total = registro.contador("bytes_total", "Bytes.", ("remoto",))
+        latencia = registro.histograma("latencia_segundos", "Latência.", limites=(0.1, 1.0))
+        registro.medidor("vizinhos", "Vizinhos.", lambda: 3)
+
+        bytes_total.incrementar(10, remoto='p"1')
+        bytes_total.incrementar(5, remoto='p"1')
+        for valor in (0.05, 0.1, 0.5, 3.0):
+            latencia.observar(valor)
+
+        texto = registro.exportar()
+        self.assertIn("# TYPE bytes_total counter\n", texto)
+        self.assertIn('bytes_total{remoto="p\\"1"} 15\n', texto)
+        self.assertIn('latencia_segundos_bucket{le="0.1"} 2\n', texto)
+        self.assertIn('latencia_segundos_bucket{le="1.0"} 3\n', texto)
+        self.assertIn('latencia_segundos_bucket{le="+Inf"} 4\n', texto)
+        self.assertIn("latencia_segundos_sum 3.65\n", texto)
+        self.assertIn("latencia_segundos_count 4\n", texto)
+        self.assertIn("# TYPE vizinhos gauge\nvizinhos 3\n", texto)
+
+    def test_histograma_lido_tem_uma_serie(self):
+        registro = RegistroMetricas()
+        registro.histograma_lido("disponibilidade", "Disponibilidade.", lambda: [0, 1, 1, 3, 7], limites=(0, 1, 4))
+
+        texto = registro.exportar()
+        self.assertIn("# TYPE disponibilidade histogram\n", texto)
+        self.assertIn('disponibilidade_bucket{le="0"} 1\n', texto)
+        self.assertIn('disponibilidade_bucket{le="1"} 3\n', texto)
+        self.assertIn('disponibilidade_bucket{le="4"} 4\n', texto)
+        self.assertIn('disponibilidade_bucket{le="+Inf"} 5\n', texto)
+        self.assertIn("disponibilidade_sum 12\n", texto)
+        self.assertIn("disponibilidade_count 5\n", texto)
+
+    def test_contador_remove_series_pelos_rotulos(self):
+        registro = RegistroMetricas()
+        bytes_total = registro.contador("bytes_total", "Bytes.", ("remoto", "direcao"))
+        bytes_total.incrementar(1, remoto="a", direcao="enviados")
+        bytes_total.incrementar(2, remoto="a", direcao="recebidos")
+        bytes_total.incrementar(3, remoto="b", direcao="enviados")
+
+        bytes_total.remover(remoto="a")
+        texto = registro.exportar()
+        self.assertNotIn('remoto="a"', texto)
+        self.assertIn('bytes_total{remoto="b",direcao="enviados"} 3\n', texto)
+
+    def test_servidor_http(self):
+        registro = RegistroMetricas()
+        registro.medidor("um", "Um.", lambda: 1)
+        servidor = servir_metricas(registro, 0)
+        try:
+            porta = servidor.server_address[1]
+            with urllib.request.urlopen(f"http://127.0.0.1:{porta}/metrics", timeout=2) as resposta:
+                self.assertIn("text/plain", resposta.headers["Content-Type"])
+                self.assertIn("um 1\n", resposta.read().decode())
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+
+
+class _AgendadorFalso:
+    def __init__(self):
+        self.estatisticas = EstatisticasPeers()
+
+    def total_em_andamento(self):
+        return 2
+
+
+class _PeerFalso:
+    total_blocks = 8
+
+    def __init__(self):
+        self.blocks = Bitfield(8, [0, 1, 2])
+        self.peers_info = {"b": {}, "c": {}}
+        self.agendador = _AgendadorFalso()
+        self.choking_manager = ChokingManager("a")
+
+
+class TestMetricasPeer(unittest.TestCase):
+    def test_metricas_do_peer(self):
+        peer = _PeerFalso()
+        metricas = MetricasPeer(peer)
+        metricas.registrar_envio("b", 1024)
+        metricas.registrar_resposta("c", 0.02, 2048)
+        metricas.registrar_resposta("c", 0.01, 0)
+        peer.choking_manager.transicoes["unchoke"] += 2
+        peer.agendador.estatisticas.registrar_sucesso("c", 0.5, 1000)
+
+        texto = metricas.registro.exportar()
+        self.assertIn('minibit_peer_bytes_total{remoto="b",direcao="enviados"} 1024\n', texto)
+        self.assertIn('minibit_peer_bytes_total{remoto="c",direcao="recebidos"} 2048\n', texto)
+        self.assertIn('minibit_peer_latencia_requisicao_segundos_count{resultado="ok"} 1\n', texto)
+        self.assertIn('minibit_peer_latencia_requisicao_segundos_count{resultado="falha"} 1\n', texto)
+        self.assertIn("minibit_peer_requisicoes_em_andamento 2\n", texto)
+        self.assertIn('minibit_peer_choke_transicoes_total{tipo="unchoke"} 2\n', texto)
+        self.assertIn('minibit_peer_tempo_resposta_estimado_segundos{remoto="c"} 0.5\n', texto)
+        self.assertIn('minibit_peer_vazao_estimada_bytes_por_segundo{remoto="c"} 2000.0\n', texto)
+        self.assertIn("minibit_peer_blocos 3\n", texto)
+        self.assertIn("minibit_peer_vizinhos 2\n", texto)
+
+    def test_peer_que_saiu_some_das_metricas(self):
+        peer = _PeerFalso()
+        metricas = MetricasPeer(peer)
+        metricas.registrar_resposta("c", 0.02, 2048)
+        peer.agendador.estatisticas.registrar_sucesso("c", 0.5, 1000)
+
+        metricas.esquecer_remoto("c")
+        peer.agendador.estatisticas.esquecer("c")
+        self.assertNotIn('remoto="c"', metricas.registro.exportar())
+
+
+if __name__ == "__main__":
+    unittest.main()
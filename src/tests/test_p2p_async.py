@@ -0,0 +1,86 @@
+import socket
+import time
+import unittest
+from threading import Thread
+from unittest import mock
+
+from src.peer import wire_protocol as protocolo
+from src.peer.p2p_async import AsyncP2PCommunication
+from src.peer.p2p_communication import P2PCommunication
+from src.common.bitfield import Bitfield
+from src.tests.test_p2p_communication import _PeerFalso, _cancelamento_enviado, _esperar, _pecas_apos_cancelamento
+
+
+class TestTransporteAsyncio(unittest.TestCase):
+    PORTA = 6311
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servidor = _PeerFalso("servidor")
+        Thread(target=AsyncP2PCommunication.start_server, args=(cls.servidor, cls.PORTA), daemon=True).start()
+        time.sleep(0.3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.running = False
+        AsyncP2PCommunication.fechar_conexoes("cliente")
+        P2PCommunication.fechar_conexoes("cliente")
+        AsyncP2PCommunication.fechar_conexoes("vizinho-async")
+        AsyncP2PCommunication.fechar_conexoes("cancelador")
+
+    def test_cliente_asyncio_multiplexa_requisicoes(self):
+        endereco = ("127.0.0.1", self.PORTA)
+        futuros = [AsyncP2PCommunication.solicitar_bloco_async(endereco, i, "cliente") for i in range(8)]
+        self.assertEqual([f.result(timeout=2) for f in futuros], [bytes([i]) * 1024 for i in range(8)])
+        self.assertIsNone(AsyncP2PCommunication.request_block(endereco, 99, "cliente", timeout_s=2))
+
+    def test_cliente_com_threads_conversa_com_servidor_asyncio(self):
+        endereco = ("127.0.0.1", self.PORTA)
+        self.assertEqual(P2PCommunication.request_block(endereco, 3, "cliente", timeout_s=2), bytes([3]) * 1024)
+
+    def test_bitfield_e_have_no_transporte_asyncio(self):
+        vizinho = _PeerFalso("vizinho-async", my_port=7778)
+        vizinho.blocks = Bitfield(8, [0])
+        P2PCommunication.registrar_no(vizinho)
+        endereco = ("127.0.0.1", self.PORTA)
+        self.assertEqual(AsyncP2PCommunication.request_block(endereco, 1, "vizinho-async", timeout_s=2), None) # choked
+        self.assertTrue(_esperar(lambda: "vizinho-async" in self.servidor.inventarios and "servidor" in vizinho.inventarios))
+        self.assertEqual(self.servidor.inventarios["vizinho-async"], (Bitfield(8, [0]), ("127.0.0.1", 7778)))
+
+        AsyncP2PCommunication.anunciar_blocos(vizinho, [6])
+        AsyncP2PCommunication.anunciar_blocos(self.servidor, [7])
+        self.assertTrue(_esperar(lambda: self.servidor.haves.get("vizinho-async") == [6] and vizinho.haves.get("servidor") == [7]))
+
+    def test_peer_que_nao_le_perde_a_conexao_no_prazo(self):
+        servidor = _PeerFalso("servidor-have-async")
+        Thread(target=AsyncP2PCommunication.start_server, args=(servidor, self.PORTA + 1), daemon=True).start()
+        time.sleep(0.3)
+        try:
+            with mock.patch.object(P2PCommunication, "PRAZO_NOTIFICACAO_S", 0.2), \
+                    socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+                sock.connect(("127.0.0.1", self.PORTA + 1))
+                sock.sendall(protocolo.handshake("calado", 0))
+                self.assertTrue(_esperar(lambda: len(AsyncP2PCommunication._entrantes.get(servidor.id, {})) == 1))
+                # O peer nunca lê: os HAVE enchem o buffer e a conexão é encerrada no prazo
+                for _ in range(10):
+                    AsyncP2PCommunication.anunciar_blocos(servidor, list(range(8)) * 50000)
+                self.assertTrue(_esperar(lambda: not AsyncP2PCommunication._entrantes.get(servidor.id)))
+        finally:
+            servidor.running = False
+
+    def test_cancel_descarta_a_requisicao_ainda_nao_atendida(self):
+        self.assertEqual(_pecas_apos_cancelamento(self.PORTA), [1, 3])
+
+    def test_futuro_cancelado_envia_cancel(self):
+        pedido, cancelado = _cancelamento_enviado(
+            lambda endereco: AsyncP2PCommunication.solicitar_bloco_async(endereco, 0, "cancelador", timeout_s=5)
+        )
+        self.assertEqual(cancelado, pedido)
+
+    def test_conexao_recusada_retorna_none(self):
+        self.assertIsNone(AsyncP2PCommunication.request_block(("127.0.0.1", 1), 0, "cliente", timeout_s=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
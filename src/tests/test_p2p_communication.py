@@ -0,0 +1,240 @@
+import os
+import socket
+import struct
+import tempfile
+import time
+import unittest
+from threading import Lock, Thread
+
+from src.common.bitfield import Bitfield
+from src.peer.block_storage import ArmazenamentoBlocos
+from src.peer import wire_protocol as protocolo
+from src.peer.p2p_communication import P2PCommunication, _FilaNotificacoes
+from src.peer.peer_metrics import MetricasPeer
+
+
+class _ChokingFalso:
+    def get_peers_unchoked_por_mim(self):
+        return {"cliente"}
+
+
+class _PeerFalso:
+    total_blocks = 8
+
+    def __init__(self, peer_id, my_port=0):
+        self.id = peer_id
+        self.my_port = my_port
+        self.running = True
+        self.choking_manager = _ChokingFalso()
+        self.metricas = MetricasPeer(self)
+        self.blocks = Bitfield(8, range(8))
+        self._dir = tempfile.TemporaryDirectory()
+        self.armazenamento = ArmazenamentoBlocos(os.path.join(self._dir.name, "arquivo.bin"), 8, 1024)
+        for i in range(8):
+            self.armazenamento.escrever_bloco(i, bytes([i]) * 1024)
+        # Inventários recebidos dos vizinhos: peer_id -> (Bitfield, endereço); HAVE: peer_id -> blocos
+        self.inventarios = {}
+        self.haves = {}
+
+    def obter_regiao_bloco(self, block_id):
+        if block_id not in self.blocks:
+            return None
+        return self.armazenamento.regiao_do_bloco(block_id)
+
+    def atualizar_inventario_vizinho(self, peer_id, blocos, endereco=None):
+        self.inventarios[peer_id] = (blocos, endereco)
+
+    def vizinho_obteve_blocos(self, peer_id, block_ids):
+        self.haves.setdefault(peer_id, []).extend(block_ids)
+
+
+def _esperar(condicao, timeout_s=2.0):
+    limite = time.monotonic() + timeout_s
+    while not condicao() and time.monotonic() < limite:
+        time.sleep(0.01)
+    return condicao()
+
+
+def _pecas_apos_cancelamento(porta):
+    """Pede os blocos 1, 2 e 3 de uma vez, cancelando o 2 logo atrás; retorna os ids que vieram com PIECE."""
+    with socket.create_connection(("127.0.0.1", porta), timeout=2) as sock:
+        sock.sendall(protocolo.handshake("cliente", 0) + protocolo.requisicao(1, 1) + protocolo.requisicao(2, 2)
+                     + protocolo.cancelamento(2) + protocolo.requisicao(3, 3))
+        pecas = []
+        while 3 not in pecas:
+            tipo, request_id, _ = P2PCommunication._receber_mensagem(sock)
+            if tipo == protocolo.PIECE:
+                pecas.append(request_id)
+        return pecas
+
+
+def _cancelamento_enviado(solicitar):
+    """Cancela uma requisição feita por 'solicitar(endereco)' a um peer que não responde; retorna os ids do REQUEST e do CANCEL."""
+    with socket.create_server(("127.0.0.1", 0)) as servidor:
+        servidor.settimeout(2)
+        futuro = solicitar(servidor.getsockname())
+        conn, _ = servidor.accept()
+        with conn:
+            conn.settimeout(2)
+            ids = {}
+            while protocolo.CANCEL not in ids:
+                tipo, request_id, _ = P2PCommunication._receber_mensagem(conn)
+                ids[tipo] = request_id
+                if tipo == protocolo.REQUEST:
+                    futuro.cancel()
+            return ids[protocolo.REQUEST], ids[protocolo.CANCEL]
+
+
+class TestConexaoPersistente(unittest.TestCase):
+    PORTA = 6301
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servidor = _PeerFalso("servidor")
+        Thread(target=P2PCommunication.start_server, args=(cls.servidor, cls.PORTA), daemon=True).start()
+        time.sleep(0.3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.running = False
+        P2PCommunication.fechar_conexoes("cliente")
+        P2PCommunication.fechar_conexoes("estranho")
+        P2PCommunication.fechar_conexoes("vizinho")
+        P2PCommunication.fechar_conexoes("cancelador")
+
+    def test_varias_requisicoes_em_andamento_na_mesma_conexao(self):
+        endereco = ("127.0.0.1", self.PORTA)
+        futuros = [P2PCommunication.solicitar_bloco_async(endereco, i, "cliente") for i in range(8)]
+        resultados = [f.result(timeout=2) for f in futuros]
+        self.assertEqual(resultados, [bytes([i]) * 1024 for i in range(8)])
+        conexoes = [c for (dono, _), c in P2PCommunication._conexoes.items() if dono == "cliente"]
+        self.assertEqual(len(conexoes), 1)
+
+    def test_bitfield_na_conexao_e_have_nos_dois_sentidos(self):
+        vizinho = _PeerFalso("vizinho", my_port=7777)
+        vizinho.blocks = Bitfield(8, [1, 2])
+        P2PCommunication.registrar_no(vizinho)
+        P2PCommunication.obter_conexao(("127.0.0.1", self.PORTA), "vizinho")
+
+        # Quem conecta manda HANDSHAKE (com a porta de escuta) e BITFIELD, e recebe os do outro lado
+        self.assertTrue(_esperar(lambda: "vizinho" in self.servidor.inventarios and "servidor" in vizinho.inventarios))
+        self.assertEqual(self.servidor.inventarios["vizinho"], (Bitfield(8, [1, 2]), ("127.0.0.1", 7777)))
+        self.assertEqual(vizinho.inventarios["servidor"][0], Bitfield(8, range(8)))
+
+        # HAVE pela conexão de saída (vizinho -> servidor) e pela de entrada (servidor -> vizinho)
+        P2PCommunication.anunciar_blocos(vizinho, [3, 4])
+        P2PCommunication.anunciar_blocos(self.servidor, [5])
+        self.assertTrue(_esperar(lambda: self.servidor.haves.get("vizinho") == [3, 4] and vizinho.haves.get("servidor") == [5]))
+
+    def test_bloco_inexistente_e_peer_choked_retornam_none(self):
+        endereco = ("127.0.0.1", self.PORTA)
+        self.assertIsNone(P2PCommunication.request_block(endereco, 99, "cliente", timeout_s=2))
+        self.assertIsNone(P2PCommunication.request_block(endereco, 0, "estranho", timeout_s=2))
+
+    def test_trecho_de_bloco(self):
+        endereco = ("127.0.0.1", self.PORTA)
+        futuro = P2PCommunication.solicitar_bloco_async(endereco, 5, "cliente", offset=1000, tamanho=100)
+        self.assertEqual(bytes(futuro.result(timeout=2)), bytes([5]) * 24)
+
+    def test_cancel_descarta_a_requisicao_ainda_nao_atendida(self):
+        self.assertEqual(_pecas_apos_cancelamento(self.PORTA), [1, 3])
+
+    def test_futuro_cancelado_envia_cancel(self):
+        pedido, cancelado = _cancelamento_enviado(
+            lambda endereco: P2PCommunication.solicitar_bloco_async(endereco, 0, "cancelador", timeout_s=5)
+        )
+        self.assertEqual(cancelado, pedido)
+
+    def test_versao_diferente_encerra_a_conexao(self):
+        with socket.create_connection(("127.0.0.1", self.PORTA), timeout=2) as sock:
+            sock.sendall(protocolo.empacotar(protocolo.HANDSHAKE, 0, struct.pack('>BH', protocolo.VERSAO + 1, 0) + b"velho"))
+            self.assertEqual(sock.recv(1), b"")
+
+
+class TestRecepcao(unittest.TestCase):
+    def test_mensagem_recebida_em_pedacos(self):
+        a, b = socket.socketpair()
+        with a, b:
+            mensagem = protocolo.cabecalho_peca(7, 3, 0, 5000) + b"x" * 5000
+            for i in range(0, len(mensagem), 333):
+                a.sendall(mensagem[i:i + 333])
+            tipo, request_id, dados = P2PCommunication._receber_mensagem(b)
+        self.assertEqual((tipo, request_id), (protocolo.PIECE, 7))
+        block_id, offset, conteudo = protocolo.ler_peca(dados)
+        self.assertEqual((block_id, offset, bytes(conteudo)), (3, 0, b"x" * 5000))
+
+    def test_cabecalho_acima_do_limite_nao_aloca(self):
+        a, b = socket.socketpair()
+        with a, b:
+            a.sendall(protocolo.CABECALHO.pack(P2PCommunication.MAX_MESSAGE_BYTES + 1, protocolo.PIECE, 1))
+            with self.assertRaises(struct.error):
+                P2PCommunication._receber_mensagem(b)
+
+    def test_limite_passado_pela_conexao(self):
+        a, b = socket.socketpair()
+        with a, b:
+            a.sendall(protocolo.cabecalho_peca(1, 0, 0, 2000) + b"x" * 2000)
+            with self.assertRaises(struct.error):
+                P2PCommunication._receber_mensagem(b, limite=1024)
+        # O limite de um peer não muda o padrão da classe nem o de outro peer
+        self.assertEqual(P2PCommunication.MAX_MESSAGE_BYTES, 16 * 1024 * 1024)
+        self.assertEqual(P2PCommunication._limite_mensagem(_PeerFalso("sem-limite")), P2PCommunication.MAX_MESSAGE_BYTES)
+
+
+class TestNotificacoes(unittest.TestCase):
+    def test_have_nao_espera_o_envio_em_andamento(self):
+        a, b = socket.socketpair()
+        with a, b:
+            trava = Lock()
+            fila = _FilaNotificacoes(a, trava)
+            b.settimeout(0.2)
+            with trava: # um upload usando o socket
+                fila.enfileirar(protocolo.have([1]))
+                fila.tentar_descarregar()
+                with self.assertRaises(socket.timeout):
+                    b.recv(64)
+            fila.enfileirar(protocolo.have([2]))
+            fila.tentar_descarregar() # quem usava o socket descarrega ao terminar
+            self.assertEqual(b.recv(64), protocolo.have([1]) + protocolo.have([2]))
+
+    def test_peer_que_nao_le_perde_a_conexao_no_prazo(self):
+        a, b = socket.socketpair()
+        with a, b:
+            a.setblocking(False)
+            try:
+                while True:
+                    a.send(b"x" * 65536)
+            except BlockingIOError:
+                pass
+            a.setblocking(True)
+            fila = _FilaNotificacoes(a, Lock(), prazo_s=0.2)
+            fila.enfileirar(protocolo.have(range(1000)))
+            inicio = time.monotonic()
+            fila.tentar_descarregar()
+            self.assertLess(time.monotonic() - inicio, 2.0)
+            with self.assertRaises(OSError):
+                a.sendall(b"y")
+
+
+_C = protocolo.CABECALHO.size # onde começam os dados de uma mensagem
+
+
+class TestProtocolo(unittest.TestCase):
+    def test_ida_e_volta(self):
+        self.assertEqual(protocolo.ler_handshake(protocolo.handshake("peer-ç", 5001)[_C:]), ("peer-ç", 5001))
+        self.assertEqual(protocolo.ler_bitfield(protocolo.bitfield(Bitfield(10, [0, 9]))[_C:], 10), Bitfield(10, [0, 9]))
+        self.assertEqual(protocolo.ler_have(protocolo.have([1, 70000])[_C:]), (1, 70000))
+        self.assertEqual(protocolo.ler_requisicao(protocolo.requisicao(4, 2, 512, 256)[_C:]), (2, 512, 256))
+        self.assertEqual(protocolo.ler_bloco(protocolo.resposta_sem_conteudo(protocolo.RECUSADO, 4, 2)[_C:]), 2)
+
+    def test_campos_truncados(self):
+        with self.assertRaises(protocolo.ErroProtocolo):
+            protocolo.ler_requisicao(b"\x00" * 8)
+        with self.assertRaises(protocolo.ErroProtocolo):
+            protocolo.ler_have(b"\x00" * 5)
+        with self.assertRaises(protocolo.ErroProtocolo):
+            protocolo.ler_bitfield(b"\x00", 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import logging
+import unittest
+from unittest import mock
+
+from src.peer.peer_log import ContadoresAmostrados, configurar_log_peer, log_p2p
+
+
+class TestContadoresAmostrados(unittest.TestCase):
+    @mock.patch("src.peer.peer_log.time.monotonic")
+    def test_resume_no_maximo_uma_vez_por_intervalo(self, relogio):
+        relogio.return_value = 0.0
+        logger = mock.Mock()
+        logger.isEnabledFor.return_value = True
+        contadores = ContadoresAmostrados(intervalo_s=10.0, logger=logger)
+
+        for _ in range(100):
+            contadores.incrementar("blocos_enviados")
+        contadores.incrementar("bytes_enviados", 16384)
+        logger.info.assert_not_called()
+
+        relogio.return_value = 12.0
+        contadores.incrementar("blocos_enviados")
+        logger.info.assert_called_once()
+        formato, decorrido, resumo = logger.info.call_args.args
+        self.assertEqual((decorrido, resumo), (12.0, "blocos_enviados=101 bytes_enviados=16384"))
+
+        # O próximo resumo traz só o que mudou desde este
+        relogio.return_value = 30.0
+        contadores.incrementar("blocos_enviados")
+        self.assertEqual(logger.info.call_args.args[2], "blocos_enviados=1")
+        self.assertEqual(contadores.valores(), {"blocos_enviados": 102, "bytes_enviados": 16384})
+
+    @mock.patch("src.peer.peer_log.time.monotonic")
+    def test_sem_log_nada_e_formatado(self, relogio):
+        relogio.return_value = 0.0
+        logger = mock.Mock()
+        logger.isEnabledFor.return_value = False
+        contadores = ContadoresAmostrados(intervalo_s=1.0, logger=logger)
+        relogio.return_value = 5.0
+        contadores.incrementar("requisicoes")
+        logger.info.assert_not_called()
+        self.assertEqual(contadores.valores(), {"requisicoes": 1})
+
+
+class TestConfigurarLogPeer(unittest.TestCase):
+    def tearDown(self):
+        log_p2p.setLevel(logging.NOTSET)
+
+    def test_niveis_por_subsistema(self):
+        with mock.patch("src.peer.peer_log.logging.basicConfig"):
+            configurar_log_peer("WARNING", "p2p=debug")
+            self.assertEqual(log_p2p.level, logging.DEBUG)
+            with self.assertRaises(ValueError):
+                configurar_log_peer("INFO", "rede=DEBUG")
+
+
+if __name__ == "__main__":
+    unittest.main()
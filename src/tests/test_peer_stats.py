@@ -0,0 +1,46 @@
+import random
+import time
+import unittest
+
+from src.peer.peer_stats import EstatisticasPeers
+
+
+class TestEstatisticasPeers(unittest.TestCase):
+    def test_timeout_se_adapta_ao_tempo_de_resposta(self):
+        estatisticas = EstatisticasPeers(timeout_inicial_s=5.0, timeout_min_s=0.1)
+        self.assertEqual(estatisticas.timeout("a"), 5.0)
+        for _ in range(20):
+            estatisticas.registrar_sucesso("a", 0.2, 16384)
+        self.assertLess(estatisticas.timeout("a"), 1.0)
+        self.assertGreaterEqual(estatisticas.timeout("a"), 0.2)
+
+        # Cada timeout seguido dobra o prazo; uma resposta boa volta ao normal
+        normal = estatisticas.timeout("a")
+        estatisticas.registrar_falha("a", por_timeout=True)
+        self.assertAlmostEqual(estatisticas.timeout("a"), 2 * normal)
+        estatisticas.registrar_sucesso("a", 0.2, 16384)
+        self.assertAlmostEqual(estatisticas.timeout("a"), normal, places=3)
+
+    def test_falhas_seguidas_suspendem_o_peer(self):
+        estatisticas = EstatisticasPeers(limite_falhas=2, espera_base_s=10.0)
+        estatisticas.registrar_falha("a")
+        self.assertTrue(estatisticas.disponivel("a", time.monotonic()))
+        estatisticas.registrar_falha("a")
+        self.assertFalse(estatisticas.disponivel("a", time.monotonic()))
+        self.assertTrue(estatisticas.disponivel("a", time.monotonic() + 11))
+        estatisticas.registrar_sucesso("a", 0.1, 100)
+        self.assertTrue(estatisticas.disponivel("a", time.monotonic()))
+
+    def test_escolha_prefere_os_mais_rapidos(self):
+        estatisticas = EstatisticasPeers(aleatorio=random.Random(7))
+        estatisticas.registrar_sucesso("rapido", 0.01, 16384)
+        estatisticas.registrar_sucesso("lento", 1.0, 16384)
+        escolhas = [estatisticas.escolher(["rapido", "lento"]) for _ in range(1000)]
+        self.assertGreater(escolhas.count("rapido"), 900)
+        # Sem medida, o peer recebe o peso do melhor conhecido e também é experimentado
+        escolhas = [estatisticas.escolher(["rapido", "novo"]) for _ in range(1000)]
+        self.assertGreater(escolhas.count("novo"), 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+from src.common.bitfield import Bitfield
+from src.common.manifest import Manifesto
+from src.common.synthetic_file import gerar_conteudo_bloco
+from src.peer.peer_node import PeerNode
+from src.peer.resume_state import EstadoRetomada
+
+
+class TestEstadoRetomada(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.dir.name, "arquivo.bin")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_sem_estado_retorna_none(self):
+        self.assertIsNone(EstadoRetomada(self.caminho, 8, 4).carregar())
+
+    def test_checkpoint_e_diario(self):
+        estado = EstadoRetomada(self.caminho, 8, 4, blocos_por_checkpoint=2)
+        estado.checkpoint(Bitfield(8, [0, 3]))
+        self.assertFalse(estado.registrar_bloco(5))
+        self.assertTrue(estado.registrar_bloco(6))
+        estado.fechar()
+
+        confirmados, incertos = EstadoRetomada(self.caminho, 8, 4).carregar()
+        self.assertEqual(set(confirmados), {0, 3})
+        self.assertEqual(incertos, [5, 6])
+
+    def test_checkpoint_zera_diario_e_registro_incompleto_e_descartado(self):
+        estado = EstadoRetomada(self.caminho, 8, 4)
+        estado.registrar_bloco(1)
+        estado.checkpoint(Bitfield(8, [1]))
+        estado.registrar_bloco(2)
+        estado.fechar()
+        with open(self.caminho + ".diario", "ab") as f:
+            f.write(b"\x00\x00")
+
+        confirmados, incertos = EstadoRetomada(self.caminho, 8, 4).carregar()
+        self.assertEqual(set(confirmados), {1})
+        self.assertEqual(incertos, [2])
+
+    def test_estado_de_outro_arquivo_e_ignorado(self):
+        estado = EstadoRetomada(self.caminho, 8, 4, identificador_manifesto="aaa")
+        estado.checkpoint(Bitfield(8, [0]))
+        estado.fechar()
+        self.assertIsNone(EstadoRetomada(self.caminho, 16, 4).carregar())
+        self.assertIsNone(EstadoRetomada(self.caminho, 8, 4, identificador_manifesto="bbb").carregar())
+        self.assertIsNotNone(EstadoRetomada(self.caminho, 8, 4, identificador_manifesto="aaa").carregar())
+
+
+class TestRetomadaDoPeer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.manifesto = os.path.join(self.dir.name, "manifesto.json")
+        Manifesto.sintetico(8, PeerNode.BLOCK_SIZE_BYTES, gerar_conteudo_bloco).salvar(self.manifesto)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _iniciar_peer(self):
+        """Um PeerNode sobre o mesmo diretório, só com a parte do start() que lê o disco."""
+        peer = PeerNode("retomada", "http://127.0.0.1:1", 0, total_blocks=8,
+                        download_dir=self.dir.name, manifesto_path=self.manifesto)
+        peer._carregar_manifesto()
+        peer._retomar_download()
+        return peer
+
+    @staticmethod
+    def _cair(peer):
+        """Queda do processo: nada de shutdown(), nem flush nem checkpoint; só solta os arquivos."""
+        peer.verificador.fechar()
+        peer.estado.fechar()
+        peer.armazenamento.fechar()
+
+    def test_queda_entre_escrita_e_checkpoint(self):
+        peer = self._iniciar_peer()
+        peer._store_blocks([0, 1])
+        peer._salvar_estado()
+        # Depois do checkpoint: 2 e 5 chegam ao disco; o 3 fica no diário mas a escrita se perdeu
+        for block_id in (2, 3, 5):
+            peer._store_blocks([block_id])
+        peer.armazenamento.escrever_bloco(3, bytes(PeerNode.BLOCK_SIZE_BYTES))
+        self._cair(peer)
+
+        retomado = self._iniciar_peer()
+        try:
+            self.assertEqual(retomado.blocks, Bitfield(8, [0, 1, 2, 5]))
+            for block_id in retomado.blocks:
+                self.assertTrue(retomado.manifesto.verificar_bloco(block_id, retomado.obter_dados_bloco(block_id)))
+        finally:
+            self._cair(retomado)
+
+
+if __name__ == "__main__":
+    unittest.main()
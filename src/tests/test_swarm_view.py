@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Os módulos do tracker importam 'tracker' a partir de src/ (como o start_tracker.py)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from tracker.block_distributor import DistribuidorBlocos
+from tracker.change_log import RegistroMudancas
+from tracker.peer_manager import GerenciadorPeers
+from tracker.swarm_view import VisaoEnxame
+
+
+class TestVisaoEnxame(unittest.TestCase):
+    def setUp(self):
+        self.distribuidor = DistribuidorBlocos(total_blocos=8)
+        self.gerenciador = GerenciadorPeers()
+        self.registro = RegistroMudancas()
+        self.visao = VisaoEnxame(self.gerenciador, self.distribuidor, self.registro)
+
+    def _registrar(self, peer_id, blocos):
+        self.gerenciador.adicionar_peer(peer_id, "127.0.0.1", 6000)
+        self.distribuidor.atualizar_blocos_peer(peer_id, blocos)
+        self.registro.marcar_alterado(peer_id)
+
+    def test_histograma_acompanha_mudancas(self):
+        self._registrar("a", [0, 1, 2])
+        self._registrar("b", [1, 2])
+        self.distribuidor.atualizar_blocos_peer("a", [2, 5])
+        self.distribuidor.reiniciar_anuncios("b")
+        self.distribuidor.aplicar_anuncio("b", 1, [5, 7])
+        self.distribuidor.adicionar_bloco_peer("c", 0)
+        self.distribuidor.remover_peer("c")
+        self.assertEqual(self.distribuidor.disponibilidade, [0, 1, 2, 0, 0, 2, 0, 1])
+
+    def test_lista_e_status_em_cache_por_versao(self):
+        self._registrar("a", [0])
+        self._registrar("b", [1])
+        peers_json, _ = self.visao.peers_json(exceto="a")
+        peers = json.loads(peers_json)
+        self.assertEqual([p["peer_id"] for p in peers], ["b"])
+
+        self.visao.intervalo_status_s = 0
+        status = self.visao.status_json()
+        self.assertIs(self.visao.status_json(), status)
+        self.assertEqual(json.loads(status)["distribuicao_blocos"]["1"], 1)
+
+        self.distribuidor.atualizar_blocos_peer("b", [1, 3])
+        self.registro.marcar_alterado("b")
+        self.assertIsNot(self.visao.status_json(), status)
+        (b,) = json.loads(self.visao.peers_alterados_json(["b"]))
+        self.assertEqual(b["bitfield"], self.distribuidor.obter_bitfield_peer("b").to_base64())
+
+    def test_delta_completado_com_amostra_num_enxame_maior_que_numwant(self):
+        self._registrar("eu", [0])
+        outros = [f"p{i}" for i in range(12)]
+        for peer_id in outros:
+            self._registrar(peer_id, [1])
+        versao = self.registro.versao
+
+        # Sem mudanças, cada consulta incremental ainda traz numwant peers, sorteados de novo
+        vistos = set()
+        for _ in range(10):
+            peers = json.loads(self.visao.peers_alterados_json([], exceto="eu", numwant=3))
+            ids = [peer["peer_id"] for peer in peers]
+            self.assertEqual(len(set(ids)), 3)
+            vistos.update(ids)
+        self.assertGreater(len(vistos), 3)
+
+        # Quem mudou vem sempre, e a amostra só completa as vagas
+        self._registrar("p0", [1, 2])
+        alterados, _ = self.registro.mudancas_desde(versao)
+        ids = [peer["peer_id"] for peer in json.loads(self.visao.peers_alterados_json(alterados, exceto="eu", numwant=3))]
+        self.assertEqual((ids[0], len(set(ids))), ("p0", 3))
+
+        # Num enxame que cabe em numwant o solicitante já conhece todos: só o delta
+        self.assertEqual(json.loads(self.visao.peers_alterados_json([], exceto="eu", numwant=50)), [])
+
+    @mock.patch("tracker.swarm_view.time.monotonic")
+    def test_status_refeito_no_maximo_a_cada_intervalo(self, relogio):
+        relogio.return_value = 100.0
+        self._registrar("a", [0])
+        status = self.visao.status_json()
+        # Mudanças dentro do intervalo não refazem o JSON
+        self._registrar("b", [1])
+        relogio.return_value = 100.5
+        self.assertIs(self.visao.status_json(), status)
+        relogio.return_value = 101.0
+        self.assertEqual(json.loads(self.visao.status_json())["total_peers"], 2)
+
+    def test_numwant_limita_e_prefere_quem_tem_blocos_faltantes(self):
+        self._registrar("eu", [0, 1, 2, 3])
+        self._registrar("util", [4, 5, 6, 7])
+        inuteis = [f"inutil{i}" for i in range(20)]
+        for peer_id in inuteis:
+            self._registrar(peer_id, [0])
+
+        peers_json, amostra = self.visao.peers_json(exceto="eu", numwant=5)
+        self.assertTrue(amostra)
+        self.assertEqual(len(json.loads(peers_json)), 5)
+
+        # Peso 5 contra 20 de peso 1: ~40 de 200 sorteios (um sorteio uniforme daria ~10)
+        vezes_util = sum(self.visao.amostrar(inuteis + ["util"], "eu", 1) == ["util"] for _ in range(200))
+        self.assertGreater(vezes_util, 20)
+
+        _, amostra = self.visao.peers_json(exceto="eu", numwant=100)
+        self.assertFalse(amostra)
+
+
+if __name__ == "__main__":
+    unittest.main()
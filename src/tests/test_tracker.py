@@ -35,7 +35,7 @@ def testar_registrar_peer(peer_id, porta=8000):
         if response.status_code == 200:
             resultado = response.json()
             print(f"✓ Peer {peer_id} registrado com sucesso")
-            print(f"  Blocos iniciais: {resultado['blocos_iniciais']}")
+            print(f"  Blocos iniciais (bitfield base64): {resultado['bitfield_inicial']}")
             return True
         else:
             print(f"✗ Erro ao registrar: {response.status_code}")
@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from src.peer.tracker_announcer import AnunciadorTracker
+
+
+class _PeerFalso:
+    id = "peer1"
+    tracker_url = "http://tracker"
+    total_blocks = 16
+
+    def __init__(self):
+        self.registros = 0
+
+    def _register_with_tracker(self):
+        self.registros += 1
+
+
+def _resposta(status):
+    resposta = mock.Mock(status_code=status)
+    resposta.raise_for_status.side_effect = None if status < 400 else requests.exceptions.HTTPError(str(status))
+    return resposta
+
+
+class TestAnunciadorTracker(unittest.TestCase):
+    def setUp(self):
+        self.peer = _PeerFalso()
+        self.anunciador = AnunciadorTracker(self.peer)
+
+    @mock.patch("src.peer.tracker_announcer.requests.post")
+    def test_agrupa_blocos_num_anuncio_numerado(self, post):
+        post.return_value = _resposta(200)
+        self.anunciador.anunciar([3, 1])
+        self.anunciador.anunciar([7])
+        self.assertTrue(self.anunciador.enviar_pendentes())
+        self.anunciador.anunciar([2])
+        self.anunciador.enviar_pendentes()
+
+        corpos = [chamada.kwargs["json"] for chamada in post.call_args_list]
+        self.assertEqual(corpos[0], {"peer_id": "peer1", "seq": 1, "blocks": [1, 3, 7]})
+        self.assertEqual(corpos[1]["seq"], 2)
+        self.assertEqual(corpos[1]["blocks"], [2])
+
+    @mock.patch("src.peer.tracker_announcer.requests.post")
+    def test_falha_reenvia_o_mesmo_lote_e_o_novo_no_seq_seguinte(self, post):
+        # A resposta do primeiro envio se perdeu: o tracker pode já ter aplicado o seq 1
+        post.side_effect = [requests.exceptions.ConnectionError("fora do ar"), _resposta(200), _resposta(200)]
+        self.anunciador.anunciar([5])
+        self.assertFalse(self.anunciador.enviar_pendentes())
+        self.anunciador.anunciar([6])
+        self.assertTrue(self.anunciador.enviar_pendentes())
+
+        corpos = [(chamada.kwargs["json"]["seq"], chamada.kwargs["json"]["blocks"]) for chamada in post.call_args_list]
+        self.assertEqual(corpos, [(1, [5]), (1, [5]), (2, [6])])
+
+    @mock.patch("src.peer.tracker_announcer.requests.post")
+    def test_fora_de_sequencia_registra_de_novo(self, post):
+        post.return_value = _resposta(409)
+        self.anunciador.anunciar([4])
+        self.anunciador.enviar_pendentes()
+        self.assertEqual(self.peer.registros, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
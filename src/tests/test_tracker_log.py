@@ -0,0 +1,35 @@
+import logging
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from tracker.tracker_log import FiltroTaxa
+
+
+def _registro(msg, nivel=logging.INFO):
+    return logging.LogRecord("minibit.tracker", nivel, __file__, 1, msg, ("x",), None)
+
+
+class TestFiltroTaxa(unittest.TestCase):
+    @mock.patch("tracker.tracker_log.time.monotonic")
+    def test_limita_por_modelo_e_conta_suprimidas(self, relogio):
+        relogio.return_value = 100.0
+        filtro = FiltroTaxa(maximo=2, intervalo_s=1.0)
+
+        passaram = [filtro.filter(_registro("Peer removido peer_id=%s")) for _ in range(5)]
+        self.assertEqual(passaram, [True, True, False, False, False])
+        # Outro modelo tem a sua própria janela, e avisos nunca são suprimidos
+        self.assertTrue(filtro.filter(_registro("Novo peer registrado peer_id=%s")))
+        self.assertTrue(filtro.filter(_registro("Peer removido peer_id=%s", logging.WARNING)))
+
+        relogio.return_value = 101.5
+        registro = _registro("Peer removido peer_id=%s")
+        self.assertTrue(filtro.filter(registro))
+        self.assertEqual(registro.getMessage(), "Peer removido peer_id=x (+3 suprimidas)")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Os módulos do tracker importam 'tracker' a partir de src/ (como o start_tracker.py)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.common.bitfield import Bitfield
+from src.peer.peer_node import PeerNode
+from tracker import tracker_server
+
+
+class TestRotasTracker(unittest.TestCase):
+    """Rotas do tracker pelo cliente de teste do Flask (sem iniciar(): nada vai para o disco)."""
+    def setUp(self):
+        self.cliente = tracker_server.app.test_client()
+
+    def _registrar(self, peer_id, blocos=()):
+        return self.cliente.post("/registrar_peer", json={
+            "peer_id": peer_id, "ip": "127.0.0.1", "porta": 6000,
+            "bitfield": Bitfield(tracker_server.distribuidor.total_blocos, blocos).to_base64()
+        })
+
+    def test_bitfield_invalido_responde_400(self):
+        resposta = self.cliente.post("/registrar_peer", json={
+            "peer_id": "rotas_a", "ip": "127.0.0.1", "porta": 6000, "bitfield": "###"
+        })
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIsNone(tracker_server.gerenciador_peers.obter_peer("rotas_a"))
+
+        self.assertEqual(self._registrar("rotas_b", [0]).status_code, 200)
+        resposta = self.cliente.post("/anunciar", json={"peer_id": "rotas_b", "seq": 1, "bitfield": "QQ"})
+        self.assertEqual(resposta.status_code, 400)
+        resposta = self.cliente.post("/anunciar", json={"peer_id": "rotas_b", "seq": 1, "blocks": ["x"]})
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_seq_invalido_responde_400(self):
+        self.assertEqual(self._registrar("rotas_c", [0]).status_code, 200)
+        for seq in ("um", [1], -1):
+            resposta = self.cliente.post("/anunciar", json={"peer_id": "rotas_c", "seq": seq, "blocks": [1]})
+            self.assertEqual(resposta.status_code, 400, seq)
+        resposta = self.cliente.post("/anunciar", json={"peer_id": "rotas_c", "seq": 1, "blocks": [1]})
+        self.assertEqual(resposta.get_json()["seq"], 1)
+
+    def test_resposta_com_peers_e_json_valido(self):
+        self._registrar("rotas_d", [0])
+        corpo = self._registrar("rotas_e", [1]).get_json()
+        self.assertEqual(corpo["message"], "Peer registrado com sucesso!")
+        self.assertIn("rotas_d", [peer["peer_id"] for peer in corpo["peers"]])
+        corpo = self.cliente.get("/listar_peers", query_string={"peer_id": "rotas_e", "desde": corpo["versao"]}).get_json()
+        self.assertEqual((corpo["completo"], corpo["peers"], corpo["removidos"]), (False, [], []))
+
+    def test_peer_no_intervalo_maximo_continua_listado(self):
+        with mock.patch("tracker.peer_manager.time.time") as relogio:
+            relogio.return_value = 1000.0
+            self._registrar("espera_ativo", [0])
+            self._registrar("espera_calado", [1])
+            for _ in range(5):
+                relogio.return_value += PeerNode.INTERVALO_TRACKER_MAX_S
+                resposta = self.cliente.get("/listar_peers", query_string={"peer_id": "espera_ativo"})
+                self.assertEqual(resposta.status_code, 200)
+                tracker_server._remover_peers_inativos()
+                self.assertIsNotNone(tracker_server.gerenciador_peers.obter_peer("espera_ativo"))
+
+        # Quem ficou calado passou do timeout: sai do tracker e é mandado se registrar de novo
+        self.assertIsNone(tracker_server.gerenciador_peers.obter_peer("espera_calado"))
+        resposta = self.cliente.get("/listar_peers", query_string={"peer_id": "espera_calado"})
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_enxame_maior_que_numwant_em_varias_consultas(self):
+        versao = self._registrar("amostra_eu").get_json()["versao"]
+        for i in range(12):
+            self._registrar(f"amostra_{i}", [i % 4])
+        vistos = set()
+        for _ in range(8):
+            corpo = self.cliente.get("/listar_peers", query_string={
+                "peer_id": "amostra_eu", "numwant": 3, "desde": versao
+            }).get_json()
+            self.assertFalse(corpo["completo"])
+            self.assertEqual(len(corpo["peers"]), 3)
+            vistos.update(peer["peer_id"] for peer in corpo["peers"])
+            versao = corpo["versao"]
+        # Consultas incrementais sem mudanças continuam oferecendo peers novos
+        self.assertGreater(len(vistos), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
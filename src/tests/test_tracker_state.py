@@ -0,0 +1,147 @@
+import os
+import sys
+import tempfile
+import unittest
+from threading import Event, Thread
+from unittest import mock
+
+# Os módulos do tracker importam 'tracker' a partir de src/ (como o start_tracker.py)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.common.bitfield import Bitfield
+from tracker.block_distributor import DistribuidorBlocos
+from tracker.peer_manager import GerenciadorPeers
+from tracker.persistence import PersistenciaTracker
+from tracker.striped_locks import TravasListradas
+
+
+class TestExpiracaoPeers(unittest.TestCase):
+    @mock.patch("tracker.peer_manager.time.time")
+    def test_heap_expira_so_quem_ficou_sem_contato(self, relogio):
+        gerenciador = GerenciadorPeers()
+        relogio.return_value = 100.0
+        gerenciador.adicionar_peer("a", "127.0.0.1", 6001)
+        gerenciador.adicionar_peer("b", "127.0.0.1", 6002)
+        registro_antigo = gerenciador.obter_peer("b")
+        relogio.return_value = 150.0
+        gerenciador.atualizar_timestamp("b")
+        # O registro é trocado, não alterado: quem já o tinha em mãos não o vê mudar
+        self.assertEqual(registro_antigo["timestamp"], 100.0)
+        self.assertEqual(gerenciador.obter_peer("b")["timestamp"], 150.0)
+
+        relogio.return_value = 170.0
+        self.assertEqual(gerenciador.limpar_peers_inativos(timeout=60), ["a"])
+        self.assertIsNotNone(gerenciador.obter_peer("b"))
+
+        # 'b' só vence 60s depois do contato novo, e uma vez só
+        relogio.return_value = 209.0
+        self.assertEqual(gerenciador.peers_expirados(timeout=60), [])
+        relogio.return_value = 211.0
+        self.assertEqual(gerenciador.peers_expirados(timeout=60), ["b"])
+        self.assertEqual(gerenciador.peers_expirados(timeout=60), [])
+        self.assertTrue(gerenciador.esta_inativo("b", 60))
+
+
+class TestEstadoConcorrente(unittest.TestCase):
+    def test_anuncios_concorrentes_mantem_histograma(self):
+        distribuidor = DistribuidorBlocos(total_blocos=64)
+        travas = TravasListradas(8)
+        peers = [f"peer{i}" for i in range(16)]
+        for peer_id in peers:
+            distribuidor.atualizar_blocos_peer(peer_id, [])
+            distribuidor.reiniciar_anuncios(peer_id)
+
+        def anunciar_tudo(peer_id):
+            for seq, bloco in enumerate(range(64), start=1):
+                with travas.trava(peer_id):
+                    distribuidor.aplicar_anuncio(peer_id, seq, [bloco])
+
+        threads = [Thread(target=anunciar_tudo, args=(peer_id,)) for peer_id in peers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(distribuidor.disponibilidade, [len(peers)] * 64)
+        self.assertTrue(all(distribuidor.peer_tem_arquivo_completo(peer_id) for peer_id in peers))
+
+
+class TestPersistenciaTracker(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.dir.name, "estado")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _b64(self, *blocos):
+        return Bitfield(8, blocos).to_base64()
+
+    def test_diario_e_compactacao(self):
+        persistencia = PersistenciaTracker(self.base, total_blocos=8)
+        persistencia.registrar_peer("a", "127.0.0.1", 6001, self._b64(0))
+        persistencia.registrar_peer("b", "127.0.0.1", 6002, self._b64(1))
+        persistencia.registrar_anuncio("a", 1, self._b64(4))
+        persistencia.compactar(lambda: [["a", "127.0.0.1", 6001, 1, self._b64(0, 4)],
+                                        ["b", "127.0.0.1", 6002, 0, self._b64(1)]])
+        # Depois da troca do diário: repetições do que o snapshot já tem não mudam nada
+        persistencia.registrar_anuncio("a", 1, self._b64(4))
+        persistencia.registrar_anuncio("a", 2, self._b64(5))
+        persistencia.registrar_remocao("b")
+        persistencia.fechar()
+        with open(self.base + ".diario", "a", encoding="utf-8") as f:
+            f.write('["a","a",3,')
+
+        peers = PersistenciaTracker(self.base, total_blocos=8).carregar()
+        self.assertEqual(list(peers), ["a"])
+        ip, porta, seq, blocos = peers["a"]
+        self.assertEqual((ip, porta, seq, set(blocos)), ("127.0.0.1", 6001, 2, {0, 4, 5}))
+
+    def test_compactacoes_simultaneas_nao_perdem_o_diario(self):
+        persistencia = PersistenciaTracker(self.base, total_blocos=8)
+        persistencia.registrar_peer("a", "127.0.0.1", 6001, self._b64(0))
+        gerando, liberar = Event(), Event()
+
+        def gerar_lento():
+            gerando.set()
+            liberar.wait(2)
+            return [["a", "127.0.0.1", 6001, 0, self._b64(0)]]
+
+        primeira = Thread(target=persistencia.compactar, args=(gerar_lento,))
+        primeira.start()
+        gerando.wait(2)
+        # Entra no diário novo enquanto a primeira compactação ainda gera o snapshot
+        persistencia.registrar_anuncio("a", 1, self._b64(4))
+        segunda = Thread(target=persistencia.compactar,
+                         args=(lambda: [["a", "127.0.0.1", 6001, 1, self._b64(0, 4)]],))
+        segunda.start()
+        segunda.join(0.5) # sem a exclusão, a segunda terminaria aqui, antes da primeira
+        liberar.set()
+        primeira.join()
+        segunda.join()
+        persistencia.fechar()
+
+        ip, porta, seq, blocos = PersistenciaTracker(self.base, total_blocos=8).carregar()["a"]
+        self.assertEqual((seq, set(blocos)), (1, {0, 4}))
+        self.assertEqual(os.listdir(self.dir.name), ["estado.json"])
+
+    def test_snapshot_de_outro_arquivo_e_ignorado(self):
+        persistencia = PersistenciaTracker(self.base, total_blocos=8)
+        persistencia.compactar(lambda: [["a", "127.0.0.1", 6001, 0, self._b64(0)]])
+        # O temporário da compactação não fica para trás
+        self.assertEqual(os.listdir(self.dir.name), ["estado.json"])
+        self.assertEqual(PersistenciaTracker(self.base, total_blocos=16).carregar(), {})
+
+    def test_restauracao_em_lote_refaz_histograma(self):
+        distribuidor = DistribuidorBlocos(total_blocos=8)
+        distribuidor.restaurar_peers({
+            "a": (Bitfield(8, [0, 1, 7]), 3),
+            "b": (Bitfield(8, [1, 7]), 0),
+            "c": (Bitfield(8, [7]), 1),
+        })
+        self.assertEqual(distribuidor.disponibilidade, [1, 2, 0, 0, 0, 0, 0, 3])
+        self.assertEqual(distribuidor.seq_anuncio_por_peer["a"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,36 @@
 import random
+from threading import Lock
+
+from src.common.bitfield import Bitfield
+from tracker.tracker_log import logger
 
 class DistribuidorBlocos:
+    """
+    Blocos de cada peer e disponibilidade de cada bloco no enxame.
+
+    O Bitfield guardado de um peer nunca é alterado no lugar, só substituído,
+    então pode ser lido sem lock. Operações sobre um mesmo peer devem ser
+    serializadas pelo chamador (travas por peer do tracker_server). O histograma,
+    compartilhado por todos os peers, tem seu próprio lock.
+    """
     def __init__(self, total_blocos=20):
         # Número total de blocos do arquivo
         self.total_blocos = total_blocos
         
-        # Dicionário para rastrear quais blocos cada peer possui
-        self.blocos_por_peer: dict[str, set[int]] = {} 
+        # Dicionário para rastrear quais blocos cada peer possui (um Bitfield por peer)
+        self.blocos_por_peer: dict[str, Bitfield] = {}
+
+        # Histograma de disponibilidade: quantos peers têm cada bloco.
+        # Mantido a cada mudança de inventário, para não recontar todos os peers
+        self.disponibilidade: list[int] = [0] * total_blocos
+        self._histograma_lock = Lock()
+
+        # Último seq de anúncio aplicado de cada peer (0 = logo após o registro)
+        self.seq_anuncio_por_peer: dict[str, int] = {}
         
-        print(f"Distribuidor iniciado com {total_blocos} blocos totais")
+        logger.info("Distribuidor iniciado total_blocos=%d", total_blocos)
     
-    def distribuir_blocos_iniciais(self, peer_id: str) -> list[int]:
+    def distribuir_blocos_iniciais(self, peer_id: str) -> Bitfield:
         """Distribui blocos iniciais aleatórios para um novo peer."""
         # Cada peer começa com 30-50% dos blocos aleatoriamente
         min_blocos = max(1, self.total_blocos // 3)  # mínimo 1/3
@@ -19,82 +39,127 @@ class DistribuidorBlocos:
         num_blocos = random.randint(min_blocos, max_blocos)
         
         # Seleciona blocos aleatórios
-        todos_blocos = list(range(self.total_blocos))
-        blocos_selecionados = random.sample(todos_blocos, num_blocos)
+        blocos_iniciais = Bitfield(self.total_blocos, random.sample(range(self.total_blocos), num_blocos))
         
-        # Salva os blocos do peer como um set
-        self.blocos_por_peer[peer_id] = set(blocos_selecionados)
+        # Salva os blocos do peer como um Bitfield
+        self._substituir_blocos(peer_id, blocos_iniciais)
+        logger.debug("Blocos iniciais peer_id=%s quantidade=%d", peer_id, num_blocos)
         
-        # Para logging ou retorno
-        blocos_ordenados = sorted(list(self.blocos_por_peer[peer_id]))
-        print(f"Peer {peer_id} recebeu {len(blocos_ordenados)} blocos iniciais: {blocos_ordenados}")
-        
-        return blocos_ordenados # Retorna como lista ordenada para consistência com o que o peer espera
+        return blocos_iniciais
 
 
     def obter_blocos_peer(self, peer_id: str) -> list[int]:
         """Retorna lista de blocos que um peer possui."""
         # Retorna uma lista ordenada 
-        return sorted(list(self.blocos_por_peer.get(peer_id, set())))
+        return list(self.obter_bitfield_peer(peer_id))
+
+    def obter_bitfield_peer(self, peer_id: str) -> Bitfield:
+        """Retorna o Bitfield de blocos de um peer (vazio se o peer não for conhecido)."""
+        bitfield = self.blocos_por_peer.get(peer_id)
+        return bitfield if bitfield is not None else Bitfield(self.total_blocos)
     
-    def atualizar_blocos_peer(self, peer_id: str, novos_blocos: list[int]):
-        """Atualiza lista de blocos de um peer."""
-        # Converte a lista de entrada para um set 
-        self.blocos_por_peer[peer_id] = set(novos_blocos)
-        print(f"Blocos do peer {peer_id} atualizados para {len(novos_blocos)} blocos.")
+    def _substituir_blocos(self, peer_id: str, novos_blocos: Bitfield | None):
+        """Troca o inventário do peer (None = remove) e ajusta o histograma só pela diferença."""
+        antigos = self.blocos_por_peer.get(peer_id)
+        vazio = Bitfield(self.total_blocos)
+        if antigos is None:
+            antigos = vazio
+        if novos_blocos is None:
+            self.blocos_por_peer.pop(peer_id, None)
+            novos_blocos = vazio
+        else:
+            self.blocos_por_peer[peer_id] = novos_blocos
+        with self._histograma_lock:
+            for bloco in antigos - novos_blocos:
+                self.disponibilidade[bloco] -= 1
+            for bloco in novos_blocos - antigos:
+                self.disponibilidade[bloco] += 1
+
+    def atualizar_blocos_peer(self, peer_id: str, novos_blocos):
+        """Atualiza os blocos de um peer (Bitfield ou lista de ids)."""
+        self._substituir_blocos(peer_id, Bitfield.de(novos_blocos, self.total_blocos).copy())
+        logger.debug("Blocos atualizados peer_id=%s", peer_id)
     
+    def restaurar_peers(self, peers: dict[str, tuple[Bitfield, int]]):
+        """
+        Recoloca inventários e sequências de anúncio lidos do estado salvo (peer_id -> (blocos, seq)).
+        O histograma é recalculado de uma vez, em vez de peer a peer.
+        """
+        for peer_id, (blocos, seq) in peers.items():
+            self.blocos_por_peer[peer_id] = blocos
+            self.seq_anuncio_por_peer[peer_id] = seq
+        with self._histograma_lock:
+            self.disponibilidade = Bitfield.contar_por_bloco(self.blocos_por_peer.values(), self.total_blocos)
+
+    def reiniciar_anuncios(self, peer_id: str):
+        """Zera a sequência de anúncios do peer (ele acabou de enviar o inventário completo)."""
+        self.seq_anuncio_por_peer[peer_id] = 0
+
+    def aplicar_anuncio(self, peer_id: str, seq: int, novos_blocos) -> bool:
+        """
+        Soma ao inventário do peer os blocos novos de um anúncio.
+        Um anúncio repetido (seq já aplicado) é aceito sem efeito. Retorna False se o
+        peer é desconhecido ou se faltou um anúncio na sequência: o tracker não sabe
+        mais o inventário dele e precisa do Bitfield completo.
+        """
+        ultimo_seq = self.seq_anuncio_por_peer.get(peer_id)
+        if ultimo_seq is None or peer_id not in self.blocos_por_peer or seq > ultimo_seq + 1:
+            return False
+        if seq == ultimo_seq + 1:
+            self._substituir_blocos(peer_id, self.blocos_por_peer[peer_id] | novos_blocos)
+            self.seq_anuncio_por_peer[peer_id] = seq
+        return True
+
     def adicionar_bloco_peer(self, peer_id: str, num_bloco: int):
         """Adiciona um bloco específico a um peer."""
-        if peer_id not in self.blocos_por_peer:
-            self.blocos_por_peer[peer_id] = set() # Inicializa como set vazio
+        blocos_do_peer = self.obter_bitfield_peer(peer_id) # vazio se ainda não conhecido
         
-        if num_bloco not in self.blocos_por_peer[peer_id]:
-            self.blocos_por_peer[peer_id].add(num_bloco)
-            print(f"Bloco {num_bloco} adicionado ao peer {peer_id}.")
-        else:
-            print(f"Peer {peer_id} já possui o bloco {num_bloco}.")
+        if num_bloco not in blocos_do_peer:
+            self._substituir_blocos(peer_id, blocos_do_peer | [num_bloco])
+            logger.debug("Bloco adicionado peer_id=%s bloco=%d", peer_id, num_bloco)
+
+    def obter_disponibilidade(self) -> list[int]:
+        """Cópia do histograma: quantos peers têm cada bloco."""
+        with self._histograma_lock:
+            return list(self.disponibilidade)
 
     def obter_estatisticas_blocos(self) -> dict:
         """Retorna estatísticas sobre distribuição de blocos."""
-        if not self.blocos_por_peer:
+        blocos_por_peer = list(self.blocos_por_peer.items())
+        if not blocos_por_peer:
             return {"total_peers": 0, "total_blocos": self.total_blocos, "blocos_por_peer": {}, "distribuicao_blocos": {}}
         
         estatisticas = {
-            "total_peers": len(self.blocos_por_peer),
+            "total_peers": len(blocos_por_peer),
             "total_blocos": self.total_blocos,
             "blocos_por_peer": {} # Quantidade de blocos por peer
         }
         
-        # Conta quantos peers têm cada bloco
-        contador_blocos: dict[int, int] = {bloco_id: 0 for bloco_id in range(self.total_blocos)}
-        
-        for peer_id, blocos_do_peer in self.blocos_por_peer.items():
+        for peer_id, blocos_do_peer in blocos_por_peer:
             estatisticas["blocos_por_peer"][peer_id] = len(blocos_do_peer)
-            
-            for bloco in blocos_do_peer:
-                if bloco in contador_blocos: # Garante que é um bloco válido do arquivo
-                    contador_blocos[bloco] += 1
         
-        estatisticas["distribuicao_blocos"] = contador_blocos
+        # Quantos peers têm cada bloco, direto do histograma mantido incrementalmente
+        estatisticas["distribuicao_blocos"] = dict(enumerate(self.obter_disponibilidade()))
         
         return estatisticas
     
     def remover_peer(self, peer_id: str):
         """Remove peer da lista de distribuição."""
         if peer_id in self.blocos_por_peer:
-            del self.blocos_por_peer[peer_id]
-            print(f"Peer {peer_id} removido da distribuição.")
+            self._substituir_blocos(peer_id, None)
+            self.seq_anuncio_por_peer.pop(peer_id, None)
+            logger.debug("Removido da distribuição peer_id=%s", peer_id)
         else:
-            print(f"Peer {peer_id} não encontrado na distribuição para remoção.")
+            logger.debug("Remoção da distribuição sem efeito, peer desconhecido peer_id=%s", peer_id)
     
     def peer_tem_arquivo_completo(self, peer_id: str) -> bool:
         """Verifica se peer tem o arquivo completo."""
         # Se o peer não está registrado, não pode ter o arquivo completo
-        if peer_id not in self.blocos_por_peer:
+        blocos_do_peer = self.blocos_por_peer.get(peer_id)
+        if blocos_do_peer is None:
             return False
         
-        blocos_peer = self.blocos_por_peer[peer_id]
-        return len(blocos_peer) == self.total_blocos
+        return blocos_do_peer.completo()
     
     def __str__(self):
         """Representação em string do distribuidor."""
@@ -0,0 +1,87 @@
+from collections import OrderedDict, deque
+from threading import Lock
+
+
+class RegistroMudancas:
+    """
+    Registro de mudanças do enxame com uma versão monotonicamente crescente.
+
+    Cada entrada, registro ou remoção de peer, ou mudança de inventário, gera uma nova versão.
+    Para cada peer guardamos só a versão da sua última mudança, num OrderedDict
+    em ordem de versão. Assim, "o que mudou desde a versão v" percorre a partir do fim
+    apenas as entradas mais novas que v, e o custo acompanha a rotatividade, não o
+    tamanho do enxame. É seguro para várias threads (um lock curto por operação).
+    Peers removidos ficam como lápides (até max_lapides), também enfileiradas por
+    versão, para descartar a mais antiga sem percorrer o registro. Quando uma lápide
+    antiga é descartada, quem pedir mudanças desde antes dela recebe a lista completa.
+    """
+    def __init__(self, max_lapides: int = 1024, versao_inicial: int = 0):
+        self.versao = versao_inicial
+        self.max_lapides = max_lapides
+        # peer_id -> (versao, removido), em ordem crescente de versão
+        self._ultima_mudanca: OrderedDict[str, tuple[int, bool]] = OrderedDict()
+        self._lapides = 0
+        # (versao, peer_id) de cada remoção, da mais antiga para a mais nova; entradas de
+        # peers que voltaram depois ficam aqui até serem puladas no descarte
+        self._fila_lapides: deque[tuple[int, str]] = deque()
+        # Pedidos com 'desde' abaixo disso podem ter perdido remoções: resposta completa
+        self._versao_minima = versao_inicial
+        self._lock = Lock()
+
+    def marcar_alterado(self, peer_id: str) -> int:
+        """Registra que o peer entrou ou mudou de inventário. Retorna a nova versão."""
+        with self._lock:
+            return self._registrar(peer_id, removido=False)
+
+    def marcar_removido(self, peer_id: str) -> int:
+        """Registra que o peer saiu do enxame. Retorna a nova versão."""
+        with self._lock:
+            versao = self._registrar(peer_id, removido=True)
+            self._lapides += 1
+            self._fila_lapides.append((versao, peer_id))
+            if self._lapides > self.max_lapides:
+                self._descartar_lapide_mais_antiga()
+            elif len(self._fila_lapides) > 2 * self.max_lapides:
+                # Muitas entradas de peers que voltaram: a fila fica só com as lápides vigentes
+                self._fila_lapides = deque(
+                    (v, p) for v, p in self._fila_lapides if self._ultima_mudanca.get(p) == (v, True)
+                )
+            return versao
+
+    def _registrar(self, peer_id: str, removido: bool) -> int:
+        anterior = self._ultima_mudanca.pop(peer_id, None)
+        if anterior is not None and anterior[1]:
+            self._lapides -= 1
+        self.versao += 1
+        self._ultima_mudanca[peer_id] = (self.versao, removido)
+        return self.versao
+
+    def _descartar_lapide_mais_antiga(self):
+        while self._fila_lapides:
+            versao, peer_id = self._fila_lapides.popleft()
+            if self._ultima_mudanca.get(peer_id) == (versao, True):
+                del self._ultima_mudanca[peer_id]
+                self._lapides -= 1
+                self._versao_minima = max(self._versao_minima, versao)
+                return
+
+    def versao_do_peer(self, peer_id: str) -> int:
+        """Versão da última mudança do peer (0 se nunca mudou)."""
+        registro = self._ultima_mudanca.get(peer_id)
+        return registro[0] if registro is not None else 0
+
+    def mudancas_desde(self, desde: int) -> tuple[list[str], list[str]] | None:
+        """
+        Peers alterados e peers removidos depois da versão 'desde'.
+        Retorna None se 'desde' é antigo (ou inválido) demais para uma resposta incremental.
+        """
+        with self._lock:
+            if desde < self._versao_minima or desde > self.versao:
+                return None
+            alterados: list[str] = []
+            removidos: list[str] = []
+            for peer_id, (versao, removido) in reversed(self._ultima_mudanca.items()):
+                if versao <= desde:
+                    break
+                (removidos if removido else alterados).append(peer_id)
+            return alterados, removidos
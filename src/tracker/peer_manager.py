@@ -1,29 +1,59 @@
+import heapq
 import time
+from threading import Lock
+
+from tracker.tracker_log import logger
 
 class GerenciadorPeers:
+    """
+    Peers ativos do tracker.
+
+    Cada peer é um dicionário substituído por inteiro a cada atualização, então
+    leituras concorrentes nunca veem um registro pela metade. A expiração usa um
+    heap de (último contato, peer_id) com no máximo uma entrada por peer: a
+    varredura só olha o topo, em vez de percorrer todos os peers. Operações
+    compostas sobre um mesmo peer devem ser serializadas pelo chamador (travas
+    por peer do tracker_server).
+    """
     def __init__(self):
         # Dicionário: peer_id -> {ip, porta, timestamp}
         self.peers_ativos = {}
-        print("Gerenciador de Peers iniciado")
+        # Heap de (timestamp, peer_id) para a expiração; _na_fila evita entradas repetidas
+        self._fila_expiracao: list[tuple[float, str]] = []
+        self._na_fila: set[str] = set()
+        self._fila_lock = Lock()
+        logger.info("Gerenciador de Peers iniciado")
 
     def adicionar_peer(self, peer_id, ip, porta):
         """Adiciona um peer novo ou atualiza as informações de um peer existente."""
-        self.peers_ativos[peer_id] = self.peers_ativos.get(peer_id, {})
-        self.peers_ativos[peer_id].update({
+        agora = time.time()
+        self.peers_ativos[peer_id] = {
+            **self.peers_ativos.get(peer_id, {}),
             'peer_id': peer_id,
             'ip': ip,
             'porta': porta,
-            'timestamp': time.time()
-        })
-        print(f"Peer adicionado/atualizado: {peer_id} ({ip}:{porta})")
+            'timestamp': agora
+        }
+        self._agendar_expiracao(peer_id, agora)
+        logger.debug("Peer adicionado/atualizado peer_id=%s ip=%s porta=%s", peer_id, ip, porta)
+
+    def restaurar_peers(self, peers):
+        """Recoloca peers lidos do estado salvo ((peer_id, ip, porta), ...), contando o contato a partir de agora."""
+        agora = time.time()
+        with self._fila_lock:
+            for peer_id, ip, porta in peers:
+                self.peers_ativos[peer_id] = {'peer_id': peer_id, 'ip': ip, 'porta': porta, 'timestamp': agora}
+                if peer_id not in self._na_fila:
+                    self._na_fila.add(peer_id)
+                    self._fila_expiracao.append((agora, peer_id))
+            heapq.heapify(self._fila_expiracao)
 
     def remover_peer(self, peer_id):
         """Remove peer da lista de ativos."""
-        if peer_id in self.peers_ativos:
-            del self.peers_ativos[peer_id]
-            print(f"Peer removido: {peer_id}")
+        if self.peers_ativos.pop(peer_id, None) is not None:
+            logger.debug("Peer removido peer_id=%s", peer_id)
         else:
-            print(f"Peer {peer_id} não encontrado para remoção")
+            logger.debug("Remoção sem efeito, peer desconhecido peer_id=%s", peer_id)
 
     def listar_peers_ativos(self):
         """Retorna uma lista de dicionários com todos os peers ativos."""
@@ -37,21 +67,53 @@ class GerenciadorPeers:
         """Retorna o número total de peers ativos."""
         return len(self.peers_ativos)
 
+    def _agendar_expiracao(self, peer_id, timestamp):
+        with self._fila_lock:
+            if peer_id not in self._na_fila:
+                self._na_fila.add(peer_id)
+                heapq.heappush(self._fila_expiracao, (timestamp, peer_id))
+
+    def esta_inativo(self, peer_id, timeout) -> bool:
+        """True se o peer existe e está sem contato há mais de 'timeout' segundos."""
+        peer = self.peers_ativos.get(peer_id)
+        return peer is not None and time.time() - peer['timestamp'] > timeout
+
+    def peers_expirados(self, timeout=300) -> list:
+        """
+        Retira do heap e retorna os peers sem contato há mais de 'timeout' segundos
+        (sem removê-los). Custa O(k log n) para k entradas vencidas no topo do heap.
+        """
+        limite = time.time() - timeout
+        expirados = []
+        with self._fila_lock:
+            while self._fila_expiracao and self._fila_expiracao[0][0] < limite:
+                timestamp, peer_id = heapq.heappop(self._fila_expiracao)
+                peer = self.peers_ativos.get(peer_id)
+                if peer is None:
+                    self._na_fila.discard(peer_id)
+                elif peer['timestamp'] > timestamp:
+                    # Teve contato depois de entrar na fila: volta com o horário novo
+                    heapq.heappush(self._fila_expiracao, (peer['timestamp'], peer_id))
+                else:
+                    self._na_fila.discard(peer_id)
+                    expirados.append(peer_id)
+        return expirados
+
     def limpar_peers_inativos(self, timeout=300):
-        """Remove peers que estão inativos há mais de 'timeout' segundos."""
-        tempo_atual = time.time()
-        inativos = [
-            peer_id for peer_id, dados in self.peers_ativos.items()
-            if tempo_atual - dados['timestamp'] > timeout
-        ]
+        """Remove peers que estão inativos há mais de 'timeout' segundos. Retorna os ids removidos."""
+        inativos = self.peers_expirados(timeout)
         for peer_id in inativos:
             self.remover_peer(peer_id)
-            print(f"Peer inativo removido: {peer_id}")
+            logger.info("Peer inativo removido peer_id=%s", peer_id)
+        return inativos
 
     def atualizar_timestamp(self, peer_id):
-        """Atualiza o timestamp de um peer existente."""
-        if peer_id in self.peers_ativos:
-            self.peers_ativos[peer_id]['timestamp'] = time.time()
+        """Atualiza o timestamp de um peer existente (trocando o registro inteiro)."""
+        peer = self.peers_ativos.get(peer_id)
+        if peer is not None:
+            agora = time.time()
+            self.peers_ativos[peer_id] = {**peer, 'timestamp': agora}
+            self._agendar_expiracao(peer_id, agora)
 
     def __str__(self):
         return f"GerenciadorPeers: {len(self.peers_ativos)} peers ativos"
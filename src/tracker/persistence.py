@@ -0,0 +1,167 @@
+import json
+import os
+import tempfile
+import time
+from threading import Lock
+
+from src.common.bitfield import Bitfield
+from tracker.tracker_log import logger
+
+
+class PersistenciaTracker:
+    """
+    Estado do tracker em disco: snapshot + diário (append-only), para um reinício rápido.
+
+    - '<base>.json': snapshot com [peer_id, ip, porta, seq, bitfield_base64] de cada
+      peer, substituído de forma atômica (arquivo temporário de nome único + os.replace).
+    - '<base>.diario': uma linha JSON por mudança depois do snapshot:
+        ["r", peer_id, ip, porta, bitfield]  registro (inventário completo, seq volta a 0)
+        ["b", peer_id, bitfield]             inventário completo trocado
+        ["a", peer_id, seq, bitfield]        anúncio (blocos novos somados)
+        ["x", peer_id]                       remoção
+      Reaplicar uma operação já refletida no snapshot não muda o resultado, então
+      a compactação pode gerar o snapshot sem parar o tracker.
+
+    As mudanças de um mesmo peer precisam ser escritas na ordem em que foram
+    aplicadas (o tracker_server escreve com a trava do peer).
+    """
+    def __init__(self, caminho_base: str, total_blocos: int, max_entradas_diario: int = 50000):
+        self.total_blocos = total_blocos
+        self.caminho_snapshot = caminho_base + ".json"
+        self.caminho_diario = caminho_base + ".diario"
+        # Diário antigo durante uma compactação (só sobra se o processo cair no meio dela)
+        self.caminho_diario_antigo = caminho_base + ".diario.antigo"
+        self.max_entradas_diario = max_entradas_diario
+        self._lock = Lock()
+        # Uma compactação por vez: uma mais antiga e lenta não pode sobrescrever o
+        # snapshot de uma mais nova e depois apagar o diário que ela ainda precisa
+        self._compactacao = Lock()
+        self._diario = None
+        self._entradas_no_diario = 0
+
+    def carregar(self) -> dict[str, list]:
+        """
+        Lê o snapshot e reaplica os diários. Retorna peer_id -> [ip, porta, seq, Bitfield].
+        Um estado ilegível ou de outro arquivo é tratado como vazio; uma linha
+        incompleta no fim do diário é ignorada.
+        """
+        peers: dict[str, list] = {}
+        try:
+            with open(self.caminho_snapshot, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot["total_blocos"] != self.total_blocos:
+                logger.warning("Snapshot de um arquivo com outro número de blocos, ignorado caminho=%s", self.caminho_snapshot)
+                return {}
+            de_base64, total_blocos = Bitfield.from_base64, self.total_blocos
+            for peer in snapshot["peers"]:
+                # [peer_id, ip, porta, seq, bitfield] -> peer_id: [ip, porta, seq, Bitfield], reaproveitando a lista
+                peer_id = peer.pop(0)
+                peer[3] = de_base64(peer[3], total_blocos)
+                peers[peer_id] = peer
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Snapshot ilegível, ignorado caminho=%s erro=%s", self.caminho_snapshot, e)
+            peers = {}
+
+        for caminho in (self.caminho_diario_antigo, self.caminho_diario):
+            self._reaplicar_diario(caminho, peers)
+        return peers
+
+    def _reaplicar_diario(self, caminho: str, peers: dict[str, list]):
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                linhas = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        for linha in linhas:
+            try:
+                operacao = json.loads(linha)
+                tipo, peer_id = operacao[0], operacao[1]
+                if tipo == "r":
+                    peers[peer_id] = [operacao[2], operacao[3], 0, Bitfield.from_base64(operacao[4], self.total_blocos)]
+                elif tipo == "b" and peer_id in peers:
+                    peers[peer_id][3] = Bitfield.from_base64(operacao[2], self.total_blocos)
+                elif tipo == "a" and peer_id in peers:
+                    peers[peer_id][2] = operacao[2]
+                    peers[peer_id][3] = peers[peer_id][3] | Bitfield.from_base64(operacao[3], self.total_blocos)
+                elif tipo == "x":
+                    peers.pop(peer_id, None)
+            except (ValueError, IndexError, TypeError):
+                continue # escrita interrompida
+
+    def _escrever(self, operacao: list):
+        linha = json.dumps(operacao, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._diario is None:
+                self._diario = open(self.caminho_diario, "a", encoding="utf-8")
+            self._diario.write(linha)
+            self._diario.flush()
+            self._entradas_no_diario += 1
+
+    def registrar_peer(self, peer_id: str, ip, porta, bitfield_base64: str):
+        self._escrever(["r", peer_id, ip, porta, bitfield_base64])
+
+    def trocar_blocos(self, peer_id: str, bitfield_base64: str):
+        self._escrever(["b", peer_id, bitfield_base64])
+
+    def registrar_anuncio(self, peer_id: str, seq: int, novos_base64: str):
+        self._escrever(["a", peer_id, seq, novos_base64])
+
+    def registrar_remocao(self, peer_id: str):
+        self._escrever(["x", peer_id])
+
+    def precisa_compactar(self) -> bool:
+        return self._entradas_no_diario >= self.max_entradas_diario
+
+    def compactar(self, gerar_peers):
+        """
+        Troca o diário por um novo e grava um snapshot do estado atual.
+        'gerar_peers' é chamado depois da troca e devolve [[peer_id, ip, porta, seq, bitfield_base64], ...];
+        o que mudar enquanto ele roda vai para o diário novo e é reaplicado por cima.
+        Compactações simultâneas (a da inicialização e a periódica) rodam uma depois da outra.
+        """
+        with self._compactacao:
+            self._compactar(gerar_peers)
+
+    def _compactar(self, gerar_peers):
+        with self._lock:
+            if self._diario is not None:
+                self._diario.close()
+                self._diario = None
+            if os.path.exists(self.caminho_diario_antigo):
+                # Sobra de uma compactação interrompida: o diário atual vai para o fim dele
+                if os.path.exists(self.caminho_diario):
+                    with open(self.caminho_diario, "rb") as origem, open(self.caminho_diario_antigo, "ab") as destino:
+                        destino.write(origem.read())
+                    os.remove(self.caminho_diario)
+            elif os.path.exists(self.caminho_diario):
+                os.replace(self.caminho_diario, self.caminho_diario_antigo)
+            self._entradas_no_diario = 0
+
+        inicio = time.perf_counter()
+        peers = gerar_peers()
+        # Nome único no mesmo diretório (o os.replace precisa do mesmo sistema de arquivos)
+        descritor, temporario = tempfile.mkstemp(
+            prefix=os.path.basename(self.caminho_snapshot) + ".",
+            suffix=".tmp",
+            dir=os.path.dirname(os.path.abspath(self.caminho_snapshot))
+        )
+        try:
+            with os.fdopen(descritor, "w", encoding="utf-8") as f:
+                json.dump({"total_blocos": self.total_blocos, "peers": peers}, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, self.caminho_snapshot)
+        except BaseException:
+            os.remove(temporario)
+            raise
+        if os.path.exists(self.caminho_diario_antigo):
+            os.remove(self.caminho_diario_antigo)
+        logger.info("Estado do tracker compactado peers=%d duracao_s=%.2f", len(peers), time.perf_counter() - inicio)
+
+    def fechar(self):
+        with self._lock:
+            if self._diario is not None:
+                self._diario.close()
+                self._diario = None
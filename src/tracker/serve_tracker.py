@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+
+# Adiciona o diretório src ao path para importar os módulos do tracker, e a raiz do
+# repositório para o src.common, que é o mesmo módulo importado pelos peers
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def main():
+    """
+    Sobe o tracker em modo de produção: o mesmo app Flask servido pelo waitress,
+    sem debug/reloader, com um pool de threads atendendo as requisições.
+
+    É um único processo de propósito: o estado do enxame fica em memória e é
+    compartilhado pelas threads (com travas por peer no tracker_server).
+    Vários processos (workers) teriam cada um o seu enxame.
+    """
+    parser = argparse.ArgumentParser(description="Tracker MiniBit em modo de produção (servidor WSGI waitress).")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Interface de escuta (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=5000, help="Porta HTTP (default: 5000)")
+    parser.add_argument("--threads", type=int, default=16, help="Threads atendendo requisições (default: 16)")
+    parser.add_argument("--connection_limit", type=int, default=1000, help="Conexões simultâneas aceitas (default: 1000)")
+    parser.add_argument("--backlog", type=int, default=2048, help="Fila de conexões pendentes do socket (default: 2048)")
+    parser.add_argument("--log_nivel", type=str, default="WARNING",
+                        help="Nível de log do tracker (default: WARNING, sem log por requisição; INFO/DEBUG para depurar)")
+    args = parser.parse_args()
+
+    try:
+        from waitress import serve
+    except ImportError:
+        print("O modo de produção usa o waitress. Instale com:")
+        print("pip install waitress")
+        print("(ou use python src/tracker/start_tracker.py para o servidor de desenvolvimento)")
+        return
+
+    # Antes de iniciar o servidor, que já registra a restauração do estado
+    from tracker.tracker_log import configurar_log
+    configurar_log(args.log_nivel)
+
+    from tracker_server import app, iniciar
+    iniciar()
+
+    print("=" * 50)
+    print("           MINIBIT TRACKER (produção)")
+    print("=" * 50)
+    print(f"- Endereço: {args.host}:{args.port}")
+    print(f"- Threads: {args.threads}, conexões simultâneas: {args.connection_limit}")
+    print(f"- Nível de log: {args.log_nivel.upper()}")
+    print("=" * 50)
+
+    serve(
+        app,
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        connection_limit=args.connection_limit,
+        backlog=args.backlog,
+        ident="minibit-tracker"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,30 @@
+import argparse
 import sys
 import os
 
-# Adiciona o diretório src ao path para importar os módulos
+# Adiciona o diretório src ao path para importar os módulos do tracker, e a raiz do
+# repositório para o src.common, que é o mesmo módulo importado pelos peers
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 def main():
     """Função principal para iniciar o tracker"""
+    parser = argparse.ArgumentParser(description="Tracker MiniBit (servidor de desenvolvimento do Flask).")
+    parser.add_argument("--log_nivel", type=str, default=None,
+                        help="Nível de log do tracker: DEBUG, INFO, WARNING... (default: MINIBIT_LOG_TRACKER ou INFO)")
+    args = parser.parse_args()
+
     print("=" * 50)
     print("           MINIBIT TRACKER")
     print("=" * 50)
     print()
     
     try:
+        from tracker.tracker_log import NIVEL_PADRAO, configurar_log
+        configurar_log(args.log_nivel or NIVEL_PADRAO)
+
         # Importa e executa o servidor do tracker
-        from tracker_server import app
+        from tracker_server import app, iniciar
         
         print("Configurações do Tracker:")
         print("- Porta: 5000")
@@ -22,9 +33,14 @@ def main():
         print()
         print("Endpoints disponíveis:")
         print("- POST /registrar_peer    - Registra novo peer")
+        print("- POST /anunciar         - Anuncia blocos novos de um peer")
         print("- GET  /listar_peers      - Lista peers disponíveis")
         print("- GET  /status           - Status do tracker")
+        print("- GET  /manifesto        - Hashes dos blocos do arquivo")
         print("- POST /desconectar_peer - Remove peer")
+        print("- GET  /metrics          - Métricas (formato Prometheus)")
+        print()
+        print("Modo de produção (waitress, várias threads): python src/tracker/serve_tracker.py")
         print()
         print("Para testar o tracker:")
         print("curl http://localhost:5000/status")
@@ -32,6 +48,10 @@ def main():
         print("Pressione Ctrl+C para parar o servidor")
         print("=" * 50)
         
+        # Com debug=True o Flask serve o app num processo filho (reloader), que é
+        # reiniciado a cada mudança no código: só ele restaura o estado e sobe as threads
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            iniciar()
         # Inicia o servidor Flask
         app.run(host='0.0.0.0', port=5000, debug=True)
         
@@ -0,0 +1,16 @@
+from threading import Lock
+
+
+class TravasListradas:
+    """
+    Conjunto fixo de locks repartido entre as chaves (lock striping).
+
+    Cada chave (peer_id) cai sempre no mesmo lock, por hash. Operações de um mesmo
+    peer ficam serializadas, e peers diferentes quase sempre usam locks
+    diferentes, sem um lock por peer nem um lock global.
+    """
+    def __init__(self, num_travas: int = 64):
+        self._travas = [Lock() for _ in range(num_travas)]
+
+    def trava(self, chave) -> Lock:
+        return self._travas[hash(chave) % len(self._travas)]
@@ -0,0 +1,147 @@
+import heapq
+import json
+import random
+import time
+from threading import Lock
+
+from tracker.block_distributor import DistribuidorBlocos
+from tracker.change_log import RegistroMudancas
+from tracker.peer_manager import GerenciadorPeers
+
+
+class VisaoEnxame:
+    """
+    Respostas do tracker já serializadas, reaproveitadas enquanto o enxame não muda.
+
+    - Cada peer tem seu fragmento JSON guardado com a versão da sua última
+      mudança no RegistroMudancas; só peers alterados são serializados de novo.
+    - A lista completa de fragmentos fica em cache pela versão global: consultas
+      repetidas sem mudanças no meio só juntam strings prontas (o solicitante é
+      pulado na junção).
+    - O JSON do /status percorre todos os peers e blocos, então é refeito no
+      máximo a cada intervalo_status_s (por uma thread só; as outras usam o
+      anterior), mesmo com anúncios chegando o tempo todo.
+    - Com 'numwant', a resposta traz no máximo esse número de peers, sorteados
+      com peso maior para quem tem blocos que faltam ao solicitante. Num enxame
+      maior que numwant, as respostas incrementais são completadas com uma nova
+      amostra, já que o solicitante só conhece parte do enxame.
+    Toda mudança de estado do tracker precisa passar pelo RegistroMudancas
+    (depois de alterar os dados), senão os caches não são invalidados.
+    Os caches têm um lock próprio; a serialização de um peer roda fora dele.
+    """
+    def __init__(self, gerenciador_peers: GerenciadorPeers, distribuidor: DistribuidorBlocos,
+                 registro_mudancas: RegistroMudancas, intervalo_status_s: float = 1.0):
+        self.gerenciador_peers = gerenciador_peers
+        self.distribuidor = distribuidor
+        self.registro_mudancas = registro_mudancas
+        # peer_id -> (versao do peer, fragmento JSON)
+        self._fragmentos: dict[str, tuple[int, str]] = {}
+        # (versao, [(peer_id, fragmento), ...]) da lista completa
+        self._lista: tuple[int, list[tuple[str, str]]] | None = None
+        # (versao, instante da montagem em time.monotonic(), JSON do /status)
+        self._status: tuple[int, float, str] | None = None
+        self.intervalo_status_s = intervalo_status_s
+        self._lock = Lock()
+        self._status_lock = Lock()
+
+    def fragmento_peer(self, peer: dict) -> str:
+        """JSON de um peer na resposta, com os blocos como Bitfield em base64."""
+        peer_id = peer["peer_id"]
+        versao = self.registro_mudancas.versao_do_peer(peer_id)
+        with self._lock:
+            em_cache = self._fragmentos.get(peer_id)
+        if em_cache is not None and em_cache[0] == versao:
+            return em_cache[1]
+        fragmento = json.dumps({
+            "peer_id": peer_id,
+            "ip": peer["ip"],
+            "porta": peer["porta"],
+            "bitfield": self.distribuidor.obter_bitfield_peer(peer_id).to_base64()
+        })
+        with self._lock:
+            self._fragmentos[peer_id] = (versao, fragmento)
+        return fragmento
+
+    def _lista_completa(self) -> list[tuple[str, str]]:
+        versao = self.registro_mudancas.versao
+        lista = self._lista
+        if lista is not None and lista[0] == versao:
+            return lista[1]
+        peers = self.gerenciador_peers.listar_peers_ativos()
+        lista = (versao, [(peer["peer_id"], self.fragmento_peer(peer)) for peer in peers])
+        ativos = {peer["peer_id"] for peer in peers}
+        with self._lock:
+            # Fragmentos de quem saiu não voltam a ser usados
+            for peer_id in self._fragmentos.keys() - ativos:
+                del self._fragmentos[peer_id]
+            self._lista = lista
+        return lista[1]
+
+    def amostrar(self, peer_ids: list[str], solicitante: str | None, numwant: int) -> list[str]:
+        """
+        Sorteia até numwant peers sem repetição. O peso de cada um é 1 + quantos blocos
+        ele tem que faltam ao solicitante, então os úteis tendem a vir, mas os demais
+        ainda aparecem. (Efraimidis-Spirakis: chave random() ** (1 / peso), maiores chaves.)
+        """
+        if len(peer_ids) <= numwant:
+            return peer_ids
+        meus_blocos = self.distribuidor.obter_bitfield_peer(solicitante)
+        blocos_por_peer = self.distribuidor.blocos_por_peer
+        chaves = []
+        for peer_id in peer_ids:
+            blocos = blocos_por_peer.get(peer_id)
+            peso = 1 + (meus_blocos.contar_faltantes_em(blocos) if blocos is not None else 0)
+            chaves.append((random.random() ** (1.0 / peso), peer_id))
+        return [peer_id for _, peer_id in heapq.nlargest(numwant, chaves)]
+
+    def peers_json(self, exceto: str | None = None, numwant: int | None = None) -> tuple[str, bool]:
+        """
+        Array JSON com os peers ativos, menos 'exceto', e se ele é só uma amostra
+        (mais de numwant peers ativos).
+        """
+        fragmentos = {peer_id: fragmento for peer_id, fragmento in self._lista_completa() if peer_id != exceto}
+        if numwant is None or len(fragmentos) <= numwant:
+            return "[" + ", ".join(fragmentos.values()) + "]", False
+        escolhidos = self.amostrar(list(fragmentos), exceto, numwant)
+        return "[" + ", ".join(fragmentos[peer_id] for peer_id in escolhidos) + "]", True
+
+    def peers_alterados_json(self, peer_ids, exceto: str | None = None, numwant: int | None = None) -> str:
+        """
+        Array JSON com os peers indicados que ainda estão ativos, menos 'exceto' (no máximo numwant).
+        Se há mais de numwant outros peers ativos (o solicitante recebeu só uma amostra), as
+        vagas que sobram até numwant vão para uma nova amostra ponderada dos demais: peers
+        que nunca mudam voltam a ser oferecidos, vizinhos que saíram podem ser substituídos
+        e a preferência por quem tem blocos que faltam vale a cada consulta, não só na primeira.
+        """
+        peers = {
+            peer_id: peer for peer_id, peer in
+            ((peer_id, self.gerenciador_peers.obter_peer(peer_id)) for peer_id in peer_ids if peer_id != exceto)
+            if peer is not None
+        }
+        escolhidos = list(peers) if numwant is None else self.amostrar(list(peers), exceto, numwant)
+        fragmentos = [self.fragmento_peer(peers[peer_id]) for peer_id in escolhidos]
+        if numwant is not None and len(escolhidos) < numwant:
+            demais = {peer_id: fragmento for peer_id, fragmento in self._lista_completa() if peer_id != exceto}
+            if len(demais) > numwant:
+                for peer_id in escolhidos:
+                    demais.pop(peer_id, None)
+                fragmentos.extend(demais[peer_id] for peer_id in self.amostrar(list(demais), exceto, numwant - len(escolhidos)))
+        return "[" + ", ".join(fragmentos) + "]"
+
+    def status_json(self) -> str:
+        """
+        JSON do /status: refeito quando a versão do enxame mudou e o anterior tem mais
+        de intervalo_status_s. Se outra thread já está refazendo, devolve o anterior.
+        """
+        versao = self.registro_mudancas.versao
+        status = self._status
+        if status is not None and (status[0] == versao or time.monotonic() - status[1] < self.intervalo_status_s):
+            return status[2]
+        if not self._status_lock.acquire(blocking=status is None):
+            return status[2]
+        try:
+            status = (versao, time.monotonic(), json.dumps(self.distribuidor.obter_estatisticas_blocos()))
+            self._status = status
+        finally:
+            self._status_lock.release()
+        return status[2]
@@ -0,0 +1,58 @@
+import logging
+import os
+import threading
+import time
+
+# Logger de todos os módulos do tracker. As mensagens usam argumentos no estilo '%s'
+# e campos 'chave=valor': com o nível desligado, a chamada retorna sem formatar nada
+logger = logging.getLogger("minibit.tracker")
+
+# Nível usado se a linha de comando não disser outro
+NIVEL_PADRAO = os.environ.get("MINIBIT_LOG_TRACKER", "INFO").upper()
+
+
+class FiltroTaxa(logging.Filter):
+    """
+    Limita cada tipo de mensagem (mesmo texto-modelo) a 'maximo' registros por
+    'intervalo_s' segundos. As suprimidas são contadas e informadas no próximo
+    registro daquele tipo que passar. WARNING e acima nunca são suprimidos.
+    """
+    def __init__(self, maximo: int = 20, intervalo_s: float = 1.0):
+        super().__init__()
+        self.maximo = maximo
+        self.intervalo_s = intervalo_s
+        # texto-modelo -> [início da janela, registros na janela, suprimidos]
+        self._janelas: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        agora = time.monotonic()
+        with self._lock:
+            janela = self._janelas.get(record.msg)
+            if janela is None or agora - janela[0] >= self.intervalo_s:
+                suprimidos = janela[2] if janela is not None else 0
+                self._janelas[record.msg] = [agora, 1, 0]
+            elif janela[1] < self.maximo:
+                janela[1] += 1
+                suprimidos = 0
+            else:
+                janela[2] += 1
+                return False
+        if suprimidos:
+            record.msg = f"{record.msg} (+{suprimidos} suprimidas)"
+        return True
+
+
+def configurar_log(nivel: str = NIVEL_PADRAO, maximo_por_segundo: int = 20):
+    """
+    Manda os logs do tracker para o stderr no nível dado ('DEBUG', 'INFO', 'WARNING'...).
+    Em WARNING (modo silencioso de produção) os eventos por requisição nem são formatados.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    handler.addFilter(FiltroTaxa(maximo=maximo_por_segundo))
+    logger.handlers[:] = [handler]
+    logger.setLevel(nivel.upper())
+    logger.propagate = False
@@ -0,0 +1,36 @@
+from src.common.metrics import RegistroMetricas
+
+
+class MetricasTracker:
+    """
+    Métricas do tracker no formato do Prometheus (rota /metrics): latência e volume
+    de cada rota, resultado dos anúncios, peers ativos e a distribuição da
+    disponibilidade dos blocos no enxame (o histograma mantido pelo DistribuidorBlocos,
+    lido na coleta; uma série só, não uma por bloco).
+    """
+    def __init__(self, gerenciador_peers, distribuidor, registro_mudancas):
+        self.registro = RegistroMetricas()
+
+        self.requisicoes = self.registro.histograma(
+            "minibit_tracker_requisicao_segundos", "Tempo de atendimento de cada rota do tracker.", ("rota",)
+        )
+        self.anuncios = self.registro.contador(
+            "minibit_tracker_anuncios_total",
+            "Anúncios recebidos em /anunciar, por resultado (aplicado, repetido, peer_desconhecido, fora_de_sequencia).",
+            ("resultado",)
+        )
+        self.registro.medidor(
+            "minibit_tracker_peers", "Peers ativos.", gerenciador_peers.total_peers
+        )
+        self.registro.medidor(
+            "minibit_tracker_versao_enxame", "Versão atual do enxame (cresce a cada mudança).",
+            lambda: registro_mudancas.versao
+        )
+        self.registro.histograma_lido(
+            "minibit_tracker_disponibilidade_blocos", "Distribuição de quantos peers ativos têm cada bloco.",
+            distribuidor.obter_disponibilidade
+        )
+        self.registro.medidor(
+            "minibit_tracker_disponibilidade_minima", "Peers com o bloco mais raro (0 = algum bloco sumiu do enxame).",
+            lambda: min(distribuidor.obter_disponibilidade(), default=0)
+        )
@@ -1,12 +1,191 @@
-from flask import Flask, request, jsonify
+import json
+import os
+import threading
+import time
+
+from flask import Flask, Response, g, request, jsonify
+from src.common.bitfield import Bitfield
+from src.common.manifest import Manifesto
+from src.common.metrics import TIPO_CONTEUDO
+from src.common.synthetic_file import gerar_conteudo_bloco
 from tracker.block_distributor import DistribuidorBlocos
+from tracker.change_log import RegistroMudancas
 from tracker.peer_manager import GerenciadorPeers
+from tracker.persistence import PersistenciaTracker
+from tracker.striped_locks import TravasListradas
+from tracker.swarm_view import VisaoEnxame
+from tracker.tracker_log import logger
+from tracker.tracker_metrics import MetricasTracker
 
 app = Flask(__name__)
 
 # Instâncias dos gerenciadores
 distribuidor = DistribuidorBlocos(total_blocos=20)
 gerenciador_peers = GerenciadorPeers()
+# Versão do enxame: permite responder /listar_peers só com o que mudou
+# Começa numa versão derivada do relógio: versões de uma execução anterior ficam
+# sempre abaixo dela e recebem a lista completa, em vez de um delta errado
+registro_mudancas = RegistroMudancas(versao_inicial=time.time_ns() // 1000)
+# Respostas serializadas em cache por versão (lista de peers e /status)
+visao = VisaoEnxame(gerenciador_peers, distribuidor, registro_mudancas)
+
+# Métricas no formato do Prometheus, expostas em /metrics
+metricas = MetricasTracker(gerenciador_peers, distribuidor, registro_mudancas)
+
+# Os handlers rodam em várias threads (servidor de desenvolvimento ou waitress).
+# Tudo que altera um peer roda com a trava dele; peers diferentes não se bloqueiam
+travas_peers = TravasListradas()
+
+# Peers sem contato por mais que isso são removidos por uma thread de fundo
+TIMEOUT_INATIVIDADE_S = 60
+INTERVALO_COLETA_S = 1
+
+# Snapshot + diário do estado em disco, criado em iniciar() só se MINIBIT_ESTADO_TRACKER
+# indicar o caminho base dos arquivos (sem ela, o estado fica só em memória)
+INTERVALO_COMPACTACAO_S = 5
+persistencia: PersistenciaTracker | None = None
+_iniciado = False
+
+# Quantos peers uma resposta traz, se o peer não pedir outro número ('numwant'), e o máximo aceito
+NUMWANT_PADRAO = 50
+NUMWANT_MAXIMO = 200
+
+# Tamanho dos blocos do arquivo fictício (o mesmo PeerNode.BLOCK_SIZE_BYTES)
+TAMANHO_BLOCO = 16384
+# Hash de cada bloco, para os peers verificarem o que recebem
+manifesto = Manifesto.sintetico(distribuidor.total_blocos, TAMANHO_BLOCO, gerar_conteudo_bloco)
+
+
+class RequisicaoInvalida(ValueError):
+    """Campo da requisição com formato inválido: o cliente recebe 400, não 500."""
+
+
+@app.errorhandler(RequisicaoInvalida)
+def _responder_requisicao_invalida(erro):
+    return jsonify({"message": str(erro)}), 400
+
+
+def _ler_blocos(data: dict) -> Bitfield:
+    """Lê os blocos enviados pelo peer: Bitfield em base64 ('bitfield') ou lista de ids ('blocks')."""
+    try:
+        if data.get('bitfield') is not None:
+            return Bitfield.from_base64(data['bitfield'], distribuidor.total_blocos)
+        return Bitfield(distribuidor.total_blocos, data.get('blocks', []))
+    except (ValueError, TypeError) as e: # binascii.Error (base64 inválido) é um ValueError
+        raise RequisicaoInvalida(f"Blocos inválidos: {e}") from e
+
+
+def _resposta_com_peers(campos: dict, peers_json: str) -> Response:
+    """Resposta JSON com os campos dados mais 'peers', um array já serializado pela VisaoEnxame."""
+    membros = [f"{json.dumps(chave)}: {json.dumps(valor)}" for chave, valor in campos.items()]
+    membros.append(f'"peers": {peers_json}')
+    return Response("{" + ", ".join(membros) + "}", mimetype="application/json")
+
+
+def _ler_seq(valor) -> int:
+    """Número de sequência de um anúncio: inteiro não negativo (0 se ausente)."""
+    try:
+        seq = int(valor) if valor is not None else 0
+    except (TypeError, ValueError) as e:
+        raise RequisicaoInvalida(f"'seq' inválido: {valor!r}") from e
+    if seq < 0:
+        raise RequisicaoInvalida(f"'seq' inválido: {valor!r}")
+    return seq
+
+
+def _ler_numwant(valor) -> int:
+    """Número de peers pedido pelo cliente, limitado a [0, NUMWANT_MAXIMO]."""
+    try:
+        numwant = int(valor) if valor is not None else NUMWANT_PADRAO
+    except (TypeError, ValueError):
+        numwant = NUMWANT_PADRAO
+    return max(0, min(numwant, NUMWANT_MAXIMO))
+
+
+def _remover_peer(peer_id: str):
+    """Tira o peer do tracker (ativos, distribuição e versão do enxame). Chamar com a trava do peer."""
+    gerenciador_peers.remover_peer(peer_id)
+    distribuidor.remover_peer(peer_id)
+    registro_mudancas.marcar_removido(peer_id)
+    if persistencia is not None:
+        persistencia.registrar_remocao(peer_id)
+
+
+def _remover_peers_inativos():
+    """Remove os peers vencidos no topo do heap de expiração."""
+    for peer_id in gerenciador_peers.peers_expirados(timeout=TIMEOUT_INATIVIDADE_S):
+        with travas_peers.trava(peer_id):
+            # Pode ter feito contato entre sair do heap e pegarmos a trava
+            if gerenciador_peers.esta_inativo(peer_id, TIMEOUT_INATIVIDADE_S):
+                _remover_peer(peer_id)
+                logger.info("Peer inativo removido peer_id=%s", peer_id)
+
+
+def _coletar_peers_inativos():
+    """Thread de fundo: remove periodicamente os peers inativos."""
+    while True:
+        time.sleep(INTERVALO_COLETA_S)
+        _remover_peers_inativos()
+
+
+def _estado_para_snapshot() -> list:
+    """[[peer_id, ip, porta, seq, bitfield_base64], ...] de todos os peers ativos."""
+    return [
+        [peer["peer_id"], peer["ip"], peer["porta"],
+         distribuidor.seq_anuncio_por_peer.get(peer["peer_id"], 0),
+         distribuidor.obter_bitfield_peer(peer["peer_id"]).to_base64()]
+        for peer in gerenciador_peers.listar_peers_ativos()
+    ]
+
+
+def _restaurar_estado():
+    """Recarrega os peers e inventários salvos; os anúncios continuam de onde pararam."""
+    inicio = time.perf_counter()
+    peers = persistencia.carregar()
+    gerenciador_peers.restaurar_peers((peer_id, ip, porta) for peer_id, (ip, porta, _, _) in peers.items())
+    distribuidor.restaurar_peers({peer_id: (blocos, seq) for peer_id, (_, _, seq, blocos) in peers.items()})
+    logger.info("Estado do tracker restaurado peers=%d duracao_s=%.2f", len(peers), time.perf_counter() - inicio)
+
+
+def _compactar_periodicamente():
+    """Thread de fundo: reescreve o snapshot quando o diário cresce demais."""
+    while True:
+        time.sleep(INTERVALO_COMPACTACAO_S)
+        if persistencia.precisa_compactar():
+            persistencia.compactar(_estado_para_snapshot)
+
+
+def iniciar(caminho_estado: str | None = None):
+    """
+    Restaura o estado salvo e sobe as threads de fundo (coleta de inativos e compactação).
+    Chamado uma vez pelo processo que serve o app (start_tracker.py, serve_tracker.py):
+    importar este módulo não lê nem escreve nada em disco. 'caminho_estado' (padrão:
+    MINIBIT_ESTADO_TRACKER) é o caminho base do snapshot e do diário; vazio, sem persistência.
+    """
+    global persistencia, _iniciado
+    if _iniciado:
+        return
+    _iniciado = True
+    if caminho_estado is None:
+        caminho_estado = os.environ.get("MINIBIT_ESTADO_TRACKER", "")
+    if caminho_estado:
+        persistencia = PersistenciaTracker(caminho_estado, distribuidor.total_blocos)
+        _restaurar_estado()
+        # O diário reaplicado vira parte de um snapshot novo, e o próximo reinício lê um arquivo só
+        threading.Thread(target=persistencia.compactar, args=(_estado_para_snapshot,), daemon=True).start()
+        threading.Thread(target=_compactar_periodicamente, daemon=True, name="compactador-estado").start()
+    threading.Thread(target=_coletar_peers_inativos, daemon=True, name="coletor-inativos").start()
+
+
+@app.before_request
+def _marcar_inicio():
+    g.inicio = time.perf_counter()
+
+
+@app.after_request
+def _medir_requisicao(resposta):
+    metricas.requisicoes.observar(time.perf_counter() - g.inicio, rota=request.endpoint or "desconhecida")
+    return resposta
 
 
 @app.route('/registrar_peer', methods=['POST'])
@@ -15,82 +194,147 @@ def registrar_peer():
     peer_id = data.get('peer_id')
     ip = data.get('ip')
     porta = data.get('porta')
-    blocos_do_peer = data.get('blocks', [])
-
-    if gerenciador_peers.obter_peer(peer_id) is None:
-        print(f"Novo peer registrado: {peer_id} em {ip}:{porta}")
-        gerenciador_peers.adicionar_peer(peer_id, ip, porta)
-        blocos_iniciais = distribuidor.distribuir_blocos_iniciais(peer_id)
-        distribuidor.atualizar_blocos_peer(peer_id, list(set(blocos_iniciais) | set(blocos_do_peer)))
-    else:
-        gerenciador_peers.adicionar_peer(peer_id, ip, porta)
-        distribuidor.atualizar_blocos_peer(peer_id, blocos_do_peer)
-        blocos_iniciais = []
-
-    peers_para_retornar = []
-    for peer in gerenciador_peers.listar_peers_ativos():
-        blocos_do_p = distribuidor.obter_blocos_peer(peer["peer_id"])
-        peers_para_retornar.append({
-            "peer_id": peer["peer_id"],
-            "ip": peer["ip"],
-            "porta": peer["porta"],
-            "blocks": blocos_do_p
-        })
-
-    return jsonify({
+    blocos_do_peer = _ler_blocos(data)
+
+    with travas_peers.trava(peer_id):
+        if gerenciador_peers.obter_peer(peer_id) is None:
+            logger.info("Novo peer registrado peer_id=%s ip=%s porta=%s", peer_id, ip, porta)
+            gerenciador_peers.adicionar_peer(peer_id, ip, porta)
+            if blocos_do_peer:
+                # Peer retomando um download: já traz os próprios blocos, não recebe iniciais
+                blocos_iniciais = Bitfield(distribuidor.total_blocos)
+            else:
+                blocos_iniciais = distribuidor.distribuir_blocos_iniciais(peer_id)
+            distribuidor.atualizar_blocos_peer(peer_id, blocos_iniciais | blocos_do_peer)
+        else:
+            gerenciador_peers.adicionar_peer(peer_id, ip, porta)
+            distribuidor.atualizar_blocos_peer(peer_id, blocos_do_peer)
+            blocos_iniciais = Bitfield(distribuidor.total_blocos)
+        # Os anúncios seguintes (/anunciar) partem deste inventário completo
+        distribuidor.reiniciar_anuncios(peer_id)
+        registro_mudancas.marcar_alterado(peer_id)
+        if persistencia is not None:
+            persistencia.registrar_peer(peer_id, ip, porta, distribuidor.obter_bitfield_peer(peer_id).to_base64())
+
+    # A versão é lida antes da lista: o que mudar no meio vem de novo no próximo 'desde'
+    versao = registro_mudancas.versao
+    peers_json, amostra = visao.peers_json(exceto=peer_id, numwant=_ler_numwant(data.get('numwant')))
+    return _resposta_com_peers({
         "message": "Peer registrado com sucesso!",
-        "peers": peers_para_retornar,
-        "blocos_iniciais": blocos_iniciais
-    })
+        "total_blocos": distribuidor.total_blocos,
+        "versao": versao,
+        "amostra": amostra,
+        "bitfield_inicial": blocos_iniciais.to_base64()
+    }, peers_json)
+
+
+@app.route('/anunciar', methods=['POST'])
+def anunciar():
+    """Recebe só os blocos novos de um peer ('blocks' ou 'bitfield'), numerados por 'seq'."""
+    data = request.get_json()
+    peer_id = data.get('peer_id')
+    novos_blocos = _ler_blocos(data)
+    seq = _ler_seq(data.get('seq'))
+    with travas_peers.trava(peer_id):
+        if gerenciador_peers.obter_peer(peer_id) is None:
+            metricas.anuncios.incrementar(resultado="peer_desconhecido")
+            return jsonify({"message": "Peer não registrado. Envie o inventário completo em /registrar_peer."}), 404
+
+        seq_anterior = distribuidor.seq_anuncio_por_peer.get(peer_id, 0)
+        if not distribuidor.aplicar_anuncio(peer_id, seq, novos_blocos):
+            metricas.anuncios.incrementar(resultado="fora_de_sequencia")
+            return jsonify({"message": "Anúncio fora de sequência. Envie o inventário completo em /registrar_peer."}), 409
+
+        gerenciador_peers.atualizar_timestamp(peer_id)
+        registro_mudancas.marcar_alterado(peer_id)
+        seq_aplicado = distribuidor.seq_anuncio_por_peer[peer_id]
+        metricas.anuncios.incrementar(resultado="aplicado" if seq > seq_anterior else "repetido")
+        if persistencia is not None and seq_aplicado == seq:
+            persistencia.registrar_anuncio(peer_id, seq, novos_blocos.to_base64())
+    logger.debug("Anúncio aplicado peer_id=%s seq=%d", peer_id, seq_aplicado)
+    return jsonify({"message": "Anúncio aplicado.", "seq": seq_aplicado})
 
 
 @app.route('/listar_peers')
 def listar_peers():
+    """
+    Lista os peers (exceto o solicitante). Com '?desde=<versao>', responde só com os
+    peers que entraram ou mudaram ('peers') e os que saíram ('removidos') depois
+    dessa versão; se ela for antiga demais, a resposta é completa ('completo': true).
+    Com '?numwant=<n>' (padrão NUMWANT_PADRAO) vêm no máximo n peers, de preferência
+    os que têm blocos que faltam ao solicitante; 'amostra': true indica que havia mais.
+    Um solicitante que o tracker não conhece (removido por inatividade, tracker
+    reiniciado) recebe 404 e deve se registrar de novo em /registrar_peer.
+    """
     data = request.get_json(silent=True)
     peer_id_solicitante = request.args.get('peer_id')
-    # Remove peers inativos com mais de 60s de inatividade
-    gerenciador_peers.limpar_peers_inativos(timeout=60)
+    desde = request.args.get('desde', type=int)
+    numwant = _ler_numwant(request.args.get('numwant'))
 
-    if data and 'blocks' in data and peer_id_solicitante:
-        distribuidor.atualizar_blocos_peer(peer_id_solicitante, data['blocks'])
+    if peer_id_solicitante:
+        with travas_peers.trava(peer_id_solicitante):
+            if gerenciador_peers.obter_peer(peer_id_solicitante) is None:
+                return jsonify({"message": "Peer não registrado. Envie o inventário completo em /registrar_peer."}), 404
+            if data and ('bitfield' in data or 'blocks' in data):
+                distribuidor.atualizar_blocos_peer(peer_id_solicitante, _ler_blocos(data))
+                registro_mudancas.marcar_alterado(peer_id_solicitante)
+                if persistencia is not None:
+                    persistencia.trocar_blocos(
+                        peer_id_solicitante, distribuidor.obter_bitfield_peer(peer_id_solicitante).to_base64()
+                    )
+            # Os peers não se registram mais a cada download: a consulta periódica os mantém ativos
+            gerenciador_peers.atualizar_timestamp(peer_id_solicitante)
 
-    # 🔄 Agora retorna todos os peers (exceto o solicitante)
-    peers_disponiveis = [
-        peer for peer in gerenciador_peers.listar_peers_ativos()
-        if peer["peer_id"] != peer_id_solicitante
-    ]
+    versao = registro_mudancas.versao
+    mudancas = registro_mudancas.mudancas_desde(desde) if desde is not None else None
 
-    resposta = []
-    for peer in peers_disponiveis:
-        blocos_do_p = distribuidor.obter_blocos_peer(peer["peer_id"])
-        resposta.append({
-            "peer_id": peer["peer_id"],
-            "ip": peer["ip"],
-            "porta": peer["porta"],
-            "blocks": blocos_do_p
-        })
+    if mudancas is None:
+        # 🔄 Retorna os peers (exceto o solicitante), até numwant deles
+        peers_json, amostra = visao.peers_json(exceto=peer_id_solicitante, numwant=numwant)
+        return _resposta_com_peers(
+            {"total_blocos": distribuidor.total_blocos, "versao": versao, "completo": True, "amostra": amostra},
+            peers_json
+        )
 
-    return jsonify({"peers": resposta})
+    alterados, removidos = mudancas
+    return _resposta_com_peers({
+        "total_blocos": distribuidor.total_blocos,
+        "versao": versao,
+        "completo": False,
+        "removidos": removidos
+    }, visao.peers_alterados_json(alterados, exceto=peer_id_solicitante, numwant=numwant))
 
 
 @app.route('/remover_peer', methods=['POST'])
 def remover_peer():
     data = request.get_json()
     peer_id = data.get('peer_id')
-    if gerenciador_peers.obter_peer(peer_id):
-        gerenciador_peers.remover_peer(peer_id)
-        distribuidor.remover_peer(peer_id)
-        print(f"Peer {peer_id} removido do tracker.")
-        return jsonify({"message": "Peer removido com sucesso!"}), 200
+    with travas_peers.trava(peer_id):
+        if gerenciador_peers.obter_peer(peer_id):
+            _remover_peer(peer_id)
+            logger.info("Peer removido do tracker peer_id=%s", peer_id)
+            return jsonify({"message": "Peer removido com sucesso!"}), 200
     return jsonify({"message": "Peer não encontrado."}), 404
 
 
+@app.route('/manifesto')
+def obter_manifesto():
+    return jsonify(manifesto.to_dict())
+
+
 @app.route('/status')
 def status():
-    return jsonify(distribuidor.obter_estatisticas_blocos())
+    return Response(visao.status_json(), mimetype="application/json")
+
+
+@app.route('/metrics')
+def exportar_metricas():
+    return Response(metricas.registro.exportar(), content_type=TIPO_CONTEUDO)
 
 
 if __name__ == '__main__':
+    from tracker.tracker_log import configurar_log
+    configurar_log()
     print("\n==================================================")
     print("           MINIBIT TRACKER")
     print("==================================================")
@@ -101,12 +345,19 @@ if __name__ == '__main__':
     print("- Host: 0.0.0.0 (todas as interfaces)")
     print("\nEndpoints disponíveis:")
     print("- POST /registrar_peer     - Registra novo peer")
+    print("- POST /anunciar           - Anuncia blocos novos de um peer")
     print("- GET  /listar_peers       - Lista peers disponíveis")
     print("- GET  /status             - Status do tracker")
+    print("- GET  /manifesto          - Hashes dos blocos do arquivo")
     print("- POST /remover_peer       - Remove peer")
+    print("- GET  /metrics            - Métricas (formato Prometheus)")
+    print("\nModo de produção (waitress, várias threads): python src/tracker/serve_tracker.py")
     print("\nPara testar o tracker:")
     print("curl http://localhost:5000/status")
     print("\nPressione Ctrl+C para parar o servidor")
     print("==================================================")
 
+    # Com debug o app roda num processo filho do reloader: só ele restaura o estado e sobe as threads
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        iniciar()
     app.run(host='0.0.0.0', port=5000, debug=True)